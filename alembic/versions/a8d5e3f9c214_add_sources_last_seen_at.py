@@ -0,0 +1,53 @@
+"""add sources.last_seen_at
+
+Revision ID: a8d5e3f9c214
+Revises: f1c3a8e52d47
+Create Date: 2026-10-19 22:48:03.917265
+
+last_seen_at is filled from the newest metric of each source once here;
+the app keeps it current from then on.
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8d5e3f9c214'
+down_revision: Union[str, None] = 'f1c3a8e52d47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PARTITION_NAME = re.compile(r"^metrics_p\d{8}$")
+
+
+def upgrade() -> None:
+    op.add_column('sources', sa.Column('last_seen_at', sa.DateTime(), nullable=True))
+
+    conn = op.get_bind()
+    if conn.dialect.name == 'postgresql':
+        tables = ['metrics']
+    else:
+        # SQLite partitions are standalone tables
+        tables = [name for name in sa.inspect(conn).get_table_names() if PARTITION_NAME.match(name)]
+    last_seen = {}
+    for table in tables:
+        rows = conn.execute(sa.text(
+            f"SELECT source_key, MAX(recorded_at) FROM {table} GROUP BY source_key"
+        ).columns(sa.column('source_key', sa.Integer), sa.column('recorded_at', sa.DateTime)))
+        for source_key, recorded_at in rows:
+            if source_key not in last_seen or recorded_at > last_seen[source_key]:
+                last_seen[source_key] = recorded_at
+    if last_seen:
+        sources = sa.table('sources', sa.column('key', sa.Integer), sa.column('last_seen_at', sa.DateTime))
+        conn.execute(
+            sources.update().where(sources.c.key == sa.bindparam('source_key')).values(last_seen_at=sa.bindparam('seen')),
+            [{'source_key': key, 'seen': seen} for key, seen in last_seen.items()]
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('sources') as batch_op:
+        batch_op.drop_column('last_seen_at')
@@ -0,0 +1,171 @@
+"""partition metrics by time
+
+Revision ID: b3d91f4c7a52
+Revises: 7c1e5a9d2b40
+Create Date: 2026-10-19 14:03:27.518842
+
+PostgreSQL: metrics becomes a table partitioned by range of recorded_at.
+SQLite: existing rows move into one table per period and metrics is kept,
+empty, as their template. Either way partitions are created for every
+period holding data plus PARTITION_PRECREATE periods ahead; the app's
+maintenance task keeps creating them ahead from then on.
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Sequence, Set, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from web_app.config import get_settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3d91f4c7a52'
+down_revision: Union[str, None] = '7c1e5a9d2b40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+settings = get_settings()
+PERIOD_DAYS = 7 if settings.PARTITION_INTERVAL == "week" else 1
+COLUMNS = "id, metric_type_id, source_id, value, recorded_at"
+
+
+def period_start(day: date) -> date:
+    if PERIOD_DAYS == 7:
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def bounds(start: date):
+    lower = datetime(start.year, start.month, start.day)
+    return lower, lower + timedelta(days=PERIOD_DAYS)
+
+
+def partition_starts(conn) -> Set[date]:
+    """Periods holding existing metrics, plus the current one and those ahead of it."""
+    conn.execute(sa.text("UPDATE metrics SET recorded_at = CURRENT_TIMESTAMP WHERE recorded_at IS NULL"))
+    day_of = "CAST(recorded_at AS DATE)" if conn.dialect.name == 'postgresql' else "date(recorded_at)"
+    days = conn.execute(sa.text(f"SELECT DISTINCT {day_of} FROM metrics")).scalars().all()
+    starts = {period_start(day if isinstance(day, date) else date.fromisoformat(str(day)[:10])) for day in days}
+    current = period_start(datetime.now(timezone.utc).date())
+    for i in range(settings.PARTITION_PRECREATE + 1):
+        starts.add(current + timedelta(days=i * PERIOD_DAYS))
+    return starts
+
+
+def partition_columns():
+    return [
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('metric_type_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('source_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('value', sa.Float(), nullable=False),
+        sa.Column('recorded_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id', 'recorded_at'),
+    ]
+
+
+def upgrade_postgresql(conn):
+    starts = partition_starts(conn)
+    op.drop_constraint('metric_metadata_metric_id_fkey', 'metric_metadata', type_='foreignkey')
+    op.create_index('ix_metric_metadata_metric_id', 'metric_metadata', ['metric_id'])
+
+    # Free the index and constraint names for the partitioned table
+    op.rename_table('metrics', 'metrics_unpartitioned')
+    op.drop_index('ix_metrics_id', table_name='metrics_unpartitioned')
+    op.drop_index('ix_metrics_recorded_at', table_name='metrics_unpartitioned')
+    op.execute("ALTER TABLE metrics_unpartitioned RENAME CONSTRAINT metrics_pkey TO metrics_unpartitioned_pkey")
+
+    op.create_table(
+        'metrics',
+        *partition_columns(),
+        sa.ForeignKeyConstraint(['metric_type_id'], ['metric_types.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['source_id'], ['sources.id']),
+        postgresql_partition_by='RANGE (recorded_at)'
+    )
+    op.create_index('ix_metrics_id', 'metrics', ['id'])
+    op.create_index('ix_metrics_recorded_at', 'metrics', ['recorded_at'])
+    op.create_index('ix_metrics_type_recorded_at', 'metrics', ['metric_type_id', 'recorded_at'])
+
+    for start in sorted(starts):
+        lower, upper = bounds(start)
+        op.execute(
+            f"CREATE TABLE metrics_p{start:%Y%m%d} PARTITION OF metrics "
+            f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+        )
+    op.execute(f"INSERT INTO metrics ({COLUMNS}) SELECT {COLUMNS} FROM metrics_unpartitioned")
+    op.drop_table('metrics_unpartitioned')
+
+
+def upgrade_sqlite(conn):
+    starts = partition_starts(conn)
+    for start in sorted(starts):
+        name = f"metrics_p{start:%Y%m%d}"
+        lower, upper = bounds(start)
+        op.create_table(name, *partition_columns())
+        op.create_index(f'ix_{name}_recorded_at', name, ['recorded_at'])
+        op.create_index(f'ix_{name}_type_recorded_at', name, ['metric_type_id', 'recorded_at'])
+        conn.execute(
+            sa.text(
+                f"INSERT INTO {name} ({COLUMNS}) SELECT {COLUMNS} FROM metrics "
+                "WHERE recorded_at >= :lower AND recorded_at < :upper"
+            ).bindparams(
+                sa.bindparam('lower', lower, type_=sa.DateTime()),
+                sa.bindparam('upper', upper, type_=sa.DateTime())
+            )
+        )
+    op.execute("DELETE FROM metrics")
+    # Databases created by the app's create_all already have it
+    if 'ix_metrics_type_recorded_at' not in {index['name'] for index in sa.inspect(conn).get_indexes('metrics')}:
+        op.create_index('ix_metrics_type_recorded_at', 'metrics', ['metric_type_id', 'recorded_at'])
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if 'metrics' not in sa.inspect(conn).get_table_names():
+        return
+    if conn.dialect.name == 'postgresql':
+        upgrade_postgresql(conn)
+    else:
+        upgrade_sqlite(conn)
+
+
+def partition_names(conn):
+    return sorted(
+        name for name in sa.inspect(conn).get_table_names()
+        if name.startswith('metrics_p') and name[len('metrics_p'):].isdigit()
+    )
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == 'postgresql':
+        op.create_table(
+            'metrics_unpartitioned',
+            sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column('metric_type_id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column('source_id', postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column('value', sa.Float(), nullable=False),
+            sa.Column('recorded_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['metric_type_id'], ['metric_types.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['source_id'], ['sources.id']),
+            sa.PrimaryKeyConstraint('id', name='metrics_unpartitioned_pkey')
+        )
+        op.execute(f"INSERT INTO metrics_unpartitioned ({COLUMNS}) SELECT {COLUMNS} FROM metrics")
+        # Dropping the partitioned table drops its partitions
+        op.drop_table('metrics')
+        op.rename_table('metrics_unpartitioned', 'metrics')
+        op.execute("ALTER TABLE metrics RENAME CONSTRAINT metrics_unpartitioned_pkey TO metrics_pkey")
+        op.create_index('ix_metrics_id', 'metrics', ['id'])
+        op.create_index('ix_metrics_recorded_at', 'metrics', ['recorded_at'])
+        op.drop_index('ix_metric_metadata_metric_id', table_name='metric_metadata')
+        op.create_foreign_key(
+            'metric_metadata_metric_id_fkey', 'metric_metadata', 'metrics',
+            ['metric_id'], ['id'], ondelete='CASCADE'
+        )
+        return
+
+    for name in partition_names(conn):
+        op.execute(f"INSERT INTO metrics ({COLUMNS}) SELECT {COLUMNS} FROM {name}")
+        op.drop_table(name)
+    op.drop_index('ix_metrics_type_recorded_at', table_name='metrics')
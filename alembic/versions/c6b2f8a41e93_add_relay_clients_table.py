@@ -0,0 +1,42 @@
+"""add relay_clients table
+
+Revision ID: c6b2f8a41e93
+Revises: a8d5e3f9c214
+Create Date: 2026-10-19 23:41:27.305118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6b2f8a41e93'
+down_revision: Union[str, None] = 'a8d5e3f9c214'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('relay_clients',
+    sa.Column('client_id', sa.String(length=255), nullable=False),
+    sa.Column('source_key', sa.Integer(), nullable=True),
+    sa.Column('client_type', sa.String(length=255), nullable=False),
+    sa.Column('hostname', sa.String(length=255), nullable=False),
+    sa.Column('ip_address', sa.String(length=45), nullable=True),
+    sa.Column('status', sa.String(length=50), nullable=False),
+    sa.Column('last_command_id', sa.String(length=255), nullable=True),
+    sa.Column('registered_at', sa.DateTime(), nullable=False),
+    sa.Column('last_seen_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['source_key'], ['sources.key'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('client_id')
+    )
+    op.create_index(op.f('ix_relay_clients_last_seen_at'), 'relay_clients', ['last_seen_at'], unique=False)
+    op.create_index(op.f('ix_relay_clients_source_key'), 'relay_clients', ['source_key'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_relay_clients_source_key'), table_name='relay_clients')
+    op.drop_index(op.f('ix_relay_clients_last_seen_at'), table_name='relay_clients')
+    op.drop_table('relay_clients')
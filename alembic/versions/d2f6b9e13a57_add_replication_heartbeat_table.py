@@ -0,0 +1,30 @@
+"""add replication_heartbeat table
+
+Revision ID: d2f6b9e13a57
+Revises: c6b2f8a41e93
+Create Date: 2026-10-19 09:12:44.518230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2f6b9e13a57'
+down_revision: Union[str, None] = 'c6b2f8a41e93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('replication_heartbeat',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('beat_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('replication_heartbeat')
@@ -0,0 +1,424 @@
+"""integer keys for metrics
+
+Revision ID: e4a7c2d91f08
+Revises: b3d91f4c7a52
+Create Date: 2026-10-19 16:41:09.203517
+
+metric_types and sources get an integer primary key, ``key``, and keep
+their UUID ``id`` as a unique public identifier. Metrics get an integer id
+and reference types and sources by key. Every partition is rebuilt in the
+new layout and metrics are renumbered.
+
+This changes every metric's public id. The API shows a UUID derived from
+the new integer id (web_app.models.metric_uuid), so the UUIDs issued
+before this migration are no longer returned. They are kept in
+metric_legacy_ids, which maps each old UUID to the new id; metric_metadata
+is carried over through it, and the downgrade restores the old UUIDs from
+it (metrics written after the upgrade get random ones).
+
+PostgreSQL numbers metrics from the metrics_id_seq sequence. On SQLite
+each partition numbers its rows from a range reserved for its period (see
+web_app.partitions.first_sqlite_id).
+"""
+from datetime import date, datetime, timedelta
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from web_app.config import get_settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a7c2d91f08'
+down_revision: Union[str, None] = 'b3d91f4c7a52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+settings = get_settings()
+PERIOD_DAYS = 7 if settings.PARTITION_INTERVAL == "week" else 1
+SQLITE_ID_BITS = 32
+
+UUID_COLUMNS = "id, metric_type_id, source_id, value, recorded_at"
+KEY_COLUMNS = "id, metric_type_key, source_key, value, recorded_at"
+
+
+def partition_names(conn):
+    return sorted(
+        name for name in sa.inspect(conn).get_table_names()
+        if name.startswith('metrics_p') and name[len('metrics_p'):].isdigit()
+    )
+
+
+def partition_start(name: str) -> date:
+    return datetime.strptime(name[len('metrics_p'):], '%Y%m%d').date()
+
+
+def bounds(start: date):
+    lower = datetime(start.year, start.month, start.day)
+    return lower, lower + timedelta(days=PERIOD_DAYS)
+
+
+def first_sqlite_id(start: date) -> int:
+    return (start - date(1970, 1, 1)).days << SQLITE_ID_BITS
+
+
+def uuid_metric_columns():
+    return [
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('metric_type_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('source_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('value', sa.Float(), nullable=False),
+        sa.Column('recorded_at', sa.DateTime(), nullable=False),
+    ]
+
+
+def key_metric_columns(id_type=sa.BigInteger()):
+    return [
+        sa.Column('id', id_type, nullable=False),
+        sa.Column('metric_type_key', sa.Integer(), nullable=False),
+        sa.Column('source_key', sa.Integer(), nullable=False),
+        sa.Column('value', sa.Float(), nullable=False),
+        sa.Column('recorded_at', sa.DateTime(), nullable=False),
+    ]
+
+
+def lookup_columns(table):
+    """The columns of metric_types or sources other than their keys."""
+    if table == 'metric_types':
+        return [
+            sa.Column('name', sa.String(length=255), nullable=False, unique=True),
+            sa.Column('description', sa.Text(), nullable=True),
+            sa.Column('unit_id', postgresql.UUID(as_uuid=True), sa.ForeignKey('units.id'), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('is_active', sa.Boolean(), nullable=True),
+        ]
+    return [
+        sa.Column('name', sa.String(length=255), nullable=False, unique=True),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('ip_address', sa.String(length=45), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+    ]
+
+
+def rebuild_sqlite_lookup(table, with_key):
+    """Recreate metric_types or sources with or without the integer key."""
+    columns = ['id'] + [column.name for column in lookup_columns(table)]
+    if with_key:
+        keys = [
+            sa.Column('key', sa.Integer(), nullable=False),
+            sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False, unique=True),
+            sa.PrimaryKeyConstraint('key'),
+        ]
+    else:
+        keys = [sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False), sa.PrimaryKeyConstraint('id')]
+    op.create_table(f'{table}_rebuilt', *keys, *lookup_columns(table))
+    # Keys are handed out in creation order
+    op.execute(
+        f"INSERT INTO {table}_rebuilt ({', '.join(columns)}) "
+        f"SELECT {', '.join(columns)} FROM {table} ORDER BY created_at, rowid"
+    )
+    op.drop_table(table)
+    op.rename_table(f'{table}_rebuilt', table)
+    if not with_key:
+        op.create_index(f'ix_{table}_id', table, ['id'])
+
+
+def upgrade_postgresql_lookups():
+    for table in ('metric_types', 'sources'):
+        op.execute(f"ALTER TABLE {table} ADD COLUMN key SERIAL")
+        op.execute(f"DROP INDEX IF EXISTS ix_{table}_id")
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT {table}_pkey")
+        op.create_primary_key(f'{table}_pkey', table, ['key'])
+        op.create_unique_constraint(f'{table}_id_key', table, ['id'])
+
+
+def downgrade_postgresql_lookups():
+    for table in ('metric_types', 'sources'):
+        op.drop_constraint(f'{table}_id_key', table, type_='unique')
+        op.drop_constraint(f'{table}_pkey', table, type_='primary')
+        op.drop_column(table, 'key')
+        op.create_primary_key(f'{table}_pkey', table, ['id'])
+        op.create_index(f'ix_{table}_id', table, ['id'])
+
+
+def upgrade_postgresql(conn):
+    names = partition_names(conn)
+    op.drop_constraint('metrics_metric_type_id_fkey', 'metrics', type_='foreignkey')
+    op.drop_constraint('metrics_source_id_fkey', 'metrics', type_='foreignkey')
+    upgrade_postgresql_lookups()
+
+    op.execute("CREATE SEQUENCE metrics_id_seq")
+    op.execute(
+        "CREATE TABLE metric_legacy_ids AS "
+        "SELECT id AS legacy_id, nextval('metrics_id_seq') AS metric_id FROM metrics ORDER BY recorded_at"
+    )
+    op.create_primary_key('metric_legacy_ids_pkey', 'metric_legacy_ids', ['legacy_id'])
+    op.create_index('ix_metric_legacy_ids_metric_id', 'metric_legacy_ids', ['metric_id'])
+
+    # Free the table, partition, index and constraint names for the new layout
+    op.drop_index('ix_metrics_id', table_name='metrics')
+    op.drop_index('ix_metrics_recorded_at', table_name='metrics')
+    op.drop_index('ix_metrics_type_recorded_at', table_name='metrics')
+    op.rename_table('metrics', 'metrics_uuid')
+    op.execute("ALTER TABLE metrics_uuid RENAME CONSTRAINT metrics_pkey TO metrics_uuid_pkey")
+    for name in names:
+        op.rename_table(name, f'{name}_uuid')
+
+    op.create_table(
+        'metrics',
+        *key_metric_columns(),
+        sa.PrimaryKeyConstraint('id', 'recorded_at'),
+        sa.ForeignKeyConstraint(['metric_type_key'], ['metric_types.key'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['source_key'], ['sources.key']),
+        postgresql_partition_by='RANGE (recorded_at)'
+    )
+    op.execute("ALTER TABLE metrics ALTER COLUMN id SET DEFAULT nextval('metrics_id_seq')")
+    op.create_index('ix_metrics_recorded_at', 'metrics', ['recorded_at'])
+    op.create_index('ix_metrics_type_recorded_at', 'metrics', ['metric_type_key', 'recorded_at'])
+    for name in names:
+        lower, upper = bounds(partition_start(name))
+        op.execute(f"CREATE TABLE {name} PARTITION OF metrics FOR VALUES FROM ('{lower}') TO ('{upper}')")
+
+    op.execute(
+        f"INSERT INTO metrics ({KEY_COLUMNS}) "
+        "SELECT map.metric_id, t.key, s.key, m.value, m.recorded_at FROM metrics_uuid m "
+        "JOIN metric_legacy_ids map ON map.legacy_id = m.id "
+        "JOIN metric_types t ON t.id = m.metric_type_id "
+        "JOIN sources s ON s.id = m.source_id"
+    )
+    # Dropping the partitioned table drops its partitions
+    op.drop_table('metrics_uuid')
+
+    op.add_column('metric_metadata', sa.Column('metric_key', sa.BigInteger(), nullable=True))
+    op.execute(
+        "UPDATE metric_metadata SET metric_key = map.metric_id FROM metric_legacy_ids map "
+        "WHERE map.legacy_id = metric_metadata.metric_id"
+    )
+    op.execute("DELETE FROM metric_metadata WHERE metric_key IS NULL")
+    # Also drops the index and unique constraint on it
+    op.drop_column('metric_metadata', 'metric_id')
+    op.alter_column('metric_metadata', 'metric_key', new_column_name='metric_id', nullable=False)
+    op.create_index('ix_metric_metadata_metric_id', 'metric_metadata', ['metric_id'])
+    op.create_unique_constraint('unique_metadata_key_per_metric', 'metric_metadata', ['metric_id', 'key'])
+    op.execute("ALTER SEQUENCE metrics_id_seq OWNED BY metrics.id")
+
+
+def create_sqlite_metrics(name, key_layout):
+    """Create a SQLite partition, or the metrics template, in either layout."""
+    if name == 'metrics':
+        if key_layout:
+            columns = key_metric_columns(sa.Integer()) + [
+                sa.PrimaryKeyConstraint('id', 'recorded_at'),
+                sa.ForeignKeyConstraint(['metric_type_key'], ['metric_types.key'], ondelete='CASCADE'),
+                sa.ForeignKeyConstraint(['source_key'], ['sources.key']),
+            ]
+        else:
+            columns = uuid_metric_columns() + [
+                sa.PrimaryKeyConstraint('id', 'recorded_at'),
+                sa.ForeignKeyConstraint(['metric_type_id'], ['metric_types.id'], ondelete='CASCADE'),
+                sa.ForeignKeyConstraint(['source_id'], ['sources.id']),
+            ]
+        op.create_table(name, *columns)
+        if not key_layout:
+            op.create_index('ix_metrics_id', name, ['id'])
+    elif key_layout:
+        op.create_table(name, *key_metric_columns(sa.Integer()), sa.PrimaryKeyConstraint('id'), sqlite_autoincrement=True)
+        op.execute(f"INSERT INTO sqlite_sequence (name, seq) VALUES ('{name}', {first_sqlite_id(partition_start(name))})")
+    else:
+        op.create_table(name, *uuid_metric_columns(), sa.PrimaryKeyConstraint('id', 'recorded_at'))
+    op.create_index(f'ix_{name}_recorded_at', name, ['recorded_at'])
+    op.create_index(
+        f'ix_{name}_type_recorded_at', name, ['metric_type_key' if key_layout else 'metric_type_id', 'recorded_at']
+    )
+
+
+def drop_sqlite_indexes(conn, name):
+    for index in sa.inspect(conn).get_indexes(name):
+        op.drop_index(index['name'], table_name=name)
+
+
+def upgrade_sqlite(conn):
+    names = partition_names(conn)
+    op.create_table(
+        'metric_legacy_ids',
+        sa.Column('legacy_id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('metric_id', sa.BigInteger(), nullable=False)
+    )
+    for name in names:
+        op.execute(
+            f"INSERT INTO metric_legacy_ids (legacy_id, metric_id) "
+            f"SELECT id, {first_sqlite_id(partition_start(name))} + ROW_NUMBER() OVER (ORDER BY recorded_at, id) "
+            f"FROM {name}"
+        )
+
+    for table in ('metric_types', 'sources'):
+        rebuild_sqlite_lookup(table, with_key=True)
+
+    for name in names:
+        drop_sqlite_indexes(conn, name)
+        op.rename_table(name, f'{name}_uuid')
+        create_sqlite_metrics(name, key_layout=True)
+        op.execute(
+            f"INSERT INTO {name} ({KEY_COLUMNS}) "
+            f"SELECT map.metric_id, t.key, s.key, m.value, m.recorded_at FROM {name}_uuid m "
+            "JOIN metric_legacy_ids map ON map.legacy_id = m.id "
+            "JOIN metric_types t ON t.id = m.metric_type_id "
+            "JOIN sources s ON s.id = m.source_id"
+        )
+        op.drop_table(f'{name}_uuid')
+    # The template is empty since metrics were partitioned
+    op.drop_table('metrics')
+    create_sqlite_metrics('metrics', key_layout=True)
+
+    rebuild_sqlite_metadata(
+        sa.Integer(),
+        "SELECT m.id, map.metric_id, m.key, m.value, m.created_at FROM metric_metadata m "
+        "JOIN metric_legacy_ids map ON map.legacy_id = m.metric_id"
+    )
+    op.create_index('ix_metric_legacy_ids_metric_id', 'metric_legacy_ids', ['metric_id'])
+
+
+def rebuild_sqlite_metadata(metric_id_type, select_rows):
+    op.create_table(
+        'metric_metadata_rebuilt',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('metric_id', metric_id_type, nullable=False),
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('value', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('metric_id', 'key', name='unique_metadata_key_per_metric')
+    )
+    op.execute(f"INSERT INTO metric_metadata_rebuilt (id, metric_id, key, value, created_at) {select_rows}")
+    op.drop_table('metric_metadata')
+    op.rename_table('metric_metadata_rebuilt', 'metric_metadata')
+    op.create_index('ix_metric_metadata_id', 'metric_metadata', ['id'])
+    op.create_index('ix_metric_metadata_metric_id', 'metric_metadata', ['metric_id'])
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if 'metrics' not in sa.inspect(conn).get_table_names():
+        return
+    if conn.dialect.name == 'postgresql':
+        upgrade_postgresql(conn)
+    else:
+        upgrade_sqlite(conn)
+
+
+def downgrade_postgresql(conn):
+    names = partition_names(conn)
+    # Metrics migrated by the upgrade get their old UUID back
+    op.execute(
+        "CREATE TABLE metric_id_map AS "
+        "SELECT m.id, COALESCE(legacy.legacy_id, gen_random_uuid()) AS legacy_id FROM metrics m "
+        "LEFT JOIN metric_legacy_ids legacy ON legacy.metric_id = m.id"
+    )
+    op.create_index('ix_metric_id_map_id', 'metric_id_map', ['id'], unique=True)
+
+    op.drop_index('ix_metrics_recorded_at', table_name='metrics')
+    op.drop_index('ix_metrics_type_recorded_at', table_name='metrics')
+    op.drop_constraint('metrics_metric_type_key_fkey', 'metrics', type_='foreignkey')
+    op.drop_constraint('metrics_source_key_fkey', 'metrics', type_='foreignkey')
+    op.rename_table('metrics', 'metrics_keyed')
+    op.execute("ALTER TABLE metrics_keyed RENAME CONSTRAINT metrics_pkey TO metrics_keyed_pkey")
+    for name in names:
+        op.rename_table(name, f'{name}_keyed')
+
+    op.create_table(
+        'metrics',
+        *uuid_metric_columns(),
+        sa.PrimaryKeyConstraint('id', 'recorded_at'),
+        postgresql_partition_by='RANGE (recorded_at)'
+    )
+    op.create_index('ix_metrics_id', 'metrics', ['id'])
+    op.create_index('ix_metrics_recorded_at', 'metrics', ['recorded_at'])
+    op.create_index('ix_metrics_type_recorded_at', 'metrics', ['metric_type_id', 'recorded_at'])
+    for name in names:
+        lower, upper = bounds(partition_start(name))
+        op.execute(f"CREATE TABLE {name} PARTITION OF metrics FOR VALUES FROM ('{lower}') TO ('{upper}')")
+
+    op.execute(
+        f"INSERT INTO metrics ({UUID_COLUMNS}) "
+        "SELECT map.legacy_id, t.id, s.id, m.value, m.recorded_at FROM metrics_keyed m "
+        "JOIN metric_id_map map ON map.id = m.id "
+        "JOIN metric_types t ON t.key = m.metric_type_key "
+        "JOIN sources s ON s.key = m.source_key"
+    )
+    op.drop_table('metrics_keyed')
+    op.execute("DROP SEQUENCE IF EXISTS metrics_id_seq")
+
+    op.add_column('metric_metadata', sa.Column('metric_uuid', postgresql.UUID(as_uuid=True), nullable=True))
+    op.execute(
+        "UPDATE metric_metadata SET metric_uuid = map.legacy_id FROM metric_id_map map "
+        "WHERE map.id = metric_metadata.metric_id"
+    )
+    op.execute("DELETE FROM metric_metadata WHERE metric_uuid IS NULL")
+    op.drop_column('metric_metadata', 'metric_id')
+    op.alter_column('metric_metadata', 'metric_uuid', new_column_name='metric_id', nullable=False)
+    op.create_index('ix_metric_metadata_metric_id', 'metric_metadata', ['metric_id'])
+    op.create_unique_constraint('unique_metadata_key_per_metric', 'metric_metadata', ['metric_id', 'key'])
+    op.drop_table('metric_id_map')
+    op.drop_table('metric_legacy_ids')
+
+    downgrade_postgresql_lookups()
+    op.create_foreign_key(
+        'metrics_metric_type_id_fkey', 'metrics', 'metric_types', ['metric_type_id'], ['id'], ondelete='CASCADE'
+    )
+    op.create_foreign_key('metrics_source_id_fkey', 'metrics', 'sources', ['source_id'], ['id'])
+
+
+def downgrade_sqlite(conn):
+    names = partition_names(conn)
+    op.create_table(
+        'metric_id_map',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('legacy_id', postgresql.UUID(as_uuid=True), nullable=False)
+    )
+    for name in names:
+        # Metrics migrated by the upgrade get their old UUID back
+        op.execute(
+            f"INSERT INTO metric_id_map (id, legacy_id) "
+            f"SELECT m.id, COALESCE(legacy.legacy_id, lower(hex(randomblob(16)))) FROM {name} m "
+            "LEFT JOIN metric_legacy_ids legacy ON legacy.metric_id = m.id"
+        )
+
+    for name in names:
+        drop_sqlite_indexes(conn, name)
+        op.rename_table(name, f'{name}_keyed')
+        create_sqlite_metrics(name, key_layout=False)
+        op.execute(
+            f"INSERT INTO {name} ({UUID_COLUMNS}) "
+            f"SELECT map.legacy_id, t.id, s.id, m.value, m.recorded_at FROM {name}_keyed m "
+            "JOIN metric_id_map map ON map.id = m.id "
+            "JOIN metric_types t ON t.key = m.metric_type_key "
+            "JOIN sources s ON s.key = m.source_key"
+        )
+        op.drop_table(f'{name}_keyed')
+        op.execute(f"DELETE FROM sqlite_sequence WHERE name = '{name}'")
+    op.drop_table('metrics')
+
+    rebuild_sqlite_metadata(
+        postgresql.UUID(as_uuid=True),
+        "SELECT m.id, map.legacy_id, m.key, m.value, m.created_at FROM metric_metadata m "
+        "JOIN metric_id_map map ON map.id = m.metric_id"
+    )
+    op.drop_table('metric_id_map')
+    op.drop_table('metric_legacy_ids')
+
+    for table in ('metric_types', 'sources'):
+        rebuild_sqlite_lookup(table, with_key=False)
+    create_sqlite_metrics('metrics', key_layout=False)
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if 'metrics' not in sa.inspect(conn).get_table_names():
+        return
+    if conn.dialect.name == 'postgresql':
+        downgrade_postgresql(conn)
+    else:
+        downgrade_sqlite(conn)
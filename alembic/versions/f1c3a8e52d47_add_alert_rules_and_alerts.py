@@ -0,0 +1,60 @@
+"""add alert_rules and alerts tables
+
+Revision ID: f1c3a8e52d47
+Revises: e4a7c2d91f08
+Create Date: 2026-10-19 21:36:10.482913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1c3a8e52d47'
+down_revision: Union[str, None] = 'e4a7c2d91f08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('alert_rules',
+    sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('metric_type_key', sa.Integer(), nullable=False),
+    sa.Column('source_key', sa.Integer(), nullable=True),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('operator', sa.String(length=2), nullable=True),
+    sa.Column('threshold', sa.Float(), nullable=True),
+    sa.Column('window_seconds', sa.Float(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.ForeignKeyConstraint(['metric_type_key'], ['metric_types.key'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['source_key'], ['sources.key'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_index(op.f('ix_alert_rules_metric_type_key'), 'alert_rules', ['metric_type_key'], unique=False)
+    op.create_table('alerts',
+    sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('rule_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('source_key', sa.Integer(), nullable=False),
+    sa.Column('value', sa.Float(), nullable=True),
+    sa.Column('fired_at', sa.DateTime(), nullable=False),
+    sa.Column('resolved_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['rule_id'], ['alert_rules.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['source_key'], ['sources.key'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_alerts_fired_at'), 'alerts', ['fired_at'], unique=False)
+    op.create_index(op.f('ix_alerts_rule_id'), 'alerts', ['rule_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_alerts_rule_id'), table_name='alerts')
+    op.drop_index(op.f('ix_alerts_fired_at'), table_name='alerts')
+    op.drop_table('alerts')
+    op.drop_index(op.f('ix_alert_rules_metric_type_key'), table_name='alert_rules')
+    op.drop_table('alert_rules')
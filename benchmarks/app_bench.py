@@ -0,0 +1,300 @@
+"""Benchmark the app's main workloads in-process.
+
+Requests go through the whole ASGI app (middleware, routing, validation,
+the database and template rendering) over an httpx ASGI transport, with
+no server or network in between. The app's startup runs first, as under
+uvicorn, so the hot store, alert rules and relay registry are loaded as
+they would be in production.
+
+Workloads:
+    ingest_single       POST /api/metrics, one point per request
+    ingest_bulk         POST /api/metrics/ingest, columnar batches
+    dashboard           GET /
+    dashboard_advanced  GET /advanced
+    dashboard_current   GET /current
+    history             GET /api/metrics/history for one metric type
+    history_full        the same with shape=full, type and source nested in every metric
+    relay_heartbeat     POST /api/clients/heartbeat
+    relay_command       send a command, poll it as the agent, submit its result
+
+Each reports throughput and p50/p99 latency. --output writes the results
+as JSON, and --baseline prints the change from an earlier JSON file, so
+two commits can be compared on the same generated data.
+
+Usage:
+    python -m benchmarks.app_bench [--url URL] [--rows N] [--requests N]
+        [--concurrency N] [--workloads a,b] [--output FILE] [--baseline FILE]
+
+Example:
+    python -m benchmarks.app_bench --rows 1000000 --output before.json
+    git checkout my-branch
+    python -m benchmarks.app_bench --skip-generate --baseline before.json
+
+Settings are read from the environment as usual; API_KEY defaults to
+"bench" and rate limiting is off unless RATE_LIMIT_ENABLED is set.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+DEFAULT_URL = "sqlite+aiosqlite:///./bench-app.db"
+BULK_BATCH_SIZE = 1000
+RELAY_CLIENTS = 100
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Workload:
+    """A named operation run repeatedly; ``points`` is the metric points each operation writes."""
+
+    def __init__(self, name: str, operation: Callable[[int], Awaitable[None]], points: int = 0):
+        self.name = name
+        self.operation = operation
+        self.points = points
+
+
+async def measure(workload: Workload, requests: int, concurrency: int, warmup: int) -> Dict[str, float]:
+    """Run a workload ``requests`` times from ``concurrency`` workers and summarize its latency."""
+    for i in range(warmup):
+        await workload.operation(i)
+
+    latencies: List[float] = []
+    errors = 0
+    next_index = iter(range(warmup, warmup + requests))
+
+    async def worker():
+        nonlocal errors
+        for i in next_index:
+            sent = time.perf_counter()
+            try:
+                await workload.operation(i)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - sent)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "operations": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "throughput": round(len(latencies) / elapsed, 2),
+    }
+    if workload.points:
+        result["points_per_second"] = round(len(latencies) * workload.points / elapsed, 1)
+    if latencies:
+        result.update(
+            mean_ms=round(sum(latencies) / len(latencies) * 1e3, 3),
+            p50_ms=round(percentile(latencies, 0.5) * 1e3, 3),
+            p99_ms=round(percentile(latencies, 0.99) * 1e3, 3),
+        )
+    return result
+
+
+def check(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.method} {response.request.url.path}: {response.status_code} {response.text[:200]}")
+    return response
+
+
+async def build_workloads(client, headers: Dict[str, str], scale) -> List[Workload]:
+    """Create the workloads, registering the relay clients they use."""
+    from benchmarks.generator import source_names, type_names
+    from web_app.ingest import COLUMNAR_CONTENT_TYPE, encode_columnar
+
+    metric_types = check(await client.get("/api/metric-types")).json()
+    types = type_names(scale)
+    type_ids = [metric_type["id"] for metric_type in metric_types if metric_type["name"] in types]
+    if not type_ids:
+        raise SystemExit("No benchmark metric types found; run without --skip-generate first")
+    sources = source_names(scale)
+
+    async def ingest_single(i: int):
+        check(await client.post("/api/metrics", headers=headers, json={
+            "metric_type_name": types[i % len(types)],
+            "source_name": sources[i % len(sources)],
+            "value": float(i % 100),
+        }))
+
+    async def ingest_bulk(i: int):
+        now = time.time()
+        indexes = range(i * BULK_BATCH_SIZE, (i + 1) * BULK_BATCH_SIZE)
+        body = encode_columnar(
+            types, sources,
+            [j % len(types) for j in indexes],
+            [j // len(types) % len(sources) for j in indexes],
+            [now] * BULK_BATCH_SIZE,
+            [float(j % 100) for j in indexes],
+        )
+        check(await client.post(
+            "/api/metrics/ingest", content=body,
+            headers={**headers, "Content-Type": COLUMNAR_CONTENT_TYPE}
+        ))
+
+    def get(path: str):
+        async def operation(i: int):
+            check(await client.get(path))
+        return operation
+
+    def history(shape: str):
+        async def operation(i: int):
+            check(await client.get("/api/metrics/history", params={
+                "metric_type_id": type_ids[i % len(type_ids)], "limit": 1000, "shape": shape
+            }))
+        return operation
+
+    client_ids = [f"bench-agent-{i:04d}" for i in range(RELAY_CLIENTS)]
+    for i, client_id in enumerate(client_ids):
+        check(await client.post("/api/clients/register", headers=headers, json={
+            "client_id": client_id, "client_type": "bench", "hostname": sources[i % len(sources)]
+        }))
+
+    async def relay_heartbeat(i: int):
+        check(await client.post("/api/clients/heartbeat", headers=headers, json={
+            "client_id": client_ids[i % len(client_ids)], "status": "active"
+        }))
+
+    async def relay_command(i: int):
+        client_id = client_ids[i % len(client_ids)]
+        command = check(await client.post("/api/commands/send", headers=headers, json={
+            "client_id": client_id, "command": "uptime"
+        })).json()
+        check(await client.get("/api/commands/pending", headers=headers, params={"client_id": client_id}))
+        check(await client.post("/api/commands/results", headers=headers, json={
+            "command_id": command["command_id"], "client_id": client_id,
+            "result": {"ok": True}, "exit_code": 0, "stdout": "up 1 day"
+        }))
+
+    return [
+        Workload("ingest_single", ingest_single, points=1),
+        Workload("ingest_bulk", ingest_bulk, points=BULK_BATCH_SIZE),
+        Workload("dashboard", get("/")),
+        Workload("dashboard_advanced", get("/advanced")),
+        Workload("dashboard_current", get("/current")),
+        Workload("history", history("normalized")),
+        Workload("history_full", history("full")),
+        Workload("relay_heartbeat", relay_heartbeat),
+        Workload("relay_command", relay_command),
+    ]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> Dict:
+    from benchmarks.generator import generate, scale_from_arguments
+
+    scale = scale_from_arguments(args)
+    if not args.skip_generate:
+        print(f"Generating {scale.rows:,} rows")
+        await generate(args.url, scale, reset=True)
+
+    import httpx
+    from web_app.main import app
+
+    headers = {"X-API-Key": os.environ["API_KEY"]}
+    transport = httpx.ASGITransport(app=app)
+    results = {}
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            workloads = await build_workloads(client, headers, scale)
+            selected = set(args.workloads.split(",")) if args.workloads else None
+            for workload in workloads:
+                if selected and workload.name not in selected:
+                    continue
+                results[workload.name] = await measure(workload, args.requests, args.concurrency, args.warmup)
+                print(format_result(workload.name, results[workload.name]))
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": args.url.split(":", 1)[0],
+            "rows": scale.rows,
+            "types": scale.types,
+            "sources": scale.sources,
+            "days": scale.days,
+            "seed": scale.seed,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "results": results,
+    }
+
+
+def format_result(name: str, result: Dict[str, float]) -> str:
+    line = f"{name:<20} {result['throughput']:>9.1f} ops/s"
+    if "p50_ms" in result:
+        line += f"  p50 {result['p50_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms"
+    if "points_per_second" in result:
+        line += f"  {result['points_per_second']:>10,.0f} points/s"
+    if result["errors"]:
+        line += f"  {result['errors']} errors"
+    return line
+
+
+def compare(baseline: Dict, current: Dict):
+    """Print the change of every workload's throughput and latency from a baseline run."""
+    print(f"\nChange from {baseline['meta'].get('commit') or 'baseline'} to {current['meta'].get('commit') or 'this run'}:")
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if not before:
+            continue
+        changes = []
+        for key in ("throughput", "p50_ms", "p99_ms"):
+            if before.get(key) and key in result:
+                changes.append(f"{key} {(result[key] - before[key]) / before[key] * 100:+6.1f}%")
+        print(f"{name:<20} " + "  ".join(changes))
+
+
+def main():
+    # Settings are read when web_app is first imported, so point them at the benchmark database first
+    preparser = argparse.ArgumentParser(add_help=False)
+    preparser.add_argument("--url", default=DEFAULT_URL)
+    os.environ["DATABASE_URL"] = preparser.parse_known_args()[0].url
+    os.environ.setdefault("API_KEY", "bench")
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    from benchmarks.generator import add_scale_arguments
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=DEFAULT_URL, help="async database URL; it is dropped and refilled")
+    parser.add_argument("--requests", type=int, default=1000, help="operations per workload")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent operations")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured operations before each workload")
+    parser.add_argument("--workloads", default="", help="comma-separated workloads to run (default: all)")
+    parser.add_argument("--skip-generate", action="store_true", help="reuse the data already in the database")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    add_scale_arguments(parser)
+    parser.set_defaults(rows=100_000)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
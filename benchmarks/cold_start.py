@@ -0,0 +1,133 @@
+"""Measure how long a new app worker takes to start serving.
+
+Starts uvicorn on web_app.main:app --runs times against the same database
+and times each from process start to the first successful response, which
+covers interpreter start, imports and the app's startup (schema check,
+partitions, hot store, alert rules, keys, relay clients and templates).
+The phases the app reports itself are read from its startup log line.
+
+--target fails the run (exit status 1) when the median cold start is
+slower, so it can guard a CI job or a deployment script. Without --url the
+database is filled first with the synthetic data set from
+benchmarks.generator, which is what the hot store rehydrates from.
+
+Usage:
+    python -m benchmarks.cold_start [--url URL] [--rows N] [--runs N]
+        [--target SECONDS] [--skip-generate] [--output FILE]
+
+Example:
+    python -m benchmarks.cold_start --rows 1000000 --runs 5 --target 3
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.app_bench import git_commit, percentile
+from benchmarks.relay_load import free_port
+
+DEFAULT_URL = "sqlite+aiosqlite:///./bench-cold-start.db"
+STARTED_LINE = re.compile(r"Started in ([\d.]+)s \((.*)\)")
+PHASE = re.compile(r"(\w+) ([\d.]+)s")
+
+
+def start_once(url: str, timeout: float) -> Dict[str, float]:
+    """Start a server, wait for its first response and stop it; return the timings in seconds."""
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=url, API_KEY=os.environ.get("API_KEY", "bench"))
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "web_app.main:app", "--port", str(port), "--log-level", "info"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    try:
+        deadline = started + timeout
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+            while True:
+                try:
+                    if client.get("/api/units").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.perf_counter() > deadline or server.poll() is not None:
+                    raise SystemExit(f"Server did not start within {timeout:g}s")
+                time.sleep(0.005)
+        timings = {"first_response": time.perf_counter() - started}
+    finally:
+        server.terminate()
+        _, log = server.communicate()
+
+    match = STARTED_LINE.search(log)
+    if match:
+        timings["startup"] = float(match.group(1))
+        timings.update((f"startup_{phase}", float(seconds)) for phase, seconds in PHASE.findall(match.group(2)))
+    return timings
+
+
+def summarize(runs: List[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    for key in runs[0]:
+        samples = [run[key] for run in runs if key in run]
+        summary[key] = {
+            "p50_s": round(percentile(samples, 0.5), 3),
+            "max_s": round(max(samples), 3),
+        }
+    return summary
+
+
+def main():
+    # Settings are read when web_app is first imported by the generator
+    os.environ.setdefault("API_KEY", "bench")
+    from benchmarks.generator import add_scale_arguments, generate, scale_from_arguments
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=DEFAULT_URL, help="async database URL the server starts against")
+    parser.add_argument("--runs", type=int, default=5, help="server starts to time")
+    parser.add_argument("--target", type=float, help="fail when the median start takes longer than this many seconds")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for a server to answer")
+    parser.add_argument("--skip-generate", action="store_true", help="reuse the data already in the database")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    add_scale_arguments(parser)
+    parser.set_defaults(rows=100_000)
+    args = parser.parse_args()
+
+    if not args.skip_generate:
+        scale = scale_from_arguments(args)
+        print(f"Generating {scale.rows:,} rows")
+        asyncio.run(generate(args.url, scale, reset=True))
+
+    # The first start also warms the OS file cache, so it is not measured
+    start_once(args.url, args.timeout)
+    runs = []
+    for i in range(args.runs):
+        runs.append(start_once(args.url, args.timeout))
+        print(f"run {i + 1}: first response after {runs[-1]['first_response']:.3f}s")
+
+    summary = summarize(runs)
+    for key, result in summary.items():
+        print(f"{key:<24} p50 {result['p50_s']:7.3f}s  max {result['max_s']:7.3f}s")
+
+    passed = args.target is None or summary["first_response"]["p50_s"] <= args.target
+    if args.target is not None:
+        print(f"{'within' if passed else 'over'} the {args.target:g}s target")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "meta": {"commit": git_commit(), "rows": args.rows, "runs": args.runs, "target": args.target},
+                "results": summary,
+            }, f, indent=2)
+    if not passed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
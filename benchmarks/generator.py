@@ -0,0 +1,185 @@
+"""Fill a database with deterministic synthetic metrics.
+
+The same seed, scale and end time always produce the same units, metric
+types, sources and points, so results from different commits are measured
+on identical data. Points are spread evenly over --days ending at --end
+(default: the start of the current hour), interleaved across every series
+(one metric type from one source) in time order, and written in chunks, so
+memory stays flat from 1M to 100M rows. Chunks go through the app's own
+partitioned insert (or COPY on PostgreSQL) without the hot store and alert
+hooks.
+
+Usage:
+    python -m benchmarks.generator [--rows N] [--types N] [--sources N] [--days N]
+        [--seed N] [--end ISO-TIME] [--reset] URL
+
+Example:
+    API_KEY=bench python -m benchmarks.generator --rows 1000000 --reset sqlite+aiosqlite:///./bench-app.db
+"""
+import argparse
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy import inspect, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from benchmarks.ingest_db_bench import create_engine
+from web_app.ingest import METRIC_COLUMNS, copy_rows, uses_copy
+from web_app.models import Base, Metric, MetricType, Source, Unit
+from web_app.partitions import PARTITION_NAME, ensure_partitions, insert_metrics, period_starts, utc_now
+
+CHUNK_SIZE = 50_000
+
+UNITS = [("Percentage", "%"), ("Megabytes", "MB"), ("Milliseconds", "ms"), ("Count", "#")]
+
+
+@dataclass
+class Scale:
+    rows: int = 1_000_000
+    types: int = 8
+    sources: int = 100
+    days: float = 7.0
+    seed: int = 1
+    end: Optional[datetime] = None
+
+    @property
+    def series(self) -> int:
+        return self.types * self.sources
+
+    def resolved_end(self) -> datetime:
+        return self.end or utc_now().replace(minute=0, second=0, microsecond=0)
+
+
+def type_names(scale: Scale) -> List[str]:
+    return [f"bench_metric_{i:03d}" for i in range(scale.types)]
+
+
+def source_names(scale: Scale) -> List[str]:
+    return [f"bench-host-{i:05d}" for i in range(scale.sources)]
+
+
+def drop_all(conn):
+    """Drop every table, including SQLite's standalone partitions."""
+    for name in inspect(conn).get_table_names():
+        if PARTITION_NAME.match(name):
+            conn.execute(text(f'DROP TABLE "{name}"'))
+    Base.metadata.drop_all(conn)
+
+
+async def create_dimensions(session_factory: async_sessionmaker, scale: Scale):
+    """Create the units, metric types and sources, returning their integer keys."""
+    async with session_factory() as db:
+        units = {unit.symbol: unit for unit in (await db.execute(select(Unit))).scalars()}
+        for name, symbol in UNITS:
+            if symbol not in units:
+                units[symbol] = Unit(name=name, symbol=symbol)
+                db.add(units[symbol])
+        await db.flush()
+
+        existing = set((await db.execute(select(MetricType.name))).scalars())
+        db.add_all(
+            MetricType(name=name, unit_id=units[UNITS[i % len(UNITS)][1]].id, description="Synthetic benchmark metric")
+            for i, name in enumerate(type_names(scale)) if name not in existing
+        )
+        existing = set((await db.execute(select(Source.name))).scalars())
+        db.add_all(Source(name=name) for name in source_names(scale) if name not in existing)
+        await db.commit()
+
+        type_keys = dict((await db.execute(select(MetricType.name, MetricType.key))).all())
+        source_keys = dict((await db.execute(select(Source.name, Source.key))).all())
+    return (
+        np.array([type_keys[name] for name in type_names(scale)], dtype=np.int64),
+        np.array([source_keys[name] for name in source_names(scale)], dtype=np.int64),
+    )
+
+
+def make_chunk(scale: Scale, start: int, size: int, type_keys: np.ndarray, source_keys: np.ndarray) -> List[tuple]:
+    """Rows start to start + size as (metric_type_key, source_key, value, recorded_at) tuples.
+
+    Row i belongs to series i % series and is its (i // series)-th point;
+    each chunk draws its noise from its own seeded generator, so chunks can
+    be made in any order.
+    """
+    index = np.arange(start, start + size, dtype=np.int64)
+    series = index % scale.series
+    step = index // scale.series
+    points_per_series = max(1, -(-scale.rows // scale.series))
+    interval = scale.days * 86400 / points_per_series
+
+    # A daily cycle around a per-series level, plus noise
+    rng = np.random.default_rng([scale.seed, start])
+    level = 20 + (series * 7919 % 60)
+    seconds = step * interval
+    values = level + 10 * np.sin(2 * np.pi * seconds / 86400 + series) + rng.normal(0, 2, size)
+
+    first = scale.resolved_end() - timedelta(days=scale.days)
+    micros = np.round(seconds * 1e6).astype(np.int64).tolist()
+    return list(zip(
+        type_keys[series // scale.sources].tolist(),
+        source_keys[series % scale.sources].tolist(),
+        np.round(values, 3).tolist(),
+        [first + timedelta(microseconds=offset) for offset in micros],
+    ))
+
+
+async def write_chunk(db: AsyncSession, records: List[tuple]):
+    if uses_copy(db):
+        await ensure_partitions(db, period_starts(record[3] for record in records))
+        await copy_rows(db, Metric.__tablename__, METRIC_COLUMNS, records)
+    else:
+        await insert_metrics(db, [dict(zip(METRIC_COLUMNS, record)) for record in records])
+    await db.commit()
+
+
+async def generate(url: str, scale: Scale, reset: bool = False, quiet: bool = False):
+    """Create the schema if needed and write the synthetic data set."""
+    engine = create_engine(url)
+    async with engine.begin() as conn:
+        if reset:
+            await conn.run_sync(drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    scale.end = scale.resolved_end()
+    type_keys, source_keys = await create_dimensions(session_factory, scale)
+    started = time.perf_counter()
+    for start in range(0, scale.rows, CHUNK_SIZE):
+        records = make_chunk(scale, start, min(CHUNK_SIZE, scale.rows - start), type_keys, source_keys)
+        async with session_factory() as db:
+            await write_chunk(db, records)
+        if not quiet:
+            done = start + len(records)
+            print(f"\r{done:,} / {scale.rows:,} rows  {done / (time.perf_counter() - started):,.0f} rows/s", end="", flush=True)
+    if not quiet:
+        print()
+    await engine.dispose()
+
+
+def add_scale_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--rows", type=int, default=Scale.rows, help="metric points to write")
+    parser.add_argument("--types", type=int, default=Scale.types, help="metric types")
+    parser.add_argument("--sources", type=int, default=Scale.sources, help="sources")
+    parser.add_argument("--days", type=float, default=Scale.days, help="days the points span")
+    parser.add_argument("--seed", type=int, default=Scale.seed, help="random seed")
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None, help="UTC time of the newest point")
+
+
+def scale_from_arguments(args: argparse.Namespace) -> Scale:
+    return Scale(args.rows, args.types, args.sources, args.days, args.seed, args.end)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("url", metavar="URL", help="async database URL to fill")
+    parser.add_argument("--reset", action="store_true", help="drop and recreate every table first")
+    add_scale_arguments(parser)
+    args = parser.parse_args()
+    asyncio.run(generate(args.url, scale_from_arguments(args), reset=args.reset))
+
+
+if __name__ == "__main__":
+    main()
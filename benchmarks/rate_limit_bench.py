@@ -0,0 +1,50 @@
+"""Measure the per-request overhead of the in-memory rate limiter.
+
+Usage: python -m benchmarks.rate_limit_bench [iterations]
+"""
+import asyncio
+import sys
+import time
+
+from web_app.rate_limit import InMemoryRateLimitBackend, RateLimiter
+
+KEYS = 1000  # Distinct API keys / sources being limited
+
+
+def bench_take(iterations: int) -> float:
+    """Time the synchronous bucket update on its own."""
+    backend = InMemoryRateLimitBackend()
+    keys = [f"key:{i}" for i in range(KEYS)]
+    start = time.perf_counter()
+    for i in range(iterations):
+        backend.take_now(keys[i % KEYS], 1e9, 1e9)
+    return (time.perf_counter() - start) / iterations
+
+
+async def bench_admission(iterations: int) -> float:
+    """Time a full admission check: key bucket, source bucket and write slot."""
+    limiter = RateLimiter(
+        InMemoryRateLimitBackend(),
+        key_rate=1e9, key_burst=1e9,
+        source_rate=1e9, source_burst=1e9,
+        write_concurrency=8, write_queue_timeout=1.0,
+    )
+    keys = [f"{i:064x}" for i in range(KEYS)]
+    start = time.perf_counter()
+    for i in range(iterations):
+        key = keys[i % KEYS]
+        await limiter.check_key(key)
+        await limiter.check_sources({key: 10})
+        await limiter.acquire_write_slot()
+        limiter.release_write_slot()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    print(f"bucket update:   {bench_take(iterations) * 1e6:.2f} us/op")
+    print(f"full admission:  {asyncio.run(bench_admission(iterations)) * 1e6:.2f} us/request")
+
+
+if __name__ == "__main__":
+    main()
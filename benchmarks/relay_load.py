@@ -0,0 +1,433 @@
+"""Load-test the command relay with thousands of simulated agents.
+
+Each agent is an asyncio task that registers, heartbeats and polls
+/api/commands/pending like the real agent, and reports a result for every
+command it picks up. An operator task sends commands to random agents at
+a fixed rate. Reported:
+
+- dispatch-to-pickup latency: from the operator sending a command to its
+  agent receiving it in a poll
+- dispatch-to-completion latency and completion throughput
+- latency and errors of every relay request the agents make
+- the server's CPU use and peak resident memory, read from /proc, and the
+  CPU use of the harness itself
+
+One Python process drives a few hundred requests per second, so the agents
+are split over --processes worker processes, which all time events on the
+system's monotonic clock. Check the harness CPU in the report: near 100%
+per process means the harness, not the server, is the limit.
+
+By default the server is started in a subprocess with only the relay
+router (plus its API key and database setup), on a scratch SQLite
+database. --full-app serves the whole app instead, and --url targets a
+server that is already running (pass --server-pid to also sample its CPU
+and memory). Linux only for the CPU and memory figures.
+
+Usage:
+    python -m benchmarks.relay_load [--agents N] [--processes N] [--duration S]
+        [--poll-interval S] [--heartbeat-interval S] [--command-rate N]
+        [--full-app] [--url URL] [--server-pid PID] [--output FILE]
+
+Example:
+    python -m benchmarks.relay_load --agents 5000 --processes 8 --duration 60 --command-rate 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+API_KEY = "relay-load"
+
+
+def create_relay_app():
+    """App factory serving only the command relay."""
+    from contextlib import asynccontextmanager
+
+    from fastapi import FastAPI
+
+    from web_app.auth import load_api_keys
+    from web_app.command_relay import router, start_relay, stop_relay
+    from web_app.database import init_db
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await init_db()
+        await load_api_keys()
+        await start_relay()
+        yield
+        await stop_relay()
+
+    app = FastAPI(title="Command relay load test", lifespan=lifespan)
+    app.include_router(router)
+    return app
+
+
+def percentile(samples: List[float], fraction: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(samples: List[float]) -> Dict[str, Optional[float]]:
+    """Count and p50/p99/max of latencies in milliseconds."""
+    def ms(value):
+        return None if value is None else round(value * 1e3, 3)
+    return {
+        "count": len(samples),
+        "p50_ms": ms(percentile(samples, 0.5)),
+        "p99_ms": ms(percentile(samples, 0.99)),
+        "max_ms": ms(max(samples) if samples else None),
+    }
+
+
+def read_process(pid: int) -> Optional[Tuple[float, int]]:
+    """CPU seconds used and resident bytes of a process, or None off Linux."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/status") as f:
+            rss_kb = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+    except (OSError, StopIteration):
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    # utime and stime are the 14th and 15th fields; the split starts at the 3rd
+    return (int(fields[11]) + int(fields[12])) / ticks, rss_kb * 1024
+
+
+def agent_id(index: int) -> str:
+    return f"load-agent-{index:06d}"
+
+
+class Worker:
+    """A share of the agents, and the operator in the first worker, run in one process.
+
+    Everything is recorded with its time on the monotonic clock, and the
+    coordinator keeps what falls in the measurement window.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, args: argparse.Namespace):
+        self.client = client
+        self.args = args
+        self.headers = {"X-API-Key": args.api_key}
+        self.random = random.Random(f"{args.seed}:{args.first_agent}")
+        self.stopping = asyncio.Event()
+        # Request name -> (sent at, latency) and error times
+        self.requests: Dict[str, List[Tuple[float, float]]] = defaultdict(list)
+        self.errors: Dict[str, List[float]] = defaultdict(list)
+        # Command id -> when it was sent, picked up by its agent and completed
+        self.dispatched: Dict[str, float] = {}
+        self.picked_up: Dict[str, float] = {}
+        self.completed: Dict[str, float] = {}
+
+    async def request(self, name: str, method: str, path: str, **kwargs) -> Optional[httpx.Response]:
+        sent = time.monotonic()
+        try:
+            response = await self.client.request(method, path, headers=self.headers, **kwargs)
+        except httpx.HTTPError:
+            self.errors[name].append(sent)
+            return None
+        self.requests[name].append((sent, time.monotonic() - sent))
+        if response.status_code >= 400:
+            self.errors[name].append(sent)
+            return None
+        return response
+
+    async def sleep(self, seconds: float):
+        """Sleep, returning early once the run is stopping."""
+        try:
+            await asyncio.wait_for(self.stopping.wait(), max(0.0, seconds))
+        except asyncio.TimeoutError:
+            pass
+
+    async def agent(self, index: int):
+        client_id = agent_id(index)
+        # Spread the fleet's start and polls, as real agents drift apart
+        await self.sleep(self.random.uniform(0, self.args.ramp_up))
+        registration = {"client_id": client_id, "client_type": "load-test", "hostname": f"load-host-{index:06d}"}
+        if await self.request("register", "POST", "/api/clients/register", json=registration) is None:
+            return
+
+        await self.sleep(self.random.uniform(0, self.args.poll_interval))
+        next_heartbeat = time.monotonic() + self.random.uniform(0, self.args.heartbeat_interval)
+        while not self.stopping.is_set():
+            if time.monotonic() >= next_heartbeat:
+                await self.request("heartbeat", "POST", "/api/clients/heartbeat", json={"client_id": client_id})
+                next_heartbeat += self.args.heartbeat_interval
+
+            response = await self.request("poll", "GET", "/api/commands/pending", params={"client_id": client_id})
+            for command in response.json() if response is not None else ():
+                command_id = command["command_id"]
+                self.picked_up[command_id] = time.monotonic()
+                result = {
+                    "command_id": command_id, "client_id": client_id,
+                    "result": {"ok": True}, "exit_code": 0, "stdout": "ok"
+                }
+                if await self.request("result", "POST", "/api/commands/results", json=result) is not None:
+                    self.completed[command_id] = time.monotonic()
+
+            await self.sleep(self.args.poll_interval)
+
+    async def send_command(self, client_id: str):
+        sent = time.monotonic()
+        response = await self.request("send", "POST", "/api/commands/send", json={"client_id": client_id, "command": "uptime"})
+        if response is not None:
+            self.dispatched[response.json()["command_id"]] = sent
+
+    async def operator(self, start_at: float):
+        """Send commands to random agents at --command-rate per second once the fleet is up.
+
+        Sends are not awaited one by one, so slow responses do not lower the rate.
+        """
+        await self.sleep(start_at - time.monotonic())
+        interval = 1 / self.args.command_rate
+        next_send = time.monotonic()
+        sends = set()
+        while not self.stopping.is_set():
+            task = asyncio.create_task(self.send_command(agent_id(self.random.randrange(self.args.total_agents))))
+            sends.add(task)
+            task.add_done_callback(sends.discard)
+            next_send += interval
+            await self.sleep(next_send - time.monotonic())
+        await asyncio.gather(*sends)
+
+    async def run(self) -> Dict:
+        args = self.args
+        await self.sleep(args.start_at - time.monotonic())
+        cpu_start = time.process_time()
+        tasks = [asyncio.create_task(self.agent(i)) for i in range(args.first_agent, args.first_agent + args.agents)]
+        if args.first_agent == 0:
+            tasks.append(asyncio.create_task(self.operator(args.start_at + args.ramp_up)))
+
+        await self.sleep(args.start_at + args.ramp_up + args.duration - time.monotonic())
+        cpu_seconds = time.process_time() - cpu_start
+        self.stopping.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "dispatched": self.dispatched,
+            "picked_up": self.picked_up,
+            "completed": self.completed,
+            "cpu_percent": cpu_seconds / (args.ramp_up + args.duration) * 100,
+        }
+
+
+async def run_worker(args: argparse.Namespace) -> Dict:
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        return await Worker(client, args).run()
+
+
+def merge(results: List[Dict], window: Tuple[float, float]) -> Dict:
+    """Combine the workers' raw results into the report, keeping the measurement window."""
+    start, end = window
+    elapsed = end - start
+
+    def measured(times):
+        return start <= times < end
+
+    dispatched, picked_up, completed = {}, {}, {}
+    requests, errors = defaultdict(list), defaultdict(int)
+    for result in results:
+        dispatched.update(result["dispatched"])
+        picked_up.update(result["picked_up"])
+        completed.update(result["completed"])
+        for name, samples in result["requests"].items():
+            requests[name].extend(latency for sent, latency in samples if measured(sent))
+        for name, times in result["errors"].items():
+            errors[name] += sum(map(measured, times))
+
+    sent = {command_id: at for command_id, at in dispatched.items() if measured(at)}
+    return {
+        "dispatched": len(sent),
+        "seconds": round(elapsed, 2),
+        "completed_per_second": round(sum(map(measured, completed.values())) / elapsed, 2),
+        "requests_per_second": round(sum(len(samples) for samples in requests.values()) / elapsed, 1),
+        "dispatch_to_pickup": summarize(
+            [picked_up[command_id] - at for command_id, at in sent.items() if command_id in picked_up]
+        ),
+        "dispatch_to_completion": summarize(
+            [completed[command_id] - at for command_id, at in sent.items() if command_id in completed]
+        ),
+        "requests": {name: summarize(samples) for name, samples in sorted(requests.items())},
+        "errors": {name: count for name, count in errors.items() if count},
+        "harness_cpu_percent": [round(result["cpu_percent"], 1) for result in results],
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args: argparse.Namespace, directory: str) -> Tuple[subprocess.Popen, str]:
+    """Serve the relay (or the whole app) with uvicorn on a scratch database."""
+    port = free_port()
+    target = ["web_app.main:app"] if args.full_app else ["--factory", "benchmarks.relay_load:create_relay_app"]
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite+aiosqlite:///{os.path.join(directory, 'relay-load.db')}",
+        API_KEY=args.api_key,
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", *target, "--port", str(port), "--log-level", "warning"],
+        env=env,
+        # The relay logs every command at INFO
+        stderr=None if args.server_log else subprocess.DEVNULL,
+    )
+    return server, f"http://127.0.0.1:{port}"
+
+
+async def wait_until_up(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=url) as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get("/openapi.json")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise SystemExit(f"Server at {url} did not start")
+
+
+def run_workers(args: argparse.Namespace, directory: str, server_pid: Optional[int]) -> Tuple[List[Dict], Optional[Dict]]:
+    """Start the worker processes, sample the server while they run and collect their results."""
+    # Leave the workers time to import and connect before the clock starts
+    start_at = time.monotonic() + 2 + 0.1 * args.processes
+    window = (start_at + args.ramp_up, start_at + args.ramp_up + args.duration)
+    per_worker = -(-args.agents // args.processes)
+    workers = []
+    for i in range(args.processes):
+        first = i * per_worker
+        count = min(per_worker, args.agents - first)
+        if count <= 0:
+            break
+        output = os.path.join(directory, f"worker-{i}.json")
+        command = [
+            sys.executable, "-m", "benchmarks.relay_load", "--worker",
+            "--url", args.url, "--api-key", args.api_key, "--start-at", repr(start_at),
+            "--first-agent", str(first), "--agents", str(count), "--total-agents", str(args.agents),
+            "--output", output,
+        ]
+        for option in ("duration", "ramp_up", "poll_interval", "heartbeat_interval", "command_rate",
+                       "connections", "timeout", "seed"):
+            command += [f"--{option.replace('_', '-')}", str(getattr(args, option))]
+        workers.append((subprocess.Popen(command), output))
+
+    server = None
+    if server_pid:
+        time.sleep(max(0.0, window[0] - time.monotonic()))
+        first_sample = read_process(server_pid)
+        peak_rss = first_sample[1] if first_sample else 0
+        while time.monotonic() < window[1]:
+            time.sleep(1)
+            sample = read_process(server_pid)
+            if sample:
+                peak_rss = max(peak_rss, sample[1])
+            print(f"\r{time.monotonic() - window[0]:5.0f} / {args.duration:.0f} s", end="", flush=True)
+        print()
+        last_sample = read_process(server_pid)
+        if first_sample and last_sample:
+            server = {
+                "cpu_percent": round((last_sample[0] - first_sample[0]) / (window[1] - window[0]) * 100, 1),
+                "peak_rss_mb": round(peak_rss / 2**20, 1),
+            }
+
+    results = []
+    for process, output in workers:
+        if process.wait() != 0:
+            raise SystemExit("A worker process failed")
+        with open(output) as f:
+            results.append(json.load(f))
+    report = merge(results, window)
+    report["server"] = server
+    return report
+
+
+def print_report(report: Dict):
+    print(f"{report['config']['agents']} agents in {report['config']['processes']} processes, {report['seconds']} s measured")
+    print(f"completed            {report['completed_per_second']:>9.1f} commands/s of {report['dispatched']} sent")
+    print(f"relay requests       {report['requests_per_second']:>9.1f} req/s")
+    for name in ("dispatch_to_pickup", "dispatch_to_completion"):
+        summary = report[name]
+        if summary["count"]:
+            print(f"{name:<22} p50 {summary['p50_ms']:9.1f} ms  p99 {summary['p99_ms']:9.1f} ms  max {summary['max_ms']:9.1f} ms")
+    for name, summary in report["requests"].items():
+        if summary["count"]:
+            errors = report["errors"].get(name, 0)
+            print(f"  {name:<20} {summary['count']:>8} req  p50 {summary['p50_ms']:8.2f} ms  p99 {summary['p99_ms']:8.2f} ms  {errors} errors")
+    if report["server"]:
+        print(f"server               {report['server']['cpu_percent']:.1f}% CPU, {report['server']['peak_rss_mb']:.1f} MB peak RSS")
+    print(f"harness              {', '.join(f'{cpu}%' for cpu in report['harness_cpu_percent'])} CPU per process")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--agents", type=int, default=1000, help="simulated agents")
+    parser.add_argument("--processes", type=int, default=max(1, min(os.cpu_count() or 1, 4)), help="worker processes")
+    parser.add_argument("--duration", type=float, default=60, help="seconds measured once every agent has started")
+    parser.add_argument("--ramp-up", type=float, default=10, help="seconds over which agents start")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds between an agent's polls")
+    parser.add_argument("--heartbeat-interval", type=float, default=10.0, help="seconds between an agent's heartbeats")
+    parser.add_argument("--command-rate", type=float, default=50, help="commands sent per second")
+    parser.add_argument("--connections", type=int, default=200, help="HTTP connections per worker process")
+    parser.add_argument("--timeout", type=float, default=30, help="request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for agent timing and targets")
+    parser.add_argument("--full-app", action="store_true", help="serve the whole app instead of only the relay")
+    parser.add_argument("--server-log", action="store_true", help="show the server's log output")
+    parser.add_argument("--url", help="target a running server instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="process to sample CPU and memory of with --url")
+    parser.add_argument("--api-key", default=os.environ.get("API_KEY", API_KEY), help="key with the admin scope")
+    parser.add_argument("--output", help="write the report to this JSON file")
+    # Set by the coordinator for its worker processes
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--start-at", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--first-agent", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--total-agents", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = asyncio.run(run_worker(args))
+        with open(args.output, "w") as f:
+            json.dump(result, f)
+        return
+
+    server = None
+    with tempfile.TemporaryDirectory() as directory:
+        if not args.url:
+            server, args.url = start_server(args, directory)
+            args.server_pid = server.pid
+        try:
+            if server:
+                asyncio.run(wait_until_up(args.url))
+            report = run_workers(args, directory, args.server_pid)
+        finally:
+            if server:
+                server.terminate()
+                server.wait()
+
+    report["config"] = {
+        key: getattr(args, key)
+        for key in ("agents", "processes", "duration", "ramp_up", "poll_interval", "heartbeat_interval",
+                    "command_rate", "full_app", "seed")
+    }
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
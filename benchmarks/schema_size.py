@@ -0,0 +1,120 @@
+"""Measure the on-disk size of a metrics partition in the old and new layouts.
+
+The old layout keyed metrics by UUID and referenced metric types and
+sources by UUID; the current one uses an integer rowid id and integer
+keys. Both get the same rows in one SQLite partition, then the dbstat
+virtual table reports the bytes used by the table and by each index.
+
+Usage:
+    python -m benchmarks.schema_size [--rows N]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import uuid
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Column, DateTime, Float, Index, MetaData, PrimaryKeyConstraint, Table, create_engine, insert
+from sqlalchemy.dialects.postgresql import UUID
+
+from web_app.partitions import create_partition, partition_name, partition_table
+
+DAY = date(2026, 10, 19)
+METRIC_TYPES = 4
+SOURCES = 50
+
+
+def uuid_partition(metadata: MetaData, name: str) -> Table:
+    """A partition as it was before integer keys."""
+    return Table(
+        name,
+        metadata,
+        Column("id", UUID(as_uuid=True), nullable=False),
+        Column("metric_type_id", UUID(as_uuid=True), nullable=False),
+        Column("source_id", UUID(as_uuid=True), nullable=False),
+        Column("value", Float, nullable=False),
+        Column("recorded_at", DateTime, nullable=False),
+        PrimaryKeyConstraint("id", "recorded_at"),
+        Index(f"ix_{name}_recorded_at", "recorded_at"),
+        Index(f"ix_{name}_type_recorded_at", "metric_type_id", "recorded_at"),
+    )
+
+
+def sample_rows(rows: int):
+    start = datetime(DAY.year, DAY.month, DAY.day)
+    rng = random.Random(0)
+    for i in range(rows):
+        yield i % METRIC_TYPES, i % SOURCES, rng.uniform(0, 100), start + timedelta(seconds=i * 86400 / rows)
+
+
+def build_uuid(path: str, rows: int) -> str:
+    engine = create_engine(f"sqlite:///{path}")
+    name = partition_name(DAY)
+    table = uuid_partition(MetaData(), name)
+    type_ids = [uuid.uuid4() for _ in range(METRIC_TYPES)]
+    source_ids = [uuid.uuid4() for _ in range(SOURCES)]
+    with engine.begin() as connection:
+        table.create(connection)
+        connection.execute(insert(table), [
+            {"id": uuid.uuid4(), "metric_type_id": type_ids[t], "source_id": source_ids[s], "value": v, "recorded_at": ts}
+            for t, s, v, ts in sample_rows(rows)
+        ])
+    engine.dispose()
+    return name
+
+
+def build_keyed(path: str, rows: int) -> str:
+    engine = create_engine(f"sqlite:///{path}")
+    name = partition_name(DAY)
+    with engine.begin() as connection:
+        create_partition(connection, DAY)
+        connection.execute(insert(partition_table(name)), [
+            {"metric_type_key": t + 1, "source_key": s + 1, "value": v, "recorded_at": ts}
+            for t, s, v, ts in sample_rows(rows)
+        ])
+    engine.dispose()
+    return name
+
+
+def object_sizes(path: str, table: str):
+    """Bytes used by a table and each of its indexes, after a VACUUM."""
+    connection = sqlite3.connect(path)
+    connection.execute("VACUUM")
+    sizes = connection.execute(
+        "SELECT d.name, SUM(d.pgsize) FROM dbstat d JOIN sqlite_master m ON m.name = d.name "
+        "WHERE m.tbl_name = ? GROUP BY d.name ORDER BY d.name",
+        (table,)
+    ).fetchall()
+    connection.close()
+    return sizes
+
+
+def report(label: str, sizes, rows: int):
+    total = sum(size for _, size in sizes)
+    print(f"{label}: {total / rows:.1f} bytes/row")
+    for name, size in sizes:
+        print(f"  {name:<40} {size / rows:7.1f} bytes/row  {size / 1024 / 1024:8.2f} MiB")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000, help="Rows to write into the partition")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        uuid_path = os.path.join(directory, "uuid.db")
+        keyed_path = os.path.join(directory, "keyed.db")
+        uuid_sizes = object_sizes(uuid_path, build_uuid(uuid_path, args.rows))
+        keyed_sizes = object_sizes(keyed_path, build_keyed(keyed_path, args.rows))
+
+    print(f"{args.rows} rows, {METRIC_TYPES} metric types, {SOURCES} sources\n")
+    before = report("UUID keys", uuid_sizes, args.rows)
+    after = report("Integer keys", keyed_sizes, args.rows)
+    print(f"\nReduction: {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
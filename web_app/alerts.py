@@ -0,0 +1,483 @@
+"""Alert rules evaluated as metrics are written.
+
+Rules are stored in the database and compiled into an index from metric
+type to rules, so each written batch only costs the rules of the types it
+holds. Per rule kind:
+
+- ``threshold``: the newest value of a series compared to the threshold
+- ``rate``: change per second over ``window_seconds`` of the series' points
+  in the hot store, compared to the threshold
+- ``absence``: no point recorded for ``window_seconds``, checked by a
+  periodic sweep, per source (or per source seen, for rules on every source)
+
+A rule fires separately for each source and stays firing until its
+condition clears. Fired and resolved alerts are written to the ``alerts``
+table in the background and published on an event feed for
+``/api/alerts/events``. With several workers every worker observes every
+written metric (see ``shared_state``), but only the leader fires and
+resolves alerts; the others apply the alerts it replicates.
+"""
+import asyncio
+import logging
+import operator
+import uuid
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import selectinload
+
+from .auth import SCOPE_ADMIN, Principal, require_scope
+from .database import get_read_db, get_write_db
+from .hot_store import from_micros, get_hot_store, to_micros
+from .instrumentation import registry
+from .models import Alert, AlertRule, MetricType, Source
+from .partitions import utc_now
+from .schemas import Alert as AlertSchema, AlertRule as AlertRuleSchema, AlertRuleCreate
+from .shared_state import is_leader, publish
+from .streaming import SSE_HEADERS, EventFeed
+
+logger = logging.getLogger(__name__)
+
+OPERATORS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+
+# Seconds between checks of absence rules
+SWEEP_INTERVAL = 10
+
+# Channel the leader replicates alerts and rule changes on
+ALERTS_CHANNEL = "alerts"
+
+
+class CompiledRule:
+    """An active rule with the alerts it has firing, keyed by source key."""
+
+    __slots__ = ("id", "name", "metric_type_key", "metric_type_id", "source_key", "kind", "compare", "threshold",
+                 "window", "since", "firing")
+
+    def __init__(self, rule: AlertRule):
+        self.id = rule.id
+        self.name = rule.name
+        self.metric_type_key = rule.metric_type_key
+        self.metric_type_id = rule.metric_type.id
+        self.source_key = rule.source_key
+        self.kind = rule.kind
+        self.compare = OPERATORS.get(rule.operator)
+        self.threshold = rule.threshold
+        # Microseconds
+        self.window = int(rule.window_seconds * 1_000_000) if rule.window_seconds else None
+        # Absence of a source not heard from yet counts from when the rule was loaded
+        self.since = to_micros(utc_now())
+        self.firing: Dict[int, dict] = {}
+
+    def applies_to(self, source_key: int) -> bool:
+        return self.source_key is None or self.source_key == source_key
+
+
+class AlertEngine:
+    """Evaluates the active rules and records the alerts they raise."""
+
+    def __init__(self):
+        self.rules: Dict[UUID, CompiledRule] = {}
+        self.by_type: Dict[int, List[CompiledRule]] = {}
+        # Newest recorded_at (Unix microseconds) per source of each type with rules
+        self.last_seen: Dict[int, Dict[int, int]] = {}
+        # Alert rows to write, as ("fired" | "resolved", row)
+        self.pending: List[Tuple[str, dict]] = []
+        self.flushing: Optional[asyncio.Task] = None
+        self.session_factory: Optional[async_sessionmaker] = None
+        self.source_ids: Dict[int, UUID] = {}
+        # Published payloads of the alerts currently firing
+        self.published: Dict[UUID, Dict[str, Any]] = {}
+        self.events = EventFeed()
+
+    def add_rule(self, rule: AlertRule, firing: Iterable[Alert] = ()):
+        compiled = CompiledRule(rule)
+        for alert in firing:
+            compiled.firing[alert.source_key] = alert_row(alert)
+        previous = self.drop_rule(rule.id)
+        if previous is not None and not compiled.firing:
+            # Reloaded rule, its alerts are still firing
+            compiled.firing = previous.firing
+        self.rules[rule.id] = compiled
+        self.by_type.setdefault(rule.metric_type_key, []).append(compiled)
+
+        seen = self.last_seen.setdefault(rule.metric_type_key, {})
+        hot_store = get_hot_store()
+        if hot_store is not None:
+            for source_key, series in hot_store.series.get(rule.metric_type_key, {}).items():
+                if len(series) and series.times[series.start - 1] > seen.get(source_key, -1):
+                    seen[source_key] = series.times[series.start - 1]
+        if compiled.kind == "rate" and hot_store is None:
+            logger.warning(f"Alert rule {rule.name} needs the hot store (HOT_STORE_POINTS) and is not evaluated")
+
+    def drop_rule(self, rule_id: UUID) -> Optional[CompiledRule]:
+        compiled = self.rules.pop(rule_id, None)
+        if compiled is None:
+            return None
+        rules = self.by_type[compiled.metric_type_key]
+        rules.remove(compiled)
+        if not rules:
+            del self.by_type[compiled.metric_type_key]
+            self.last_seen.pop(compiled.metric_type_key, None)
+        return compiled
+
+    def remove_rule(self, rule_id: UUID):
+        """Stop evaluating a deleted rule and resolve the alerts it had published as firing."""
+        compiled = self.drop_rule(rule_id)
+        if compiled is None:
+            return
+        now = utc_now()
+        for row in compiled.firing.values():
+            if row["id"] in self.published:
+                resolved = dict(row, resolved_at=max(now, row["fired_at"]))
+                self.publish_alert("resolved", self.payload(compiled, "resolved", resolved))
+
+    async def load(self, session_factory: async_sessionmaker):
+        """Load the active rules and the alerts still firing."""
+        self.session_factory = session_factory
+        async with session_factory() as db:
+            result = await db.execute(
+                select(AlertRule).options(selectinload(AlertRule.metric_type)).where(AlertRule.is_active == True)  # noqa: E712
+            )
+            rules = result.scalars().all()
+            result = await db.execute(select(Alert).where(Alert.resolved_at.is_(None)))
+            firing: Dict[UUID, List[Alert]] = {}
+            for alert in result.scalars():
+                firing.setdefault(alert.rule_id, []).append(alert)
+            self.source_ids.update((await db.execute(select(Source.key, Source.id))).all())
+        for rule in rules:
+            self.add_rule(rule, firing.get(rule.id, ()))
+            for row in self.rules[rule.id].firing.values():
+                self.published[row["id"]] = self.payload(self.rules[rule.id], "fired", row)
+        logger.info(f"Loaded {len(rules)} alert rules")
+
+    def observe(self, rows: Iterable[dict]):
+        """Evaluate the rules of the written rows' metric types."""
+        if not self.by_type:
+            return
+        newest: Dict[Tuple[int, int], Tuple[int, float]] = {}
+        for row in rows:
+            if row["metric_type_key"] not in self.by_type:
+                continue
+            series = (row["metric_type_key"], row["source_key"])
+            micros = to_micros(row["recorded_at"])
+            current = newest.get(series)
+            if current is None or micros >= current[0]:
+                newest[series] = (micros, row["value"])
+
+        for (metric_type_key, source_key), (micros, value) in newest.items():
+            seen = self.last_seen.setdefault(metric_type_key, {})
+            if micros < seen.get(source_key, -1):
+                # Backfilled points do not change the series' current state
+                continue
+            seen[source_key] = micros
+            for rule in self.by_type[metric_type_key]:
+                if not rule.applies_to(source_key):
+                    continue
+                if rule.kind == "threshold":
+                    self.transition(rule, source_key, rule.compare(value, rule.threshold), value, micros)
+                elif rule.kind == "rate":
+                    rate = self.rate(metric_type_key, source_key, rule.window, micros, value)
+                    if rate is not None:
+                        self.transition(rule, source_key, rule.compare(rate, rule.threshold), rate, micros)
+                else:
+                    self.transition(rule, source_key, False, None, micros)
+        self.schedule_flush()
+
+    def rate(self, metric_type_key: int, source_key: int, window: int, micros: int, value: float) -> Optional[float]:
+        """Change per second from the oldest point within the window of the hot store series to the newest."""
+        hot_store = get_hot_store()
+        series = hot_store.series.get(metric_type_key, {}).get(source_key) if hot_store is not None else None
+        if series is None:
+            return None
+        oldest = None
+        for point_micros, point_value, _, _ in series.newest():
+            if point_micros < micros - window:
+                break
+            oldest = (point_micros, point_value)
+        if oldest is None or oldest[0] >= micros:
+            return None
+        return (value - oldest[1]) / ((micros - oldest[0]) / 1_000_000)
+
+    def sweep(self):
+        """Fire absence rules for sources that have gone quiet."""
+        if not is_leader():
+            return
+        now = to_micros(utc_now())
+        for rules in self.by_type.values():
+            for rule in rules:
+                if rule.kind != "absence":
+                    continue
+                seen = self.last_seen.get(rule.metric_type_key, {})
+                sources = [rule.source_key] if rule.source_key is not None else list(seen)
+                for source_key in sources:
+                    if now - seen.get(source_key, rule.since) > rule.window:
+                        self.transition(rule, source_key, True, None, now)
+        self.schedule_flush()
+
+    def transition(self, rule: CompiledRule, source_key: int, active: bool, value: Optional[float], micros: int):
+        # Followers keep last_seen current and wait for the leader's alerts
+        if not is_leader():
+            return
+        row = rule.firing.get(source_key)
+        if active and row is None:
+            row = rule.firing[source_key] = {
+                "id": uuid.uuid4(),
+                "rule_id": rule.id,
+                "source_key": source_key,
+                "value": value,
+                "fired_at": from_micros(micros),
+                "resolved_at": None,
+            }
+            self.pending.append(("fired", row))
+        elif not active and row is not None:
+            del rule.firing[source_key]
+            row["resolved_at"] = max(from_micros(micros), row["fired_at"])
+            self.pending.append(("resolved", row))
+
+    def schedule_flush(self):
+        if self.pending and self.session_factory is not None and (self.flushing is None or self.flushing.done()):
+            self.flushing = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        """Write pending alerts, then publish them."""
+        while self.pending:
+            batch, self.pending = self.pending, []
+            # Rows of rules deleted in the meantime
+            batch = [(state, row) for state, row in batch if row["rule_id"] in self.rules]
+            fired = [row for state, row in batch if state == "fired"]
+            resolved = [row for state, row in batch if state == "resolved"]
+            try:
+                async with self.session_factory() as db:
+                    if fired:
+                        await db.execute(insert(Alert.__table__), [dict(row, resolved_at=None) for row in fired])
+                    if resolved:
+                        await db.execute(
+                            update(Alert.__table__)
+                            .where(Alert.id == bindparam("alert_id"))
+                            .values(resolved_at=bindparam("resolved")),
+                            [{"alert_id": row["id"], "resolved": row["resolved_at"]} for row in resolved]
+                        )
+                    await db.commit()
+                    missing = {row["source_key"] for _, row in batch} - set(self.source_ids)
+                    if missing:
+                        self.source_ids.update(
+                            (await db.execute(select(Source.key, Source.id).where(Source.key.in_(missing)))).all()
+                        )
+            except Exception:
+                # Retried on the next write or sweep
+                logger.exception("Failed to record alerts")
+                self.pending[:0] = batch
+                return
+
+            # Rules deleted while the batch was written are skipped
+            published = []
+            for state, row in batch:
+                rule = self.rules.get(row["rule_id"])
+                if rule is None:
+                    continue
+                payload = self.payload(rule, state, row)
+                self.publish_alert(state, payload)
+                published.append([state, row["source_key"], payload])
+            if published:
+                publish(ALERTS_CHANNEL, {"kind": "alerts", "alerts": published})
+
+    def publish_alert(self, state: str, payload: Dict[str, Any]):
+        if state == "fired":
+            self.published[UUID(payload["alert_id"])] = payload
+        else:
+            self.published.pop(UUID(payload["alert_id"]), None)
+        self.events.publish(state, payload)
+
+    async def apply_message(self, message: Dict[str, Any]):
+        """Apply alerts fired or resolved, or a rule created or deleted, by another worker."""
+        kind = message["kind"]
+        if kind == "alerts":
+            for state, source_key, payload in message["alerts"]:
+                rule = self.rules.get(UUID(payload["rule_id"]))
+                if rule is not None:
+                    # Kept so that this worker carries on if it becomes the leader
+                    if state == "fired":
+                        rule.firing[source_key] = {
+                            "id": UUID(payload["alert_id"]),
+                            "rule_id": rule.id,
+                            "source_key": source_key,
+                            "value": payload["value"],
+                            "fired_at": datetime.fromisoformat(payload["fired_at"]),
+                            "resolved_at": None,
+                        }
+                    else:
+                        rule.firing.pop(source_key, None)
+                self.publish_alert(state, payload)
+        elif kind == "rule_added":
+            async with self.session_factory() as db:
+                rule = await db.scalar(
+                    select(AlertRule).options(selectinload(AlertRule.metric_type)).where(AlertRule.id == UUID(message["rule_id"]))
+                )
+            if rule is not None:
+                self.add_rule(rule)
+        elif kind == "rule_removed":
+            self.remove_rule(UUID(message["rule_id"]))
+
+    def payload(self, rule: CompiledRule, state: str, row: dict) -> Dict[str, Any]:
+        return {
+            "alert_id": str(row["id"]),
+            "rule_id": str(rule.id),
+            "rule": rule.name,
+            "kind": rule.kind,
+            "metric_type_id": str(rule.metric_type_id),
+            "source_id": str(self.source_ids[row["source_key"]]) if row["source_key"] in self.source_ids else None,
+            "state": state,
+            "value": row["value"],
+            "fired_at": row["fired_at"].isoformat(),
+            "resolved_at": row["resolved_at"].isoformat() if row["resolved_at"] and state == "resolved" else None,
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"seq": self.events.seq, "firing": list(self.published.values())}
+
+
+def alert_row(alert: Alert) -> dict:
+    return {
+        "id": alert.id,
+        "rule_id": alert.rule_id,
+        "source_key": alert.source_key,
+        "value": alert.value,
+        "fired_at": alert.fired_at,
+        "resolved_at": alert.resolved_at,
+    }
+
+
+@lru_cache()
+def get_alert_engine() -> AlertEngine:
+    return AlertEngine()
+
+
+registry.gauge("alerts_pending", "Alert transitions waiting to be written.", lambda: len(get_alert_engine().pending))
+
+
+def start_alert_sweeps(engine: AlertEngine, interval: float = SWEEP_INTERVAL) -> asyncio.Task:
+    """Check absence rules, and retry failed alert writes, every ``interval`` seconds."""
+    async def sweep_task():
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                engine.sweep()
+            except Exception:
+                logger.exception("Alert sweep failed")
+
+    return asyncio.create_task(sweep_task())
+
+
+# Alert rule and alert endpoints
+router = APIRouter(prefix="/api/alerts", tags=["alerts"])
+
+
+@router.post("/rules", response_model=AlertRuleSchema)
+async def create_alert_rule(
+    rule: AlertRuleCreate,
+    db: AsyncSession = Depends(get_write_db),
+    principal: Principal = Depends(require_scope(SCOPE_ADMIN))
+):
+    """Create an alert rule; it is evaluated from the next write on."""
+    if await db.scalar(select(AlertRule.id).where(AlertRule.name == rule.name)):
+        raise HTTPException(status_code=400, detail=f"Alert rule '{rule.name}' already exists")
+    metric_type_key = await db.scalar(select(MetricType.key).where(MetricType.id == rule.metric_type_id))
+    if metric_type_key is None:
+        raise HTTPException(status_code=404, detail="Metric type not found")
+    source_key = None
+    if rule.source_id is not None:
+        source_key = await db.scalar(select(Source.key).where(Source.id == rule.source_id))
+        if source_key is None:
+            raise HTTPException(status_code=404, detail="Source not found")
+
+    db_rule = AlertRule(
+        **rule.model_dump(exclude={"metric_type_id", "source_id"}),
+        metric_type_key=metric_type_key,
+        source_key=source_key
+    )
+    db.add(db_rule)
+    await db.commit()
+    await db.refresh(db_rule, ["metric_type", "source"])
+
+    get_alert_engine().add_rule(db_rule)
+    publish(ALERTS_CHANNEL, {"kind": "rule_added", "rule_id": str(db_rule.id)})
+    return db_rule
+
+
+@router.get("/rules", response_model=List[AlertRuleSchema])
+async def list_alert_rules(db: AsyncSession = Depends(get_read_db)):
+    """List alert rules."""
+    result = await db.execute(
+        select(AlertRule)
+        .options(selectinload(AlertRule.metric_type), selectinload(AlertRule.source))
+        .order_by(AlertRule.name)
+    )
+    return result.scalars().all()
+
+
+@router.delete("/rules/{rule_id}", response_model=AlertRuleSchema)
+async def delete_alert_rule(
+    rule_id: UUID,
+    db: AsyncSession = Depends(get_write_db),
+    principal: Principal = Depends(require_scope(SCOPE_ADMIN))
+):
+    """Delete an alert rule and its alerts."""
+    result = await db.execute(
+        select(AlertRule)
+        .options(selectinload(AlertRule.metric_type), selectinload(AlertRule.source), selectinload(AlertRule.alerts))
+        .where(AlertRule.id == rule_id)
+    )
+    db_rule = result.scalar_one_or_none()
+    if not db_rule:
+        raise HTTPException(status_code=404, detail="Alert rule not found")
+
+    get_alert_engine().remove_rule(db_rule.id)
+    publish(ALERTS_CHANNEL, {"kind": "rule_removed", "rule_id": str(db_rule.id)})
+    await db.delete(db_rule)
+    await db.commit()
+    return db_rule
+
+
+@router.get("", response_model=List[AlertSchema])
+async def list_alerts(
+    firing: Optional[bool] = None,
+    rule_id: Optional[UUID] = None,
+    limit: int = 100,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """List alerts, newest first, optionally only those firing (or resolved) or of one rule."""
+    query = select(Alert).options(selectinload(Alert.source))
+    if firing is not None:
+        query = query.where(Alert.resolved_at.is_(None) if firing else Alert.resolved_at.is_not(None))
+    if rule_id is not None:
+        query = query.where(Alert.rule_id == rule_id)
+    result = await db.execute(query.order_by(Alert.fired_at.desc()).limit(limit))
+    return result.scalars().all()
+
+
+@router.get("/events")
+async def alert_event_feed(request: Request, since: Optional[int] = None):
+    """Push feed of alerts as Server-Sent Events.
+
+    The first message is a ``snapshot`` of the alerts firing, followed by
+    ``fired`` and ``resolved`` events; deleting a rule resolves the alerts
+    it had firing. Reconnecting with ``since`` (or
+    Last-Event-ID) replays only the missed events while they are still in
+    the history.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    if since is None and last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    engine = get_alert_engine()
+    return StreamingResponse(
+        engine.events.stream(request, engine.snapshot, since),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
@@ -0,0 +1,285 @@
+"""Columnar archive of old metric partitions.
+
+Partitions older than ``ARCHIVE_AFTER_DAYS`` are moved out of the database
+into Parquet files under ``ARCHIVE_DIR``, one per metric type and
+partition period::
+
+    ARCHIVE_DIR/metric_type=3/20260901-20260902.parquet
+
+Each file holds the period's rows for that type sorted by recorded_at,
+with their min/max recorded_at and value in the footer, so a range query
+opens only the files that can match. Files are memory-mapped when read and
+filtered with Arrow compute kernels, and the history endpoint merges them
+with the rows still in the database. Metric metadata stays in the
+database.
+
+Archiving needs the optional ``pyarrow`` package.
+"""
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import date, datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from .config import get_settings
+from .models import MetricMetadata, MetricType, Source
+from .partitions import midnight, retention_cutoff
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+COLUMNS = ("id", "metric_type_key", "source_key", "value", "recorded_at")
+FILE_DATE_FORMAT = "%Y%m%d"
+
+# Rows per Parquet row group; each group's min/max recorded_at lets a range
+# read skip the groups outside it
+ROW_GROUP_SIZE = 64 * 1024
+
+# Metadata rows fetched per query for archived metrics
+METADATA_CHUNK_SIZE = 500
+
+
+def archive_schema() -> "pa.Schema":
+    return pa.schema([
+        ("id", pa.int64()),
+        ("metric_type_key", pa.int32()),
+        ("source_key", pa.int32()),
+        ("value", pa.float64()),
+        ("recorded_at", pa.timestamp("us")),
+    ])
+
+
+class ArchiveFile:
+    """One archived period of one metric type, described by its footer."""
+
+    __slots__ = ("path", "start", "end", "min_recorded_at", "max_recorded_at", "min_value", "max_value", "rows")
+
+    def __init__(self, path: Path, start: date, end: date):
+        self.path = path
+        self.start = start
+        self.end = end
+        footer = pq.read_metadata(path).metadata or {}
+        self.min_recorded_at = datetime.fromisoformat(footer[b"min_recorded_at"].decode())
+        self.max_recorded_at = datetime.fromisoformat(footer[b"max_recorded_at"].decode())
+        self.min_value = float(footer[b"min_value"])
+        self.max_value = float(footer[b"max_value"])
+        self.rows = int(footer[b"rows"])
+
+    def overlaps(self, start: Optional[datetime], end: Optional[datetime]) -> bool:
+        return (start is None or self.max_recorded_at >= start) and (end is None or self.min_recorded_at < end)
+
+
+class MetricArchive:
+    """Parquet files holding metrics moved out of the database."""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        # Footers keyed by path and modification time
+        self.footers: Dict[Tuple[Path, int], ArchiveFile] = {}
+
+    def path(self, metric_type_key: int, start: date, end: date) -> Path:
+        name = f"{start.strftime(FILE_DATE_FORMAT)}-{end.strftime(FILE_DATE_FORMAT)}.parquet"
+        return self.root / f"metric_type={metric_type_key}" / name
+
+    def write(self, start: date, end: date, columns: Dict[str, Sequence]) -> List[Path]:
+        """Write one partition period's rows, one file per metric type.
+
+        Rows already in a type's file are kept unless the same id is being
+        written again, so archiving a period twice, or archiving rows that
+        arrived after it was first archived, never duplicates or loses rows.
+        """
+        table = pa.table({name: columns[name] for name in COLUMNS}, schema=archive_schema())
+        written = []
+        for metric_type_key in pc.unique(table["metric_type_key"]).to_pylist():
+            rows = table.filter(pc.equal(table["metric_type_key"], metric_type_key))
+            path = self.path(metric_type_key, start, end)
+            if path.exists():
+                existing = pq.read_table(path, schema=archive_schema())
+                existing = existing.filter(pc.invert(pc.is_in(existing["id"], value_set=rows["id"])))
+                rows = pa.concat_tables([existing, rows])
+            rows = rows.sort_by("recorded_at")
+            write_file(path, rows)
+            written.append(path)
+        return written
+
+    def files(
+        self, start: Optional[datetime] = None, end: Optional[datetime] = None, metric_type_key: Optional[int] = None
+    ) -> List[ArchiveFile]:
+        """Archive files that may hold rows recorded in [start, end), oldest first."""
+        if not self.root.is_dir():
+            return []
+        directories = [self.root / f"metric_type={metric_type_key}"] if metric_type_key is not None else [
+            directory for directory in self.root.iterdir() if directory.name.startswith("metric_type=")
+        ]
+        found = []
+        for directory in directories:
+            if not directory.is_dir():
+                continue
+            for path in directory.glob("*.parquet"):
+                try:
+                    first, last = (datetime.strptime(part, FILE_DATE_FORMAT).date() for part in path.stem.split("-"))
+                except ValueError:
+                    continue
+                # The period in the name rules most files out before their footers are read
+                if (start is not None and midnight(last) <= start) or (end is not None and midnight(first) >= end):
+                    continue
+                archive_file = self.footer(path, first, last)
+                if archive_file.overlaps(start, end):
+                    found.append(archive_file)
+        return sorted(found, key=lambda archive_file: archive_file.start)
+
+    def footer(self, path: Path, start: date, end: date) -> ArchiveFile:
+        key = (path, path.stat().st_mtime_ns)
+        archive_file = self.footers.get(key)
+        if archive_file is None:
+            archive_file = self.footers[key] = ArchiveFile(path, start, end)
+        return archive_file
+
+    def scan(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        metric_type_key: Optional[int] = None,
+        source_key: Optional[int] = None
+    ) -> "pa.Table":
+        """Archived rows recorded in [start, end), oldest first, as an Arrow table.
+
+        Expired rows (see METRIC_RETENTION_DAYS) are left out, as they are
+        for partitions.
+        """
+        cutoff = retention_cutoff()
+        if cutoff is not None and (start is None or start < cutoff):
+            start = cutoff
+        tables = []
+        for archive_file in self.files(start, end, metric_type_key):
+            filters = []
+            if start is not None and archive_file.min_recorded_at < start:
+                filters.append(("recorded_at", ">=", pa.scalar(start, pa.timestamp("us"))))
+            if end is not None and archive_file.max_recorded_at >= end:
+                filters.append(("recorded_at", "<", pa.scalar(end, pa.timestamp("us"))))
+            if source_key is not None:
+                filters.append(("source_key", "=", source_key))
+            tables.append(
+                pq.read_table(archive_file.path, schema=archive_schema(), memory_map=True, filters=filters or None)
+            )
+        if not tables:
+            return archive_schema().empty_table()
+        table = pa.concat_tables(tables)
+        # One type's files are already in order; several types' files interleave
+        return table if metric_type_key is not None else table.sort_by("recorded_at")
+
+    def expire(self, cutoff: datetime) -> List[str]:
+        """Delete files whose period ended before ``cutoff``."""
+        removed = []
+        for archive_file in self.files(end=cutoff):
+            if midnight(archive_file.end) <= cutoff:
+                archive_file.path.unlink()
+                removed.append(str(archive_file.path.relative_to(self.root)))
+        return removed
+
+
+def write_file(path: Path, table: "pa.Table"):
+    """Write a Parquet file with the table's min/max in its footer, replacing any existing file atomically."""
+    recorded_at = pc.min_max(table["recorded_at"])
+    values = pc.min_max(table["value"])
+    table = table.replace_schema_metadata({
+        "min_recorded_at": recorded_at["min"].as_py().isoformat(),
+        "max_recorded_at": recorded_at["max"].as_py().isoformat(),
+        "min_value": repr(values["min"].as_py()),
+        "max_value": repr(values["max"].as_py()),
+        "rows": str(table.num_rows),
+    })
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f".{path.name}.tmp")
+    pq.write_table(table, temporary, compression="zstd", row_group_size=ROW_GROUP_SIZE)
+    os.replace(temporary, path)
+
+
+@lru_cache()
+def get_archive() -> Optional[MetricArchive]:
+    """Create the archive from settings, or None when archiving is disabled."""
+    if not settings.ARCHIVE_DIR:
+        return None
+    if pa is None:
+        raise RuntimeError("ARCHIVE_DIR requires the 'pyarrow' package")
+    return MetricArchive(settings.ARCHIVE_DIR)
+
+
+class ArchivedMetric:
+    """A metric read back from the archive, with the attributes of models.Metric that responses use."""
+
+    __slots__ = ("id", "value", "recorded_at", "metric_type", "source", "metric_metadata_items")
+
+    def __init__(self, id, value, recorded_at, metric_type, source, metric_metadata_items):
+        self.id = id
+        self.value = value
+        self.recorded_at = recorded_at
+        self.metric_type = metric_type
+        self.source = source
+        self.metric_metadata_items = metric_metadata_items
+
+    @property
+    def metric_type_id(self):
+        return self.metric_type.id
+
+    @property
+    def source_id(self):
+        return self.source.id
+
+
+async def archived_metrics(
+    db: AsyncSession,
+    archive: MetricArchive,
+    start: datetime,
+    end: datetime,
+    metric_type_key: Optional[int] = None,
+    source_key: Optional[int] = None,
+    limit: Optional[int] = None
+) -> List[ArchivedMetric]:
+    """Archived metrics recorded in [start, end), oldest first, with their types, sources and metadata."""
+    table = await asyncio.to_thread(archive.scan, start, end, metric_type_key, source_key)
+    if limit is not None:
+        table = table.slice(0, limit)
+    if table.num_rows == 0:
+        return []
+    columns = table.to_pydict()
+
+    result = await db.execute(
+        select(MetricType)
+        .options(selectinload(MetricType.unit))
+        .where(MetricType.key.in_(set(columns["metric_type_key"])))
+    )
+    metric_types = {metric_type.key: metric_type for metric_type in result.scalars()}
+    result = await db.execute(select(Source).where(Source.key.in_(set(columns["source_key"]))))
+    sources = {source.key: source for source in result.scalars()}
+
+    metadata = defaultdict(list)
+    ids = columns["id"]
+    for i in range(0, len(ids), METADATA_CHUNK_SIZE):
+        result = await db.execute(
+            select(MetricMetadata).where(MetricMetadata.metric_id.in_(ids[i:i + METADATA_CHUNK_SIZE]))
+        )
+        for item in result.scalars():
+            metadata[item.metric_id].append(item)
+
+    return [
+        ArchivedMetric(metric_id, value, recorded_at, metric_types[type_key], sources[source_key], metadata[metric_id])
+        for metric_id, type_key, source_key, value, recorded_at in zip(*(columns[name] for name in COLUMNS))
+        # Rows of deleted metric types or sources
+        if type_key in metric_types and source_key in sources
+    ]
@@ -0,0 +1,199 @@
+import hashlib
+import logging
+import secrets
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Security
+from fastapi.security.api_key import APIKeyHeader
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import get_settings
+from .database import get_db, get_session_factory, get_write_db
+from .models import ApiKey
+from .schemas import ApiKey as ApiKeySchema, ApiKeyCreate, ApiKeyIssued
+from .shared_state import publish
+
+logger = logging.getLogger(__name__)
+
+# Scopes that can be granted to a key
+SCOPE_INGEST = "ingest"  # Write metrics, sources, units and metric types
+SCOPE_READ = "read"  # Read relay state and command output
+SCOPE_RELAY_AGENT = "relay-agent"  # Register, heartbeat, fetch commands and report results
+SCOPE_ADMIN = "admin"  # Everything, including sending commands and managing keys
+ALL_SCOPES = frozenset({SCOPE_INGEST, SCOPE_READ, SCOPE_RELAY_AGENT, SCOPE_ADMIN})
+
+# Channel issued and revoked keys are announced on; other workers reload their keys
+KEYS_CHANNEL = "keys"
+
+
+class Principal(BaseModel):
+    """The holder of a verified API key."""
+    name: str
+    key_hash: str
+    scopes: FrozenSet[str]
+    key_id: Optional[UUID] = None
+
+    def has_scope(self, scope: str) -> bool:
+        return SCOPE_ADMIN in self.scopes or scope in self.scopes
+
+
+def hash_api_key(api_key: str) -> str:
+    """Return the hex SHA-256 digest under which a key is stored."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+class KeyStore:
+    """In-memory index of accepted API keys, keyed by their SHA-256 digest.
+
+    Verifying a key costs one hash and one dict lookup however many keys are
+    issued, so per-agent keys add no database round trips. Nothing compares
+    the key itself: the dict lookup compares SHA-256 digests, and the time it
+    takes reveals at most a prefix of a digest, which does not help to find
+    the key. That, not a constant-time comparison, is what makes verifying
+    safe against timing attacks.
+    """
+
+    def __init__(self):
+        self._principals: Dict[str, Principal] = {}
+
+    def __len__(self) -> int:
+        return len(self._principals)
+
+    def add(self, principal: Principal):
+        self._principals[principal.key_hash] = principal
+
+    def remove(self, key_hash: str):
+        self._principals.pop(key_hash, None)
+
+    def replace_db_keys(self, principals: Iterable[Principal]):
+        """Swap in the current set of database-issued keys, keeping configured ones."""
+        self._principals = {
+            key_hash: principal
+            for key_hash, principal in self._principals.items()
+            if principal.key_id is None
+        }
+        for principal in principals:
+            self.add(principal)
+
+    def verify(self, api_key: str) -> Optional[Principal]:
+        return self._principals.get(hash_api_key(api_key))
+
+
+@lru_cache()
+def get_key_store() -> KeyStore:
+    """Create the key store with the keys configured in settings."""
+    settings = get_settings()
+    store = KeyStore()
+    store.add(Principal(name="default", key_hash=hash_api_key(settings.API_KEY), scopes=frozenset({SCOPE_ADMIN})))
+    for name, key_hash, scopes in settings.api_keys_list:
+        store.add(Principal(name=name, key_hash=key_hash, scopes=frozenset(scopes)))
+    return store
+
+
+def principal_from_model(api_key: ApiKey) -> Principal:
+    return Principal(
+        name=api_key.name,
+        key_hash=api_key.key_hash,
+        scopes=frozenset(api_key.scopes.split()),
+        key_id=api_key.id,
+    )
+
+
+async def load_api_keys():
+    """Load active database-issued keys into the key store."""
+    async with get_session_factory()() as db:
+        result = await db.execute(select(ApiKey).where(ApiKey.is_active == True))  # noqa: E712
+        principals = [principal_from_model(api_key) for api_key in result.scalars().all()]
+    get_key_store().replace_db_keys(principals)
+    logger.info(f"Loaded {len(principals)} API keys")
+
+
+api_key_header = APIKeyHeader(name="X-API-Key")
+
+
+@lru_cache()
+def require_scope(scope: str):
+    """Build a dependency that accepts keys granted the given scope.
+
+    The dependency is cached per scope so FastAPI can share it between routes.
+    """
+    async def verify_api_key(api_key: str = Security(api_key_header)) -> Principal:
+        principal = get_key_store().verify(api_key)
+        if principal is None or not principal.has_scope(scope):
+            raise HTTPException(
+                status_code=403,
+                detail="Could not validate API key"
+            )
+        return principal
+
+    return verify_api_key
+
+
+# Key management endpoints
+router = APIRouter(prefix="/api/keys", tags=["auth"])
+
+
+@router.post("", response_model=ApiKeyIssued)
+async def issue_api_key(
+    key_request: ApiKeyCreate,
+    db: AsyncSession = Depends(get_write_db),
+    principal: Principal = Depends(require_scope(SCOPE_ADMIN))
+):
+    """Issue a new API key. The plaintext key is only returned here."""
+    result = await db.execute(select(ApiKey).where(ApiKey.name == key_request.name))
+    if result.scalar_one_or_none():
+        raise HTTPException(
+            status_code=400,
+            detail=f"API key with name '{key_request.name}' already exists"
+        )
+
+    plaintext = secrets.token_urlsafe(32)
+    db_key = ApiKey(
+        name=key_request.name,
+        key_hash=hash_api_key(plaintext),
+        scopes=" ".join(key_request.scopes),
+    )
+    db.add(db_key)
+    await db.commit()
+    await db.refresh(db_key)
+
+    get_key_store().add(principal_from_model(db_key))
+    publish(KEYS_CHANNEL, {"key_id": str(db_key.id)})
+    logger.info(f"API key issued: {db_key.name} ({db_key.scopes})")
+    return ApiKeyIssued(**ApiKeySchema.model_validate(db_key).model_dump(), key=plaintext)
+
+
+@router.get("", response_model=List[ApiKeySchema])
+async def list_api_keys(
+    db: AsyncSession = Depends(get_db),
+    principal: Principal = Depends(require_scope(SCOPE_ADMIN))
+):
+    """List issued API keys."""
+    result = await db.execute(select(ApiKey).order_by(ApiKey.name))
+    return result.scalars().all()
+
+
+@router.delete("/{key_id}", response_model=ApiKeySchema)
+async def revoke_api_key(
+    key_id: UUID,
+    db: AsyncSession = Depends(get_write_db),
+    principal: Principal = Depends(require_scope(SCOPE_ADMIN))
+):
+    """Revoke an API key; it stops being accepted immediately."""
+    result = await db.execute(select(ApiKey).where(ApiKey.id == key_id))
+    db_key = result.scalar_one_or_none()
+    if not db_key:
+        raise HTTPException(status_code=404, detail="API key not found")
+
+    db_key.is_active = False
+    await db.commit()
+    await db.refresh(db_key)
+
+    get_key_store().remove(db_key.key_hash)
+    publish(KEYS_CHANNEL, {"key_id": str(db_key.id)})
+    logger.info(f"API key revoked: {db_key.name}")
+    return db_key
@@ -1,9 +1,24 @@
-from fastapi import Depends, HTTPException, Header, Request, APIRouter
-from typing import Dict, List, Any, Optional
+from fastapi import Depends, HTTPException, Request, APIRouter
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Any, Optional, Set, Tuple
+from collections import Counter
+from datetime import datetime, timezone
+import asyncio
 import uuid
 import time
 import logging
 from pydantic import BaseModel, Field
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .auth import SCOPE_ADMIN, SCOPE_READ, SCOPE_RELAY_AGENT, Principal, require_scope
+from .config import get_settings
+from .database import get_write_db, get_write_session_factory
+from .instrumentation import registry
+from .models import RelayClient, Source
+from .shared_state import get_state_backend, is_leader, publish
+from .streaming import SSE_HEADERS, SSE_KEEPALIVE, EventFeed, format_sse
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -51,6 +66,25 @@ class CommandStatus(BaseModel):
     stdout: Optional[str] = None
     stderr: Optional[str] = None
 
+class CommandOutputChunk(BaseModel):
+    client_id: str
+    stream: str = "stdout"  # stdout or stderr
+    data: str
+    offset: Optional[int] = Field(None, ge=0)  # Byte offset the chunk starts at, used to make retries idempotent
+
+class CommandOutputAck(BaseModel):
+    command_id: str
+    stream: str
+    next_offset: int
+
+class CommandOutput(BaseModel):
+    command_id: str
+    stream: str
+    offset: int
+    next_offset: int
+    data: str
+    status: str
+
 class ClientInfo(BaseModel):
     client_id: str
     client_type: str
@@ -59,23 +93,55 @@ class ClientInfo(BaseModel):
     last_seen: float
     status: str
     last_command_id: Optional[str] = None
+    source_id: Optional[uuid.UUID] = None  # The metric source on the same host
 
-# In-memory storage
+# In-memory storage; clients are also kept in the relay_clients table
 clients: Dict[str, ClientInfo] = {}
 commands: List[CommandStatus] = []
 
+# Clients whose contact or status changed since the registry was last written
+dirty_clients: Set[str] = set()
+CLIENT_REMOVE_AFTER = 60 * 60  # Seconds without contact before a client is dropped from memory
+
+# Incremental command output, keyed by command_id and then stream name
+OUTPUT_STREAMS = ("stdout", "stderr")
+MAX_OUTPUT_BYTES = 10 * 1024 * 1024  # Per stream
+FINISHED_STATUSES = ("completed", "failed", "timeout")
+command_output: Dict[str, Dict[str, bytearray]] = {}
+output_waiters: Dict[str, asyncio.Event] = {}
+
+# Push feed of client and command state changes for the relay console
+relay_events = EventFeed()
+CLIENT_OFFLINE_AFTER = 120  # Seconds without contact before a client is reported offline
+FEED_COMMAND_LIMIT = 50  # Commands included in a feed snapshot
+
+# With several workers every change is replicated to the others over the
+# shared state backend, and each command is handed to its agent once
+RELAY_CHANNEL = "relay"
+CLIENT_REPLICATE_EVERY = 10  # Seconds between replicated contact updates of one client
+COMMAND_CLAIM_TTL = 24 * 60 * 60  # Seconds a command's dispatch claim is kept
+replicated_contact: Dict[str, float] = {}
+
+# Instrumentation of the relay store
+relay_commands = registry.counter("relay_commands", "Command status transitions.", ("status",))
+relay_heartbeats = registry.counter("relay_heartbeats", "Client heartbeats received.")
+relay_output_bytes = registry.counter("relay_output_bytes", "Command output bytes received.", ("stream",))
+registry.gauge("relay_clients", "Clients held by the relay.", lambda: Counter(c.status for c in clients.values()), ("status",))
+registry.gauge("relay_stored_commands", "Commands held by the relay.", lambda: Counter(c.status for c in commands), ("status",))
+registry.gauge(
+    "relay_stored_output_bytes", "Command output held by the relay.",
+    lambda: sum(len(buffer) for buffers in command_output.values() for buffer in buffers.values())
+)
+registry.gauge("relay_event_subscribers", "Relay event feed subscribers.", lambda: len(relay_events.subscribers))
+registry.gauge("relay_registry_pending", "Clients with contact waiting to be written.", lambda: len(dirty_clients))
+
 # Create router
 router = APIRouter(prefix="/api", tags=["command-relay"])
 
-# Authentication dependency
-async def get_api_key(x_api_key: str = Header(..., description="API Key for authentication")):
-    """Validate API key."""
-    from .config import get_settings
-    settings = get_settings()
-    
-    if x_api_key != settings.API_KEY:
-        raise HTTPException(status_code=403, detail="Invalid API key")
-    return x_api_key
+# Authentication dependencies: agents drive commands, operators read and send them
+require_agent = require_scope(SCOPE_RELAY_AGENT)
+require_reader = require_scope(SCOPE_READ)
+require_operator = require_scope(SCOPE_ADMIN)
 
 # Utility functions
 def cleanup_old_data():
@@ -84,28 +150,326 @@ def cleanup_old_data():
     current_time = time.time()
     
     # Remove commands older than 7 days
+    expired_commands = [cmd for cmd in commands if current_time - cmd.created_at >= 7 * 24 * 60 * 60]
     commands = [cmd for cmd in commands if current_time - cmd.created_at < 7 * 24 * 60 * 60]
+    for cmd in expired_commands:
+        relay_events.publish("command_removed", {"command_id": cmd.command_id})
+    
+    # Drop buffered output of removed commands
+    live_command_ids = {cmd.command_id for cmd in commands}
+    for command_id in list(command_output):
+        if command_id not in live_command_ids:
+            del command_output[command_id]
     
-    # Remove clients inactive for more than 1 hour
+    # Remove clients inactive for more than 1 hour; their registry rows are kept
     inactive_clients = []
     for client_id, client in clients.items():
-        if current_time - client.last_seen > 60 * 60:  # 1 hour
+        if current_time - client.last_seen > CLIENT_REMOVE_AFTER:
             inactive_clients.append(client_id)
     
     for client_id in inactive_clients:
         del clients[client_id]
+        dirty_clients.discard(client_id)
+        relay_events.publish("client_removed", {"client_id": client_id})
     
     if inactive_clients:
         logger.info(f"Removed {len(inactive_clients)} inactive clients")
 
+def command_summary(command: CommandStatus) -> Dict[str, Any]:
+    """Command fields sent on the event feed; output is fetched separately."""
+    return command.model_dump(exclude={"result", "stdout", "stderr"})
+
+def publish_client(client: ClientInfo):
+    """Publish the current state of a client on the event feed."""
+    relay_events.publish("client", client.model_dump(mode="json"))
+
+def replicate_client(client: ClientInfo):
+    """Send a client's state to the other workers."""
+    replicated_contact[client.client_id] = client.last_seen
+    publish(RELAY_CHANNEL, {"kind": "client", "client": client.model_dump(mode="json")})
+
+def replicate_contact(client: ClientInfo):
+    """Send a client's contact to the other workers at most every CLIENT_REPLICATE_EVERY seconds."""
+    if client.last_seen - replicated_contact.get(client.client_id, 0) >= CLIENT_REPLICATE_EVERY:
+        replicate_client(client)
+
+def replicate_command(command: CommandStatus):
+    """Send a command's state, including its result, to the other workers."""
+    publish(RELAY_CHANNEL, {"kind": "command", "command": command.model_dump()})
+
+def set_command_status(command: CommandStatus, status: str, updated_at: Optional[float] = None, replicate: bool = True):
+    """Move a command to a new status and publish the transition."""
+    command.updated_at = updated_at or time.time()
+    if command.status != status:
+        command.status = status
+        relay_commands.inc(status)
+        relay_events.publish("command", command_summary(command))
+        if replicate:
+            replicate_command(command)
+
+def touch_client(client_id: str, seen_at: Optional[float] = None):
+    """Record contact from a client, bringing it back online if needed."""
+    client = clients.get(client_id)
+    if client is None:
+        return
+    client.last_seen = seen_at or time.time()
+    dirty_clients.add(client_id)
+    if client.status == "offline":
+        client.status = "active"
+        publish_client(client)
+        replicate_client(client)
+    else:
+        replicate_contact(client)
+
+def mark_offline_clients():
+    """Report clients that have stopped making contact as offline."""
+    current_time = time.time()
+    for client in clients.values():
+        if client.status != "offline" and current_time - client.last_seen > CLIENT_OFFLINE_AFTER:
+            client.status = "offline"
+            dirty_clients.add(client.client_id)
+            publish_client(client)
+            replicate_client(client)
+
+def relay_snapshot() -> Dict[str, Any]:
+    """Full relay state sent to new event feed subscribers."""
+    recent_commands = sorted(commands, key=lambda cmd: cmd.created_at, reverse=True)
+    return {
+        "seq": relay_events.seq,
+        "clients": [client.model_dump(mode="json") for client in clients.values()],
+        "commands": [command_summary(cmd) for cmd in recent_commands[:FEED_COMMAND_LIMIT]],
+    }
+
+def find_command(command_id: str) -> CommandStatus:
+    """Look up a command or raise 404."""
+    command = next((cmd for cmd in commands if cmd.command_id == command_id), None)
+    if not command:
+        raise HTTPException(status_code=404, detail="Command not found")
+    return command
+
+def get_output_buffer(command_id: str, stream: str) -> bytearray:
+    """Return the output buffer of a command stream, creating it if needed."""
+    if stream not in OUTPUT_STREAMS:
+        raise HTTPException(status_code=400, detail=f"Unknown output stream '{stream}'")
+    buffers = command_output.setdefault(
+        command_id, {name: bytearray() for name in OUTPUT_STREAMS}
+    )
+    return buffers[stream]
+
+def is_continuation_byte(byte: int) -> bool:
+    return byte & 0xC0 == 0x80
+
+def read_output(buffer: bytearray, offset: int) -> Tuple[int, int, str]:
+    """Decode the output from a byte offset without splitting a UTF-8 character.
+
+    Returns (start, end, text): an offset inside a character moves back to
+    its first byte, and a character not fully received yet is left out, so
+    ``end`` is the offset to continue from.
+    """
+    start = min(max(offset, 0), len(buffer))
+    while 0 < start < len(buffer) and is_continuation_byte(buffer[start]):
+        start -= 1
+    end = len(buffer)
+    lead = end
+    while lead > start and end - lead < 4 and is_continuation_byte(buffer[lead - 1]):
+        lead -= 1
+    if lead > start:
+        lead -= 1
+        first = buffer[lead]
+        size = 4 if first >= 0xF0 else 3 if first >= 0xE0 else 2 if first >= 0xC0 else 1
+        if lead + size > end:
+            end = lead
+    return start, end, buffer[start:end].decode("utf-8", errors="replace")
+
+def notify_output(command_id: str):
+    """Wake up every viewer tailing the output of a command."""
+    event = output_waiters.pop(command_id, None)
+    if event:
+        event.set()
+
+def output_waiter(command_id: str) -> asyncio.Event:
+    """The event set by the next ``notify_output`` for a command.
+    
+    Viewers take it before reading the buffers, so output appended while
+    they send what they read still wakes them up.
+    """
+    return output_waiters.setdefault(command_id, asyncio.Event())
+
+async def wait_for_output(event: asyncio.Event, timeout: float) -> bool:
+    """Wait until new output is appended or the command changes state.
+    
+    Returns False if the timeout expired without any change.
+    """
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError:
+        return False
+    return True
+
+def finalize_output(command_id: str, stream: str, final_output: Optional[str]) -> Optional[str]:
+    """Reconcile the final output reported at completion with streamed chunks.
+
+    If the agent never streamed, the final output is copied into the buffer so
+    tailing viewers still receive it. If it did stream and sent no final
+    output, the buffered output becomes the command's output.
+    """
+    buffer = get_output_buffer(command_id, stream)
+    if final_output is None:
+        return read_output(buffer, 0)[2] if buffer else None
+    encoded = final_output.encode("utf-8")
+    if encoded.startswith(buffer):
+        buffer.extend(encoded[len(buffer):])
+    return final_output
+
+def apply_relay_message(message: Dict[str, Any]):
+    """Apply a change made by another worker and publish it on this worker's event feed."""
+    kind = message["kind"]
+    if kind == "client":
+        client = ClientInfo(**message["client"])
+        existing = clients.get(client.client_id)
+        if existing is not None:
+            client.last_seen = max(client.last_seen, existing.last_seen)
+        clients[client.client_id] = client
+        if existing is None or existing.status != client.status:
+            publish_client(client)
+    elif kind == "command":
+        status_update = CommandStatus(**message["command"])
+        command = next((cmd for cmd in commands if cmd.command_id == status_update.command_id), None)
+        if command is None:
+            commands.append(status_update)
+            relay_events.publish("command", command_summary(status_update))
+            command = status_update
+        else:
+            changed = command.status != status_update.status
+            for field, value in status_update:
+                setattr(command, field, value)
+            if changed:
+                relay_events.publish("command", command_summary(command))
+        if command.status in FINISHED_STATUSES:
+            for stream in OUTPUT_STREAMS:
+                finalize_output(command.command_id, stream, getattr(command, stream))
+        notify_output(command.command_id)
+    elif kind == "output":
+        # Latin-1 maps bytes to characters one to one, so chunks survive JSON unchanged
+        buffer = get_output_buffer(message["command_id"], message["stream"])
+        data = message["data"].encode("latin-1")
+        if message["offset"] <= len(buffer):
+            buffer.extend(data[len(buffer) - message["offset"]:])
+        command = next((cmd for cmd in commands if cmd.command_id == message["command_id"]), None)
+        if command is not None:
+            command.updated_at = max(command.updated_at or 0, message["updated_at"])
+        notify_output(message["command_id"])
+    elif kind == "sync" and is_leader():
+        # A worker has started; send it the clients and the commands it may be asked about
+        for client in clients.values():
+            replicate_client(client)
+        recent = sorted(commands, key=lambda cmd: cmd.created_at, reverse=True)[:FEED_COMMAND_LIMIT]
+        for command in {cmd.command_id: cmd for cmd in recent + [cmd for cmd in commands if cmd.status not in FINISHED_STATUSES]}.values():
+            replicate_command(command)
+
+def to_datetime(timestamp: float) -> datetime:
+    """Unix timestamp to the naive UTC datetime the database stores."""
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+def to_timestamp(value: datetime) -> float:
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+async def link_source(db: AsyncSession, hostname: Optional[str], ip_address: Optional[str]) -> Optional[Source]:
+    """The metric source named after a client's hostname, created if needed.
+    
+    Collectors report metrics under the hostname of the machine, so the
+    relay client and the source describe the same host.
+    """
+    hostname = (hostname or "").strip()
+    if not hostname or hostname == "unknown":
+        return None
+    query = select(Source).where(Source.name == hostname)
+    source = (await db.execute(query)).scalar_one_or_none()
+    if source is not None:
+        return source
+    
+    source = Source(name=hostname)
+    try:
+        source.ip_address = ip_address
+    except ValueError:
+        pass  # Not an address the source accepts, such as a proxy's name
+    try:
+        async with db.begin_nested():
+            db.add(source)
+    except IntegrityError:
+        # Created by a concurrent registration or ingest
+        source = (await db.execute(query)).scalar_one()
+    return source
+
+async def load_clients(session_factory: async_sessionmaker):
+    """Restore the clients seen within CLIENT_REMOVE_AFTER from the registry."""
+    cutoff = to_datetime(time.time() - CLIENT_REMOVE_AFTER)
+    async with session_factory() as db:
+        result = await db.execute(
+            select(RelayClient, Source.id)
+            .outerjoin(Source, RelayClient.source_key == Source.key)
+            .where(RelayClient.last_seen_at >= cutoff)
+        )
+        for record, source_id in result.all():
+            clients.setdefault(record.client_id, ClientInfo(
+                client_id=record.client_id,
+                client_type=record.client_type,
+                hostname=record.hostname,
+                ip_address=record.ip_address,
+                last_seen=to_timestamp(record.last_seen_at),
+                status=record.status,
+                last_command_id=record.last_command_id,
+                source_id=source_id
+            ))
+    logger.info(f"Loaded {len(clients)} relay clients")
+
+async def flush_clients(session_factory: async_sessionmaker) -> int:
+    """Write the contact and status changes of clients in one batched UPDATE."""
+    client_ids = [client_id for client_id in dirty_clients if client_id in clients]
+    dirty_clients.clear()
+    if not client_ids:
+        return 0
+    try:
+        async with session_factory() as db:
+            await db.execute(
+                update(RelayClient.__table__)
+                .where(RelayClient.client_id == bindparam("id"))
+                .values(
+                    last_seen_at=bindparam("seen"),
+                    status=bindparam("state"),
+                    last_command_id=bindparam("command_id")
+                ),
+                [
+                    {
+                        "id": client_id,
+                        "seen": to_datetime(clients[client_id].last_seen),
+                        "state": clients[client_id].status,
+                        "command_id": clients[client_id].last_command_id
+                    }
+                    for client_id in client_ids
+                ]
+            )
+            await db.commit()
+    except Exception:
+        # Retried on the next flush
+        dirty_clients.update(client_ids)
+        raise
+    return len(client_ids)
+
 # Endpoints
 @router.post("/clients/register", response_model=ClientInfo)
 async def register_client(
     registration: ClientRegistration,
     request: Request,
-    api_key: str = Depends(get_api_key)
+    principal: Principal = Depends(require_agent),
+    db: AsyncSession = Depends(get_write_db)
 ):
-    """Register a new client or update existing client information."""
+    """Register a new client or update existing client information.
+    
+    Registration is written to the registry straight away and links the
+    client to the source with its hostname; later contact is written in
+    batches by flush_clients.
+    """
     current_time = time.time()
     
     # Generate client_id if not provided
@@ -114,6 +478,20 @@ async def register_client(
     # Get client IP address if not provided
     client_ip = registration.ip_address or request.client.host
     
+    source = await link_source(db, registration.hostname, client_ip)
+    await db.merge(RelayClient(
+        client_id=client_id,
+        source_key=source.key if source else None,
+        client_type=registration.client_type,
+        hostname=registration.hostname,
+        ip_address=client_ip,
+        status="active",
+        last_command_id=None,
+        registered_at=to_datetime(current_time),
+        last_seen_at=to_datetime(current_time)
+    ))
+    await db.commit()
+    
     # Create or update client info
     clients[client_id] = ClientInfo(
         client_id=client_id,
@@ -121,8 +499,12 @@ async def register_client(
         hostname=registration.hostname,
         ip_address=client_ip,
         last_seen=current_time,
-        status="active"
+        status="active",
+        source_id=source.id if source else None
     )
+    dirty_clients.discard(client_id)
+    publish_client(clients[client_id])
+    replicate_client(clients[client_id])
     
     logger.info(f"Client registered: {client_id} ({registration.hostname})")
     return clients[client_id]
@@ -130,7 +512,7 @@ async def register_client(
 @router.post("/clients/heartbeat", response_model=ClientInfo)
 async def update_heartbeat(
     heartbeat: ClientHeartbeat,
-    api_key: str = Depends(get_api_key)
+    principal: Principal = Depends(require_agent)
 ):
     """Update client heartbeat."""
     current_time = heartbeat.timestamp or time.time()
@@ -142,35 +524,48 @@ async def update_heartbeat(
     # Update client info
     client = clients[client_id]
     client.last_seen = current_time
-    client.status = heartbeat.status
+    dirty_clients.add(client_id)
+    relay_heartbeats.inc()
     
-    if heartbeat.last_command_id:
+    # Only status changes are pushed; last_seen alone is not worth an event
+    changed = client.status != heartbeat.status
+    if changed:
+        client.status = heartbeat.status
+        publish_client(client)
+    
+    if heartbeat.last_command_id and heartbeat.last_command_id != client.last_command_id:
         client.last_command_id = heartbeat.last_command_id
+        changed = True
+    
+    if changed:
+        replicate_client(client)
+    else:
+        replicate_contact(client)
     
     logger.debug(f"Heartbeat received from client: {client_id}")
     return client
 
 @router.get("/clients", response_model=List[ClientInfo])
 async def list_clients(
-    api_key: str = Depends(get_api_key)
+    source_id: Optional[uuid.UUID] = None,
+    principal: Principal = Depends(require_reader)
 ):
-    """List all registered clients."""
-    # Run cleanup before listing clients
-    cleanup_old_data()
-    
+    """List all registered clients, optionally only those of one source."""
+    if source_id:
+        return [client for client in clients.values() if client.source_id == source_id]
     return list(clients.values())
 
 @router.get("/commands/pending", response_model=List[CommandStatus])
 async def get_pending_commands(
     client_id: str,
-    api_key: str = Depends(get_api_key)
+    principal: Principal = Depends(require_agent)
 ):
     """Get pending commands for a specific client."""
     if client_id not in clients:
         raise HTTPException(status_code=404, detail="Client not found")
     
     # Update client's last seen timestamp
-    clients[client_id].last_seen = time.time()
+    touch_client(client_id)
     
     # Find pending commands for this client
     pending_commands = [
@@ -178,39 +573,48 @@ async def get_pending_commands(
         if cmd.client_id == client_id and cmd.status == "pending"
     ]
     
+    # Other workers may hold the same pending commands; only the one that claims a command hands it out
+    state = get_state_backend()
+    if state is not None and pending_commands:
+        claimed = await asyncio.gather(
+            *(state.claim(f"relay:command:{cmd.command_id}", COMMAND_CLAIM_TTL) for cmd in pending_commands)
+        )
+        pending_commands = [
+            cmd for cmd, won in zip(pending_commands, claimed) if won and cmd.status == "pending"
+        ]
+    
     # Mark commands as "running"
     for cmd in pending_commands:
-        cmd.status = "running"
-        cmd.updated_at = time.time()
+        set_command_status(cmd, "running")
     
     return pending_commands
 
 @router.post("/commands/results", response_model=CommandStatus)
 async def submit_command_results(
     result: CommandResult,
-    api_key: str = Depends(get_api_key)
+    principal: Principal = Depends(require_agent)
 ):
     """Submit command execution results."""
     command_id = result.command_id
     client_id = result.client_id
     
     # Find the command
-    command = next((cmd for cmd in commands if cmd.command_id == command_id), None)
-    if not command:
-        raise HTTPException(status_code=404, detail="Command not found")
+    command = find_command(command_id)
     
     # Update command status
-    command.status = "completed"
-    command.updated_at = result.timestamp or time.time()
     command.result = result.result
     command.exit_code = result.exit_code
-    command.stdout = result.stdout
-    command.stderr = result.stderr
+    command.stdout = finalize_output(command_id, "stdout", result.stdout)
+    command.stderr = finalize_output(command_id, "stderr", result.stderr)
+    set_command_status(command, "completed", result.timestamp, replicate=False)
+    replicate_command(command)
+    notify_output(command_id)
     
     # Update client's last command
     if client_id in clients:
         clients[client_id].last_command_id = command_id
-        clients[client_id].last_seen = command.updated_at
+        touch_client(client_id, command.updated_at)
+        replicate_client(clients[client_id])
     
     logger.info(f"Command {command_id} completed by client {client_id}")
     return command
@@ -218,7 +622,7 @@ async def submit_command_results(
 @router.post("/commands/send", response_model=CommandStatus)
 async def send_command(
     command_request: CommandRequest,
-    api_key: str = Depends(get_api_key)
+    principal: Principal = Depends(require_operator)
 ):
     """Send a command to a specific client."""
     client_id = command_request.client_id
@@ -241,6 +645,9 @@ async def send_command(
     )
     
     commands.append(new_command)
+    relay_commands.inc("pending")
+    relay_events.publish("command", command_summary(new_command))
+    replicate_command(new_command)
     
     logger.info(f"Command {command_id} sent to client {client_id}")
     return new_command
@@ -248,33 +655,160 @@ async def send_command(
 @router.get("/commands/{command_id}", response_model=CommandStatus)
 async def get_command_status(
     command_id: str,
-    api_key: str = Depends(get_api_key)
+    principal: Principal = Depends(require_reader)
 ):
     """Get the status of a specific command."""
-    command = next((cmd for cmd in commands if cmd.command_id == command_id), None)
-    if not command:
-        raise HTTPException(status_code=404, detail="Command not found")
-    
-    # Check for timeout
+    command = find_command(command_id)
+    check_timeout(command)
+    return command
+
+def check_timeout(command: CommandStatus):
+    """Mark a running command as timed out if it has gone quiet."""
     if command.status == "running":
         current_time = time.time()
         if current_time - command.updated_at > 60:  # Default timeout of 60 seconds
-            command.status = "timeout"
-            command.updated_at = current_time
+            set_command_status(command, "timeout", current_time)
+            notify_output(command.command_id)
+
+@router.post("/commands/{command_id}/output", response_model=CommandOutputAck)
+async def append_command_output(
+    command_id: str,
+    chunk: CommandOutputChunk,
+    principal: Principal = Depends(require_agent)
+):
+    """Append a chunk of output from a command that is still running.
+    
+    Each chunk also refreshes the command's updated_at, so long-running jobs
+    that keep producing output are not reported as timed out.
+    """
+    command = find_command(command_id)
+    if command.status in FINISHED_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Command is already {command.status}")
+    
+    buffer = get_output_buffer(command_id, chunk.stream)
+    data = chunk.data.encode("utf-8")
+    
+    if chunk.offset is not None:
+        if chunk.offset > len(buffer):
+            raise HTTPException(
+                status_code=409,
+                detail=f"Offset {chunk.offset} is past the end of the output ({len(buffer)} bytes)"
+            )
+        # Skip the part of a retried chunk that was already stored
+        skip = len(buffer) - chunk.offset
+        if 0 < skip < len(data) and is_continuation_byte(data[skip]):
+            raise HTTPException(
+                status_code=409,
+                detail=f"Offset {chunk.offset} does not leave the stored output on a character boundary"
+            )
+        data = data[skip:]
+    
+    if len(buffer) + len(data) > MAX_OUTPUT_BYTES:
+        raise HTTPException(status_code=413, detail="Command output limit exceeded")
+    
+    publish(RELAY_CHANNEL, {
+        "kind": "output", "command_id": command_id, "stream": chunk.stream,
+        "offset": len(buffer), "data": data.decode("latin-1"), "updated_at": time.time()
+    })
+    buffer.extend(data)
+    relay_output_bytes.inc(chunk.stream, amount=len(data))
+    set_command_status(command, "running")
+    touch_client(chunk.client_id, command.updated_at)
+    
+    notify_output(command_id)
+    return CommandOutputAck(command_id=command_id, stream=chunk.stream, next_offset=len(buffer))
+
+@router.get("/commands/{command_id}/output", response_model=CommandOutput)
+async def get_command_output(
+    command_id: str,
+    stream: str = "stdout",
+    offset: int = 0,
+    principal: Principal = Depends(require_reader)
+):
+    """Read command output starting at a byte offset.
     
-    return command
+    The returned offset and next_offset are moved to UTF-8 character
+    boundaries, so they may differ from the requested offset and the
+    buffer's length.
+    """
+    command = find_command(command_id)
+    start, end, data = read_output(get_output_buffer(command_id, stream), offset)
+    
+    return CommandOutput(
+        command_id=command_id,
+        stream=stream,
+        offset=start,
+        next_offset=end,
+        data=data,
+        status=command.status
+    )
+
+@router.get("/commands/{command_id}/output/stream")
+async def stream_command_output(
+    command_id: str,
+    request: Request,
+    stdout_offset: int = 0,
+    stderr_offset: int = 0,
+    principal: Principal = Depends(require_reader)
+):
+    """Tail command output as Server-Sent Events.
+    
+    Emits ``output`` events carrying the stream name, byte offset and data,
+    and a final ``status`` event once the command has finished. The event id
+    holds both offsets, so a reconnecting client resumes via Last-Event-ID.
+    """
+    command = find_command(command_id)
+    offsets = {"stdout": stdout_offset, "stderr": stderr_offset}
+    
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        try:
+            offsets["stdout"], offsets["stderr"] = (int(part) for part in last_event_id.split(":"))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    
+    async def event_stream():
+        while True:
+            waiter = output_waiter(command_id)
+            check_timeout(command)
+            finished = command.status in FINISHED_STATUSES
+            
+            for stream in OUTPUT_STREAMS:
+                buffer = get_output_buffer(command_id, stream)
+                if offsets[stream] >= len(buffer):
+                    continue
+                start, end, data = read_output(buffer, offsets[stream])
+                if end > start:
+                    offsets[stream] = end
+                    yield format_sse(
+                        {"stream": stream, "offset": start, "data": data},
+                        event="output",
+                        event_id=f"{offsets['stdout']}:{offsets['stderr']}"
+                    )
+            
+            if finished:
+                yield format_sse(
+                    {"status": command.status, "exit_code": command.exit_code},
+                    event="status"
+                )
+                return
+            
+            if await request.is_disconnected():
+                return
+            
+            if not await wait_for_output(waiter, timeout=15):
+                yield SSE_KEEPALIVE
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
 
 @router.get("/commands", response_model=List[CommandStatus])
 async def list_commands(
     client_id: Optional[str] = None,
     status: Optional[str] = None,
     limit: int = 50,
-    api_key: str = Depends(get_api_key)
+    principal: Principal = Depends(require_reader)
 ):
     """List all commands with optional filtering."""
-    # Run cleanup before listing commands
-    cleanup_old_data()
-    
     # Filter commands
     filtered_commands = commands
     
@@ -292,23 +826,85 @@ async def list_commands(
     
     return filtered_commands
 
+@router.get("/events")
+async def relay_event_feed(
+    request: Request,
+    since: Optional[int] = None,
+    principal: Principal = Depends(require_reader)
+):
+    """Push feed of client and command state changes as Server-Sent Events.
+    
+    The first message is a ``snapshot`` of all clients and recent commands.
+    It is followed by ``client``, ``client_removed``, ``command`` and
+    ``command_removed`` deltas. Every message id is the feed sequence number;
+    reconnecting with ``since`` (or Last-Event-ID) replays only missed deltas
+    when they are still in the history, and sends a new snapshot otherwise.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    if since is None and last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    
+    return StreamingResponse(
+        relay_events.stream(request, relay_snapshot, since),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
 # Scheduled task for cleanup
 def start_cleanup_task():
-    """Start a background task to periodically clean up old data."""
-    import asyncio
+    """Start a background task to periodically clean up old data.
+    
+    Timeouts and offline clients are swept more often than old data is removed,
+    so the event feed reports them without anyone polling.
+    """
+    sweep_interval = 30
+    cleanup_every = (60 * 15) // sweep_interval  # Clean up every 15 minutes
     
     async def cleanup_task():
+        sweeps = 0
         while True:
-            cleanup_old_data()
-            await asyncio.sleep(60 * 15)  # Run every 15 minutes
+            if sweeps % cleanup_every == 0:
+                cleanup_old_data()
+            # Timeouts and offline clients are found by one worker and replicated to the rest
+            if is_leader():
+                for command in commands:
+                    check_timeout(command)
+                mark_offline_clients()
+            sweeps += 1
+            await asyncio.sleep(sweep_interval)
     
     asyncio.create_task(cleanup_task())
 
-# Start cleanup task when the module is imported
-from fastapi.routing import APIRouter
+def start_registry_flush(session_factory: async_sessionmaker, interval: Optional[float] = None) -> asyncio.Task:
+    """Write client contact to the registry every ``interval`` seconds.
+    
+    However many heartbeats arrive in between, each flush is one UPDATE.
+    """
+    interval = interval or get_settings().RELAY_FLUSH_INTERVAL
+    
+    async def flush_task():
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await flush_clients(session_factory)
+            except Exception:
+                logger.exception("Relay client registry flush failed")
+    
+    return asyncio.create_task(flush_task())
 
-@router.on_event("startup")
-async def startup_event():
-    """Start the cleanup task when the application starts."""
+async def start_relay(session_factory: Optional[async_sessionmaker] = None):
+    """Restore registered clients and start the cleanup and registry tasks.
+
+    Called from the application's lifespan; clients are loaded through
+    ``session_factory`` so the read can run alongside other startup work.
+    """
+    await load_clients(session_factory or get_write_session_factory())
+    # Ask the other workers for the commands they hold
+    publish(RELAY_CHANNEL, {"kind": "sync"})
     logger.info("Starting command relay cleanup task")
     start_cleanup_task()
+    start_registry_flush(get_write_session_factory())
+
+async def stop_relay():
+    """Write the last client contact before the application stops."""
+    await flush_clients(get_write_session_factory())
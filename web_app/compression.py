@@ -0,0 +1,302 @@
+import gzip
+import logging
+import os
+import zlib
+from typing import Dict, List, Optional
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import PlainTextResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Optional codecs; gzip is always available
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+def is_compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith("text/event-stream")
+
+
+def available_encodings() -> List[str]:
+    """Response encodings this server can produce, most preferred first."""
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def negotiate_encoding(accept_encoding: str, offered: List[str]) -> Optional[str]:
+    """Pick the preferred offered encoding the client accepts with a non-zero q-value."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in offered:
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: str, level: int = 6) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if encoding == "br":
+        return brotli.compress(data)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    raise ValueError(f"Unsupported encoding '{encoding}'")
+
+
+class DecompressionError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        self.status_code = status_code
+        self.detail = detail
+
+
+def decompress_body(body: bytes, encoding: str, max_size: int) -> bytes:
+    """Decompress a request body, refusing to inflate it past max_size bytes."""
+    if encoding in ("gzip", "x-gzip", "deflate"):
+        wbits = 16 + zlib.MAX_WBITS if encoding != "deflate" else zlib.MAX_WBITS
+        decompressor = zlib.decompressobj(wbits)
+        try:
+            data = decompressor.decompress(body, max_size + 1)
+        except zlib.error:
+            raise DecompressionError(400, f"Invalid {encoding} request body")
+        if len(data) > max_size or decompressor.unconsumed_tail:
+            raise DecompressionError(413, "Decompressed request body too large")
+        return data
+
+    if encoding == "zstd" and zstandard is not None:
+        reader = zstandard.ZstdDecompressor().stream_reader(body)
+        try:
+            data = reader.read(max_size + 1)
+        except zstandard.ZstdError:
+            raise DecompressionError(400, "Invalid zstd request body")
+        if len(data) > max_size:
+            raise DecompressionError(413, "Decompressed request body too large")
+        return data
+
+    raise DecompressionError(415, f"Unsupported Content-Encoding '{encoding}'")
+
+
+class RequestDecompressionMiddleware:
+    """Transparently decompress gzip, deflate and (if available) zstd request bodies.
+
+    Both the compressed and the decompressed size are capped, so a small
+    payload cannot expand into a decompression bomb.
+    """
+
+    def __init__(self, app: ASGIApp, max_body_size: int, max_decompressed_size: int):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.max_decompressed_size = max_decompressed_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        encoding = headers.get("content-encoding", "").strip().lower()
+        if not encoding or encoding == "identity":
+            await self.app(scope, receive, send)
+            return
+
+        chunks = []
+        received = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunk = message.get("body", b"")
+            received += len(chunk)
+            if received > self.max_body_size:
+                await PlainTextResponse("Request body too large", status_code=413)(scope, receive, send)
+                return
+            chunks.append(chunk)
+            more_body = message.get("more_body", False)
+
+        try:
+            body = decompress_body(b"".join(chunks), encoding, self.max_decompressed_size)
+        except DecompressionError as e:
+            await PlainTextResponse(e.detail, status_code=e.status_code)(scope, receive, send)
+            return
+
+        # Present the request to the app as if it had been sent uncompressed
+        mutable = MutableHeaders(scope=scope)
+        del mutable["content-encoding"]
+        mutable["content-length"] = str(len(body))
+
+        body_sent = False
+
+        async def receive_decompressed() -> Message:
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        await self.app(scope, receive_decompressed, send)
+
+
+class ResponseCompressionMiddleware:
+    """Compress responses with the best encoding the client accepts.
+
+    Whole responses below min_size, responses that are already encoded,
+    non-text content and event streams are sent unchanged. Streaming responses
+    are compressed incrementally with gzip.
+    """
+
+    def __init__(self, app: ASGIApp, min_size: int = 1024, gzip_level: int = 6):
+        self.app = app
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.encodings = available_encodings()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        encoding = negotiate_encoding(accept_encoding, self.encodings) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+        streaming_compressor = None
+        passthrough = False
+
+        async def send_compressed(message: Message):
+            nonlocal start_message, streaming_compressor, passthrough
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                passthrough = (
+                    "content-encoding" in headers
+                    or not is_compressible(headers.get("content-type", ""))
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if streaming_compressor is None and start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers.add_vary_header("Accept-Encoding")
+
+                if not more_body:
+                    # Whole response available: apply the size threshold and best codec
+                    if len(body) >= self.min_size:
+                        body = compress(body, encoding, self.gzip_level)
+                        headers["content-encoding"] = encoding
+                        headers["content-length"] = str(len(body))
+                    await send(start_message)
+                    start_message = None
+                    await send({"type": "http.response.body", "body": body})
+                    return
+
+                streaming_compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+                headers["content-encoding"] = "gzip"
+                del headers["content-length"]
+                await send(start_message)
+                start_message = None
+
+            data = streaming_compressor.compress(body)
+            if not more_body:
+                data += streaming_compressor.flush()
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves compressed copies of text assets built once at startup."""
+
+    def __init__(self, *args, min_size: int = 1024, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.min_size = min_size
+        self.encodings = available_encodings()
+        self.compressed: Dict[str, Dict[str, bytes]] = {}
+
+    def precompress(self):
+        """Compress every compressible asset with each available encoding."""
+        import mimetypes
+
+        compressed = {}
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                full_path = os.path.join(root, filename)
+                content_type, _ = mimetypes.guess_type(filename)
+                if not content_type or not is_compressible(content_type):
+                    continue
+                with open(full_path, "rb") as f:
+                    data = f.read()
+                if len(data) < self.min_size:
+                    continue
+                relative_path = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+                compressed[relative_path] = {
+                    encoding: compress(data, encoding, 9) for encoding in self.encodings
+                }
+        self.compressed = compressed
+        logger.info(f"Precompressed {len(compressed)} static files")
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = await super().get_response(path, scope)
+        variants = self.compressed.get(path.replace(os.sep, "/"))
+        if response.status_code != 200 or not variants:
+            return response
+
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        encoding = negotiate_encoding(accept_encoding, list(variants)) if accept_encoding else None
+        if encoding is None:
+            return response
+
+        headers = {
+            key: value for key, value in response.headers.items()
+            if key not in ("content-length", "content-encoding")
+        }
+        headers["content-encoding"] = encoding
+        headers["vary"] = "Accept-Encoding"
+        if "etag" in headers:
+            # Each encoding is a different representation and needs its own validator
+            headers["etag"] = headers["etag"].rstrip('"') + f'-{encoding}"'
+        return Response(content=variants[encoding], headers=headers)
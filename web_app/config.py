@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Literal, Optional, Tuple
 from functools import lru_cache
 from typing import get_type_hints
 
@@ -10,14 +10,88 @@ class Settings(BaseSettings):
     DATABASE_URL: str = "sqlite+aiosqlite:///./metrics.db"
     SQL_ECHO: bool = False  # Control SQL statement logging
     
+    # SQLite tuning profile (ignored for other databases)
+    SQLITE_WAL: bool = True  # Readers never block the writer in WAL mode
+    SQLITE_SYNCHRONOUS: str = "NORMAL"  # Safe with WAL; only the last transactions can be lost on power failure
+    SQLITE_BUSY_TIMEOUT: int = 5000  # Milliseconds to wait for a lock before failing
+    SQLITE_CACHE_SIZE: int = -64000  # Page cache per connection; negative values are KiB
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024  # Bytes of the database file to memory-map
+    SQLITE_READ_POOL_SIZE: int = 4  # Read connections; writes share a single connection
+    
+    # Connection pool for server databases such as PostgreSQL
+    DB_POOL_SIZE: int = 10  # Connections kept open
+    DB_MAX_OVERFLOW: int = 20  # Extra connections allowed under load
+    DB_POOL_TIMEOUT: float = 30.0  # Seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800  # Seconds before a connection is replaced; -1 disables
+    DB_POOL_PRE_PING: bool = True  # Check connections before use to survive server restarts
+    DB_STATEMENT_CACHE_SIZE: int = 500  # Prepared statements cached per asyncpg connection
+    DB_USE_COPY: bool = True  # Use COPY for compact bulk ingest on PostgreSQL
+    
+    # Read replicas for dashboards and query endpoints
+    READ_DATABASE_URL: str = ""  # Comma-separated replica URLs; empty reads from the primary
+    REPLICA_MAX_LAG: float = 10.0  # Seconds a replica may trail the primary before it is skipped; keep above the check interval
+    REPLICA_CHECK_INTERVAL: float = 5.0  # Seconds between replica lag checks
+    
+    # Time-partitioned metric storage
+    PARTITION_INTERVAL: Literal["day", "week"] = "day"  # Keep it fixed once metrics are stored
+    PARTITION_PRECREATE: int = 3  # Partitions created ahead of the current one
+    METRIC_RETENTION_DAYS: int = 0  # Drop partitions older than this; 0 keeps everything
+    ARCHIVE_DIR: str = ""  # Move old partitions into Parquet files here; empty keeps them in the database
+    ARCHIVE_AFTER_DAYS: int = 30  # Archive partitions older than this
+    
+    # In-process hot store of the newest points per metric type and source
+    HOT_STORE_POINTS: int = 256  # Points kept per series; 0 disables the store
+    HOT_STORE_MEMORY_MB: int = 64  # Series beyond this budget are read from the database
+    HOT_STORE_REHYDRATE_HOURS: float = 24.0  # How far back points are loaded at startup
+    
+    # Source liveness
+    SOURCE_STALE_AFTER: float = 300.0  # Seconds without metrics before a source is stale and marked inactive
+    SOURCE_LIVENESS_FLUSH_INTERVAL: float = 10.0  # Seconds between batched last-seen writes
+    
+    # Command relay
+    RELAY_FLUSH_INTERVAL: float = 10.0  # Seconds between batched writes of client heartbeats
+    
+    # Instrumentation
+    INSTRUMENTATION_ENABLED: bool = True  # Request and query metrics served at /metrics
+    PROFILER_ENABLED: bool = False  # Record every statement of every request; for staging, not production
+    PROFILER_REPEAT_THRESHOLD: int = 5  # Runs of one statement shape in a request flagged as a likely N+1
+    PROFILER_KEEP: int = 100  # Request profiles kept for /api/debug/profiles; 0 keeps none
+    
     # Application
     APP_HOST: str = "127.0.0.1"
     APP_PORT: int = 8000
     DEBUG: bool = False
+    STARTUP_TARGET_SECONDS: float = 2.0  # Startup slower than this is logged as a warning
+    
+    # Multi-process deployment with web_app.server
+    WORKERS: int = 0  # Worker processes; 0 runs one per CPU core when STATE_BACKEND_URL is set, else one
+    STATE_BACKEND_URL: str = ""  # sqlite:///path, redis://host:port/db or memory://; empty keeps all state in one process
+    PREPARE_DATABASE: bool = True  # Create tables and partitions at startup; the launcher does it once for all workers
+    TIMEOUT_KEEP_ALIVE: int = 5  # Seconds an idle keep-alive connection is held open
+    BACKLOG: int = 2048  # Pending connections the listening socket queues
     
     # Security
-    API_KEY: str
+    API_KEY: str  # Bootstrap key with every scope
+    # Extra keys as comma-separated "name:sha256-hex:scope|scope" entries
+    API_KEYS: str = ""
     CORS_ORIGINS: str = "http://localhost:8000,http://127.0.0.1:8000"
+
+    # Rate limiting and admission control for write endpoints
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_KEY_PER_SECOND: float = 50.0  # Write requests per API key
+    RATE_LIMIT_KEY_BURST: float = 100.0
+    RATE_LIMIT_SOURCE_POINTS_PER_SECOND: float = 1000.0  # Metric points per source
+    RATE_LIMIT_SOURCE_BURST: float = 10000.0
+    RATE_LIMIT_BACKEND_URL: Optional[str] = None  # e.g. redis://localhost:6379/0 to share limits between workers
+    WRITE_CONCURRENCY_LIMIT: int = 8  # Write requests processed at once
+    WRITE_QUEUE_TIMEOUT: float = 1.0  # Seconds to wait for a write slot before returning 429
+
+    # Compression
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024  # Responses smaller than this are sent uncompressed
+    COMPRESSION_LEVEL: int = 6  # gzip level for dynamic responses
+    MAX_REQUEST_BODY_BYTES: int = 16 * 1024 * 1024  # Compressed request body limit
+    MAX_DECOMPRESSED_BODY_BYTES: int = 64 * 1024 * 1024  # Limit after decompression
     
     class Config:
         env_file = ".env"
@@ -27,6 +101,19 @@ class Settings(BaseSettings):
         return self.CORS_ORIGINS.split(",") if isinstance(self.CORS_ORIGINS, str) else self.CORS_ORIGINS
         case_sensitive = True
 
+    @property
+    def read_database_urls(self) -> List[str]:
+        return [url.strip() for url in self.READ_DATABASE_URL.split(",") if url.strip()]
+
+    @property
+    def api_keys_list(self) -> List[Tuple[str, str, List[str]]]:
+        """Parse API_KEYS into (name, key hash, scopes) tuples."""
+        entries = []
+        for entry in filter(None, (e.strip() for e in self.API_KEYS.split(","))):
+            name, key_hash, scopes = entry.split(":", 2)
+            entries.append((name, key_hash.lower(), scopes.split("|")))
+        return entries
+
 @lru_cache()
 def get_settings() -> Settings:
     """
@@ -1,28 +1,194 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
+import asyncio
+import itertools
+import logging
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import event, func, insert, select, text, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from .config import get_settings
-from .models import Base
+from .models import Base, ReplicationHeartbeat
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a replica to answer a lag check
+REPLICA_CHECK_TIMEOUT = 2.0
+
+# Errors that make a database unusable for a lag check
+REPLICA_CHECK_ERRORS = (DBAPIError, OSError, asyncio.TimeoutError)
+
+# The replication_heartbeat row the primary stamps
+HEARTBEAT_ID = 1
+
+# Alembic revision files, used to tell whether a database is fully migrated
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "alembic" / "versions"
+REVISION = re.compile(r"^revision(?:\s*:[^=]*)?=\s*['\"](\w+)['\"]", re.MULTILINE)
+DOWN_REVISION = re.compile(r"^down_revision(?:\s*:[^=]*)?=(.*)$", re.MULTILINE)
 
 settings = get_settings()
 
+def is_sqlite_url(database_url: Union[str, URL]) -> bool:
+    return make_url(database_url).get_backend_name() == "sqlite"
+
+def is_sqlite() -> bool:
+    """Whether the configured database is SQLite."""
+    return is_sqlite_url(settings.DATABASE_URL)
+
+def is_sqlite_memory() -> bool:
+    """Whether the configured database is an in-memory SQLite database."""
+    database = make_url(settings.DATABASE_URL).database
+    return is_sqlite() and database in (None, "", ":memory:")
+
+def apply_sqlite_pragmas(engine: AsyncEngine, writer: bool = False):
+    """Apply the SQLite tuning profile from settings to every new connection.
+
+    Reader connections are made query-only so no write can bypass the
+    writer. The writer opens its transactions with BEGIN IMMEDIATE, taking
+    the write lock up front instead of failing with 'database is locked'
+    when a read transaction is upgraded.
+    """
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if settings.SQLITE_WAL:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT)}")
+        cursor.execute(f"PRAGMA cache_size={int(settings.SQLITE_CACHE_SIZE)}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        if not writer and not is_sqlite_memory():
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+        if writer:
+            # Let SQLAlchemy's begin event below control transactions
+            dbapi_connection.isolation_level = None
+
+    if writer:
+        @event.listens_for(engine.sync_engine, "begin")
+        def begin_immediate(connection):
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+def server_engine_options(database_url: Union[str, URL]) -> Tuple[URL, Dict[str, Any]]:
+    """Build the URL and pool options for a server database from settings.
+
+    With asyncpg, statements are prepared once per connection and cached,
+    so repeated queries such as ingest inserts skip parsing and planning.
+    """
+    url = make_url(database_url)
+    if url.get_driver_name() == "asyncpg":
+        url = url.update_query_dict(
+            {"prepared_statement_cache_size": str(settings.DB_STATEMENT_CACHE_SIZE)}
+        )
+    return url, {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
 # Create async engine
 @lru_cache()
 def get_engine():
     """
     Create and cache database engine.
     Uses environment variables for configuration.
+    On SQLite this engine is the read pool; writes go through get_write_engine().
+    """
+    if not is_sqlite():
+        url, options = server_engine_options(settings.DATABASE_URL)
+        return create_async_engine(url, echo=settings.SQL_ECHO, **options)
+
+    if is_sqlite_memory():
+        engine = create_async_engine(
+            settings.DATABASE_URL,
+            echo=settings.SQL_ECHO,
+        )
+        apply_sqlite_pragmas(engine, writer=False)
+        return engine
+
+    engine = create_async_engine(
+        settings.DATABASE_URL,
+        echo=settings.SQL_ECHO,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.SQLITE_READ_POOL_SIZE,
+        max_overflow=0,
+    )
+    apply_sqlite_pragmas(engine, writer=False)
+    return engine
+
+@lru_cache()
+def get_write_engine():
     """
-    return create_async_engine(
+    Create and cache the engine used for writes.
+    On a SQLite file this is a single serialized writer connection: requests
+    queue for it in the pool instead of fighting over the database lock.
+    Other databases handle concurrent writers themselves and share get_engine().
+    """
+    if not is_sqlite() or is_sqlite_memory():
+        return get_engine()
+
+    engine = create_async_engine(
         settings.DATABASE_URL,
         echo=settings.SQL_ECHO,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=1,
+        max_overflow=0,
     )
+    apply_sqlite_pragmas(engine, writer=True)
+    return engine
+
+def migration_heads() -> Optional[set]:
+    """Head revisions of the Alembic migrations, or None when the scripts are not available.
+
+    The revision identifiers are read from the files rather than through
+    Alembic, whose import alone costs more than the DDL checks it saves on
+    a local database.
+    """
+    if not MIGRATIONS_DIR.is_dir():
+        return None
+    revisions, parents = set(), set()
+    for path in MIGRATIONS_DIR.glob("*.py"):
+        source = path.read_text()
+        revision, down_revision = REVISION.search(source), DOWN_REVISION.search(source)
+        if revision is None or down_revision is None:
+            return None
+        revisions.add(revision.group(1))
+        parents.update(re.findall(r"['\"](\w+)['\"]", down_revision.group(1)))
+    return revisions - parents
+
+async def schema_is_current(conn) -> bool:
+    """Whether the database is stamped with the newest Alembic revision."""
+    try:
+        result = await conn.execute(text("SELECT version_num FROM alembic_version"))
+    except DBAPIError:
+        # Never migrated; the tables were created by init_db if at all
+        return False
+    revisions = set(result.scalars())
+    return bool(revisions) and revisions == migration_heads()
 
 # Initialize database tables
 async def init_db():
-    """Initialize database tables if they don't exist."""
-    engine = get_engine()
+    """Initialize database tables if they don't exist.
+
+    A database migrated to the Alembic head already has every table, so
+    the DDL checks are skipped and workers starting together do not take
+    schema locks on a server database.
+    """
+    engine = get_write_engine()
+    async with engine.connect() as conn:
+        if await schema_is_current(conn):
+            logger.info("Database schema is at the migration head")
+            return
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
@@ -38,10 +204,21 @@ def get_session_factory():
         expire_on_commit=False
     )
 
+@lru_cache()
+def get_write_session_factory():
+    """
+    Create and cache session factory bound to the write engine.
+    """
+    return async_sessionmaker(
+        get_write_engine(),
+        class_=AsyncSession,
+        expire_on_commit=False
+    )
+
 # Dependency to get database session
 async def get_db():
     """
-    Dependency that provides an async database session.
+    Dependency that provides an async database session for reads.
     Usage: add this as a dependency to your route handlers:
         @app.get("/")
         async def root(db: AsyncSession = Depends(get_db)):
@@ -52,3 +229,170 @@ async def get_db():
             yield session
         finally:
             await session.close()
+
+async def get_write_db():
+    """
+    Dependency that provides an async database session for writes.
+    Use it on every handler that inserts, updates or deletes rows.
+    """
+    async_session = get_write_session_factory()
+    async with async_session() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+class Replica:
+    """A read replica and the outcome of its last lag check."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.name = make_url(url).render_as_string(hide_password=True)
+        if is_sqlite_url(url):
+            self.engine = create_async_engine(url, echo=settings.SQL_ECHO)
+            apply_sqlite_pragmas(self.engine, writer=False)
+        else:
+            replica_url, options = server_engine_options(url)
+            self.engine = create_async_engine(replica_url, echo=settings.SQL_ECHO, **options)
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        self.available = False
+        self.lag: Optional[float] = None
+
+    def mark_unavailable(self, reason: str):
+        if self.available:
+            logger.warning(f"Read replica {self.name} unavailable: {reason}")
+        self.available = False
+
+
+async def write_heartbeat() -> datetime:
+    """Stamp the heartbeat row with the primary's clock and return the stamp."""
+    heartbeat = ReplicationHeartbeat.__table__
+    async with get_write_session_factory()() as session:
+        result = await session.execute(
+            update(heartbeat).where(heartbeat.c.id == HEARTBEAT_ID).values(beat_at=func.now())
+        )
+        if result.rowcount == 0:
+            await session.execute(insert(heartbeat).values(id=HEARTBEAT_ID, beat_at=func.now()))
+        beat_at = await session.scalar(select(heartbeat.c.beat_at).where(heartbeat.c.id == HEARTBEAT_ID))
+        await session.commit()
+        return beat_at
+
+
+async def read_heartbeat(engine: AsyncEngine) -> Optional[datetime]:
+    """The newest heartbeat stamp a database has, or None before the first one."""
+    async with AsyncSession(engine) as session:
+        return await session.scalar(
+            select(ReplicationHeartbeat.beat_at).where(ReplicationHeartbeat.id == HEARTBEAT_ID)
+        )
+
+
+class ReplicaRouter:
+    """Send reads to replicas that are within the staleness bound.
+
+    Each lag check stamps a heartbeat row on the primary with the primary
+    database's clock, and a replica's lag is how far the stamp it has
+    replicated trails the new one. Only the primary's clock is involved,
+    not the times clients report. A replica that has not yet replicated
+    the new stamp shows a lag of up to the check interval plus its real
+    delay, so REPLICA_MAX_LAG should exceed REPLICA_CHECK_INTERVAL.
+
+    Lag is checked at most once per check interval, by whichever request
+    first finds the result out of date, so routing a read normally costs
+    no extra query. When no replica is usable, reads go to the primary.
+    """
+
+    def __init__(self, replicas: List[Replica], max_lag: float, check_interval: float):
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.checked_at = float("-inf")
+        self.lock = asyncio.Lock()
+        self.cycle = itertools.cycle(replicas)
+
+    async def check_lag(self):
+        try:
+            primary_beat = await write_heartbeat()
+        except REPLICA_CHECK_ERRORS as e:
+            # Without the primary's position no replica can be shown to be fresh
+            for replica in self.replicas:
+                replica.mark_unavailable(f"primary lag check failed: {str(e) or type(e).__name__}")
+            return
+
+        for replica in self.replicas:
+            try:
+                replica_beat = await asyncio.wait_for(read_heartbeat(replica.engine), REPLICA_CHECK_TIMEOUT)
+            except REPLICA_CHECK_ERRORS as e:
+                replica.mark_unavailable(str(e) or type(e).__name__)
+                continue
+
+            if replica_beat is None:
+                lag = float("inf")
+            else:
+                lag = max(0.0, (primary_beat - replica_beat).total_seconds())
+            replica.lag = lag
+
+            if lag > self.max_lag:
+                replica.mark_unavailable(f"{lag:.1f}s behind the primary")
+            elif not replica.available:
+                replica.available = True
+                logger.info(f"Read replica {replica.name} in use ({lag:.1f}s behind the primary)")
+
+    async def pick(self) -> Optional[Replica]:
+        """Return the next usable replica, or None to read from the primary."""
+        if time.monotonic() - self.checked_at >= self.check_interval:
+            async with self.lock:
+                if time.monotonic() - self.checked_at >= self.check_interval:
+                    await self.check_lag()
+                    self.checked_at = time.monotonic()
+
+        for _ in range(len(self.replicas)):
+            replica = next(self.cycle)
+            if replica.available:
+                return replica
+        return None
+
+
+@lru_cache()
+def get_replica_router() -> Optional[ReplicaRouter]:
+    """Create the replica router from settings, or None when no replicas are configured."""
+    urls = settings.read_database_urls
+    if not urls:
+        return None
+    return ReplicaRouter(
+        [Replica(url) for url in urls],
+        max_lag=settings.REPLICA_MAX_LAG,
+        check_interval=settings.REPLICA_CHECK_INTERVAL,
+    )
+
+async def get_read_db():
+    """
+    Dependency that provides a session for reads that tolerate bounded staleness,
+    such as dashboards and metric queries. It uses a replica when one is within
+    REPLICA_MAX_LAG of the primary and falls back to the primary otherwise.
+    """
+    router = get_replica_router()
+    replica = await router.pick() if router else None
+    if replica is not None:
+        session = replica.session_factory()
+        try:
+            # Check out a connection now so an unreachable replica falls back to the primary
+            await session.connection()
+        except (DBAPIError, OSError) as e:
+            replica.mark_unavailable(str(e))
+            await session.close()
+            replica = None
+
+    if replica is None:
+        async for session in get_db():
+            yield session
+        return
+
+    async with session:
+        try:
+            yield session
+        except DBAPIError as e:
+            # Stop routing here until the next lag check finds it healthy again
+            replica.mark_unavailable(str(e))
+            raise
+        finally:
+            await session.close()
@@ -0,0 +1,246 @@
+"""In-process store of the newest points of every series.
+
+A series is one metric type from one source. Each keeps its newest
+``HOT_STORE_POINTS`` points in a fixed-size ring of parallel arrays (ids,
+recorded_at as Unix microseconds, values), so the dashboards and recent
+queries are answered from memory instead of the database.
+
+The store is filled as metrics are written and rehydrated from the
+database at startup with the newest points of the last
+``HOT_STORE_REHYDRATE_HOURS``. It only answers when it can tell the answer
+is the same one the database would give: it knows every point recorded
+since it was rehydrated, minus the oldest points each ring has dropped, and
+a query reaching past that returns None so the caller reads the database.
+Series beyond the ``HOT_STORE_MEMORY_MB`` budget are not kept and their
+metric types are always read from the database.
+
+Each worker keeps its own store. With several workers the points the
+others write arrive over ``STATE_BACKEND_URL`` (see ``shared_state``);
+without it run a single worker, or disable the store with
+``HOT_STORE_POINTS=0``.
+"""
+import heapq
+import logging
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+from uuid import UUID
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from .config import get_settings
+from .models import MetricType, Source
+from .partitions import metric_entity, utc_now
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+EPOCH = datetime(1970, 1, 1)
+
+# Stored for points whose id the database did not return (COPY ingest)
+NO_ID = -1
+
+# Bytes per stored point: an id, a timestamp and a value of 8 bytes each
+POINT_SIZE = 24
+
+
+def to_micros(recorded_at: datetime) -> int:
+    """Naive UTC datetime to Unix microseconds."""
+    return (recorded_at - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(micros: int) -> datetime:
+    return EPOCH + timedelta(microseconds=micros)
+
+
+class HotPoint(NamedTuple):
+    id: Optional[int]
+    source_key: int
+    value: float
+    recorded_at: datetime
+
+
+class Series:
+    """Ring of one series' newest points, oldest first from ``start``."""
+
+    __slots__ = ("source_key", "capacity", "ids", "times", "values", "start", "floor")
+
+    def __init__(self, source_key: int, capacity: int):
+        self.source_key = source_key
+        self.capacity = capacity
+        self.ids = array("q")
+        self.times = array("q")
+        self.values = array("d")
+        # Index of the oldest point once the ring is full
+        self.start = 0
+        # Newest recorded_at dropped from the ring; every later point is held
+        self.floor: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def drop(self, micros: int):
+        if self.floor is None or micros > self.floor:
+            self.floor = micros
+
+    def append(self, metric_id: int, micros: int, value: float):
+        size = len(self.times)
+        if size and micros < self.times[self.start - 1]:
+            self.insert(metric_id, micros, value)
+        elif size < self.capacity:
+            self.ids.append(metric_id)
+            self.times.append(micros)
+            self.values.append(value)
+        else:
+            self.drop(self.times[self.start])
+            self.ids[self.start] = metric_id
+            self.times[self.start] = micros
+            self.values[self.start] = value
+            self.start = (self.start + 1) % self.capacity
+
+    def insert(self, metric_id: int, micros: int, value: float):
+        """Insert a point recorded before the newest one, keeping the ring in order."""
+        if self.start:
+            for column in (self.ids, self.times, self.values):
+                column[:] = column[self.start:] + column[:self.start]
+            self.start = 0
+        position = bisect_right(self.times, micros)
+        if len(self.times) == self.capacity:
+            if position == 0:
+                # Older than everything held
+                self.drop(micros)
+                return
+            self.drop(self.times[0])
+            for column in (self.ids, self.times, self.values):
+                del column[0]
+            position -= 1
+        self.ids.insert(position, metric_id)
+        self.times.insert(position, micros)
+        self.values.insert(position, value)
+
+    def newest(self) -> Iterator[Tuple[int, float, int, int]]:
+        """(recorded_at, value, id, source_key) newest first."""
+        size = len(self.times)
+        for offset in range(1, size + 1):
+            i = (self.start - offset) % size
+            yield self.times[i], self.values[i], self.ids[i], self.source_key
+
+
+class HotStore:
+    """The newest points of every series, with the type and source ids they are served with."""
+
+    def __init__(self, capacity: int, memory_budget: int):
+        self.capacity = capacity
+        self.max_series = memory_budget // (capacity * POINT_SIZE)
+        self.series: Dict[int, Dict[int, Series]] = {}
+        self.series_count = 0
+        # Metric types with a series over the memory budget
+        self.incomplete: Set[int] = set()
+        # Every point recorded after this is held (Unix microseconds); None until rehydrated
+        self.since: Optional[int] = None
+        self.metric_type_ids: Dict[int, UUID] = {}
+        self.metric_type_keys: Dict[UUID, int] = {}
+        self.sources: Dict[int, Tuple[UUID, str]] = {}
+        self.source_keys: Dict[UUID, int] = {}
+
+    def add_metric_type(self, key: int, metric_type_id: UUID):
+        self.metric_type_ids[key] = metric_type_id
+        self.metric_type_keys[metric_type_id] = key
+
+    def add_source(self, key: int, source_id: UUID, name: str):
+        self.sources[key] = (source_id, name)
+        self.source_keys[source_id] = key
+
+    def append(self, metric_type_key: int, source_key: int, metric_id: Optional[int], recorded_at: datetime, value: float):
+        by_source = self.series.setdefault(metric_type_key, {})
+        series = by_source.get(source_key)
+        if series is None:
+            if self.series_count >= self.max_series:
+                self.incomplete.add(metric_type_key)
+                return
+            series = by_source[source_key] = Series(source_key, self.capacity)
+            self.series_count += 1
+        series.append(NO_ID if metric_id is None else metric_id, to_micros(recorded_at), value)
+
+    def extend(self, rows: Iterable[dict]):
+        """Add written metric rows (metric_type_key, source_key, value, recorded_at and optionally id)."""
+        for row in rows:
+            self.append(row["metric_type_key"], row["source_key"], row.get("id"), row["recorded_at"], row["value"])
+
+    def recent(self, metric_type_key: int, limit: int, source_key: Optional[int] = None) -> Optional[List[HotPoint]]:
+        """The newest ``limit`` points of a metric type, newest first, or None when the database must be read."""
+        points = self.newest_points(metric_type_key, limit, source_key)
+        if points is None:
+            return None
+        return [
+            HotPoint(None if metric_id == NO_ID else metric_id, point_source, value, from_micros(micros))
+            for micros, value, metric_id, point_source in points
+        ]
+
+    def newest_points(
+        self, metric_type_key: int, limit: int, source_key: Optional[int] = None
+    ) -> Optional[List[Tuple[int, float, int, int]]]:
+        """Like ``recent``, as the rings hold them: (recorded_at, value, id, source_key) with Unix microseconds and NO_ID."""
+        if self.since is None or metric_type_key in self.incomplete or limit > self.capacity:
+            return None
+        by_source = self.series.get(metric_type_key, {})
+        if source_key is not None:
+            by_source = {source_key: by_source[source_key]} if source_key in by_source else {}
+
+        # Points recorded after the bound are all held
+        bound = max([self.since] + [series.floor for series in by_source.values() if series.floor is not None])
+        points = list(islice(
+            heapq.merge(*(series.newest() for series in by_source.values()), reverse=True),
+            limit
+        ))
+        if len(points) < limit or points[-1][0] <= bound:
+            return None
+        return points
+
+    async def rehydrate(self, session_factory: async_sessionmaker):
+        """Load every type and source, and the newest points of each series from the last HOT_STORE_REHYDRATE_HOURS."""
+        since = utc_now() - timedelta(hours=settings.HOT_STORE_REHYDRATE_HOURS)
+        async with session_factory() as db:
+            for key, metric_type_id in (await db.execute(select(MetricType.key, MetricType.id))).all():
+                self.add_metric_type(key, metric_type_id)
+            for key, source_id, name in (await db.execute(select(Source.key, Source.id, Source.name))).all():
+                self.add_source(key, source_id, name)
+
+            entity = await metric_entity(db, since)
+            numbered = select(
+                entity.id, entity.metric_type_key, entity.source_key, entity.value, entity.recorded_at,
+                func.row_number().over(
+                    partition_by=(entity.metric_type_key, entity.source_key),
+                    order_by=entity.recorded_at.desc()
+                ).label("rank")
+            ).where(entity.recorded_at >= since).subquery()
+            result = await db.stream(
+                select(numbered.c.id, numbered.c.metric_type_key, numbered.c.source_key, numbered.c.value, numbered.c.recorded_at)
+                .where(numbered.c.rank <= self.capacity)
+                .order_by(numbered.c.metric_type_key, numbered.c.source_key, numbered.c.recorded_at)
+            )
+            points = 0
+            async for metric_id, metric_type_key, source_key, value, recorded_at in result:
+                self.append(metric_type_key, source_key, metric_id, recorded_at, value)
+                points += 1
+
+        # A full ring may be missing older points of its series
+        for by_source in self.series.values():
+            for series in by_source.values():
+                if len(series) == self.capacity:
+                    series.drop(series.times[series.start])
+        self.since = to_micros(since)
+        logger.info(f"Hot store loaded {points} points in {self.series_count} series")
+
+
+@lru_cache()
+def get_hot_store() -> Optional[HotStore]:
+    """Create the hot store from settings, or None when it is disabled."""
+    if settings.HOT_STORE_POINTS <= 0:
+        return None
+    return HotStore(settings.HOT_STORE_POINTS, settings.HOT_STORE_MEMORY_MB * 1024 * 1024)
@@ -0,0 +1,429 @@
+"""Compact metric ingest formats.
+
+Two alternatives to the JSON bulk endpoint, both decoded straight into
+parallel arrays without building a Pydantic model per point:
+
+Columnar binary (``application/x-metrics-columnar``), all little-endian::
+
+    magic      4 bytes   b"MCB1"
+    n_types    uint32
+    n_sources  uint32
+    n_points   uint32
+    n_types   x (uint16 length, UTF-8 metric type name)
+    n_sources x (uint16 length, UTF-8 source name)
+    uint16[n_points]   metric type index into the type names
+    uint16[n_points]   source index into the source names
+    float64[n_points]  recorded_at as Unix seconds
+    float64[n_points]  value
+
+Line protocol (``text/plain``), one point per line, Influx style::
+
+    cpu_usage,source=web01 value=42.5 1700000000000000000
+
+The timestamp is optional (defaults to now) and its unit is set by the
+``precision`` query parameter (``ns`` by default).
+"""
+import math
+import re
+import struct
+import sys
+import time
+from array import array
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional, Sequence
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .alerts import get_alert_engine
+from .config import get_settings
+from .hot_store import from_micros, get_hot_store, to_micros
+from .instrumentation import SIZE_BUCKETS, registry
+from .liveness import get_liveness
+from .models import Metric, MetricType, Source
+from .partitions import ensure_partitions, insert_metrics, period_starts
+from .shared_state import publish
+
+COLUMNAR_CONTENT_TYPE = "application/x-metrics-columnar"
+LINE_PROTOCOL_CONTENT_TYPE = "text/plain"
+
+COLUMNAR_MAGIC = b"MCB1"
+COLUMNAR_HEADER = struct.Struct("<4sIII")
+NAME_LENGTH = struct.Struct("<H")
+
+PRECISION_DIVISORS = {"ns": 1e9, "us": 1e6, "ms": 1e3, "s": 1.0}
+
+# Accept timestamps between 2000-01-01 and 2100-01-01
+MIN_TIMESTAMP = 946684800.0
+MAX_TIMESTAMP = 4102444800.0
+
+
+class IngestError(ValueError):
+    """Raised when an ingest payload is malformed."""
+
+
+class IngestBatch:
+    """A batch of points held as parallel arrays plus name dictionaries."""
+
+    __slots__ = ("type_names", "source_names", "type_index", "source_index", "recorded_at", "values")
+
+    def __init__(
+        self,
+        type_names: List[str],
+        source_names: List[str],
+        type_index: array,
+        source_index: array,
+        recorded_at: array,
+        values: array,
+    ):
+        self.type_names = type_names
+        self.source_names = source_names
+        self.type_index = type_index
+        self.source_index = source_index
+        self.recorded_at = recorded_at
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def validate(self):
+        """Check the whole batch with a handful of C-level passes over the arrays."""
+        n = len(self.values)
+        if n == 0:
+            raise IngestError("At least one metric must be provided")
+        if not (len(self.type_index) == len(self.source_index) == len(self.recorded_at) == n):
+            raise IngestError("Column lengths do not match")
+        if max(self.type_index) >= len(self.type_names):
+            raise IngestError("Metric type index out of range")
+        if max(self.source_index) >= len(self.source_names):
+            raise IngestError("Source index out of range")
+        if not all(map(math.isfinite, self.values)):
+            raise IngestError("Metric values must be finite numbers")
+        if not all(map(math.isfinite, self.recorded_at)):
+            raise IngestError("Timestamps must be finite numbers")
+        if min(self.recorded_at) < MIN_TIMESTAMP or max(self.recorded_at) > MAX_TIMESTAMP:
+            raise IngestError("Timestamp out of range")
+
+    def points_per_source(self, source_keys: List[int]) -> Dict[int, int]:
+        """Points in the batch by source key, given the keys ``resolve_names`` returned."""
+        counts = Counter(self.source_index)
+        return {source_keys[index]: count for index, count in counts.items()}
+
+
+def _read_column(body: bytes, offset: int, typecode: str, count: int) -> array:
+    column = array(typecode)
+    end = offset + column.itemsize * count
+    if end > len(body):
+        raise IngestError("Payload is truncated")
+    column.frombytes(body[offset:end])
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+
+def _read_names(body: bytes, offset: int, count: int):
+    names = []
+    for _ in range(count):
+        if offset + NAME_LENGTH.size > len(body):
+            raise IngestError("Payload is truncated")
+        (length,) = NAME_LENGTH.unpack_from(body, offset)
+        offset += NAME_LENGTH.size
+        raw = body[offset:offset + length]
+        if len(raw) != length:
+            raise IngestError("Payload is truncated")
+        name = raw.decode("utf-8").strip()
+        if not name:
+            raise IngestError("Names cannot be empty")
+        names.append(name)
+        offset += length
+    return names, offset
+
+
+def decode_columnar(body: bytes) -> IngestBatch:
+    """Decode a columnar binary batch."""
+    if len(body) < COLUMNAR_HEADER.size:
+        raise IngestError("Payload is truncated")
+    magic, n_types, n_sources, n_points = COLUMNAR_HEADER.unpack_from(body, 0)
+    if magic != COLUMNAR_MAGIC:
+        raise IngestError("Not a columnar metrics payload")
+
+    offset = COLUMNAR_HEADER.size
+    type_names, offset = _read_names(body, offset, n_types)
+    source_names, offset = _read_names(body, offset, n_sources)
+
+    type_index = _read_column(body, offset, "H", n_points)
+    offset += type_index.itemsize * n_points
+    source_index = _read_column(body, offset, "H", n_points)
+    offset += source_index.itemsize * n_points
+    recorded_at = _read_column(body, offset, "d", n_points)
+    offset += recorded_at.itemsize * n_points
+    values = _read_column(body, offset, "d", n_points)
+    offset += values.itemsize * n_points
+
+    if offset != len(body):
+        raise IngestError("Unexpected trailing data")
+
+    batch = IngestBatch(type_names, source_names, type_index, source_index, recorded_at, values)
+    batch.validate()
+    return batch
+
+
+def encode_columnar(
+    type_names: Sequence[str],
+    source_names: Sequence[str],
+    type_index: Sequence[int],
+    source_index: Sequence[int],
+    recorded_at: Sequence[float],
+    values: Sequence[float],
+) -> bytes:
+    """Encode a columnar binary batch; the counterpart of decode_columnar for collectors."""
+    parts = [COLUMNAR_HEADER.pack(COLUMNAR_MAGIC, len(type_names), len(source_names), len(values))]
+    for name in list(type_names) + list(source_names):
+        encoded = name.encode("utf-8")
+        parts.append(NAME_LENGTH.pack(len(encoded)))
+        parts.append(encoded)
+    for typecode, column in (("H", type_index), ("H", source_index), ("d", recorded_at), ("d", values)):
+        column = array(typecode, column)
+        if sys.byteorder == "big":
+            column.byteswap()
+        parts.append(column.tobytes())
+    return b"".join(parts)
+
+
+# Splits on separators that are not escaped with a backslash
+_UNESCAPED_SPACE = re.compile(r"(?<!\\) ")
+_UNESCAPED_COMMA = re.compile(r"(?<!\\),")
+_ESCAPES = re.compile(r"\\([ ,=\\])")
+
+
+def _unescape(value: str) -> str:
+    return _ESCAPES.sub(r"\1", value)
+
+
+def decode_line_protocol(text: str, precision: str = "ns", now: Optional[float] = None) -> IngestBatch:
+    """Decode Influx-style line protocol into a batch.
+
+    The measurement is the metric type name, the ``source`` tag names the
+    source and the ``value`` field holds the value. Other tags and fields are
+    ignored.
+    """
+    divisor = PRECISION_DIVISORS.get(precision)
+    if divisor is None:
+        raise IngestError(f"Unknown precision '{precision}'")
+    now = time.time() if now is None else now
+
+    type_lookup: Dict[str, int] = {}
+    source_lookup: Dict[str, int] = {}
+    type_index = array("H")
+    source_index = array("H")
+    recorded_at = array("d")
+    values = array("d")
+
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        parts = _UNESCAPED_SPACE.split(line)
+        if len(parts) not in (2, 3):
+            raise IngestError(f"Line {line_number}: expected 'measurement,tags fields [timestamp]'")
+
+        series = _UNESCAPED_COMMA.split(parts[0])
+        measurement = _unescape(series[0])
+        tags = dict(_unescape(tag).split("=", 1) for tag in series[1:] if "=" in tag)
+        fields = dict(_unescape(field).split("=", 1) for field in _UNESCAPED_COMMA.split(parts[1]) if "=" in field)
+
+        source = tags.get("source")
+        if not measurement or not source:
+            raise IngestError(f"Line {line_number}: a measurement and a 'source' tag are required")
+        if "value" not in fields:
+            raise IngestError(f"Line {line_number}: missing 'value' field")
+
+        try:
+            values.append(float(fields["value"].rstrip("i")))
+            recorded_at.append(int(parts[2]) / divisor if len(parts) == 3 else now)
+        except ValueError:
+            raise IngestError(f"Line {line_number}: invalid number")
+
+        # Indexes are stored as unsigned 16-bit integers
+        type_idx = type_lookup.setdefault(measurement, len(type_lookup))
+        source_idx = source_lookup.setdefault(source, len(source_lookup))
+        if type_idx > 0xFFFF or source_idx > 0xFFFF:
+            raise IngestError("Too many distinct metric types or sources in one batch")
+        type_index.append(type_idx)
+        source_index.append(source_idx)
+
+    batch = IngestBatch(list(type_lookup), list(source_lookup), type_index, source_index, recorded_at, values)
+    batch.validate()
+    return batch
+
+
+class ResolvedNames(NamedTuple):
+    """The keys and UUIDs of a batch's metric types and sources, in the order of its names."""
+    type_keys: List[int]
+    source_keys: List[int]
+    type_ids: List[UUID]
+    source_ids: List[UUID]
+
+
+async def resolve_names(db: AsyncSession, batch: IngestBatch) -> ResolvedNames:
+    """Map the batch's metric type and source names to their integer keys.
+
+    Metric types must already exist. Unknown sources are created, as they
+    are when a single metric is posted with a source_name, but only flushed:
+    they are committed with the batch.
+    """
+    result = await db.execute(
+        select(MetricType.name, MetricType.key, MetricType.id).where(MetricType.name.in_(batch.type_names))
+    )
+    metric_types = {name: (key, metric_type_id) for name, key, metric_type_id in result.all()}
+    missing_types = set(batch.type_names) - set(metric_types)
+    if missing_types:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Metric types not found: {sorted(missing_types)}"
+        )
+
+    result = await db.execute(
+        select(Source.name, Source.key, Source.id).where(Source.name.in_(batch.source_names))
+    )
+    sources = {name: (key, source_id) for name, key, source_id in result.all()}
+    new_sources = [Source(name=name) for name in batch.source_names if name not in sources]
+    if new_sources:
+        db.add_all(new_sources)
+        await db.flush()
+        sources.update((source.name, (source.key, source.id)) for source in new_sources)
+
+    return ResolvedNames(
+        [metric_types[name][0] for name in batch.type_names],
+        [sources[name][0] for name in batch.source_names],
+        [metric_types[name][1] for name in batch.type_names],
+        [sources[name][1] for name in batch.source_names],
+    )
+
+
+# The database generates ids
+METRIC_COLUMNS = ("metric_type_key", "source_key", "value", "recorded_at")
+
+
+def uses_copy(db: AsyncSession) -> bool:
+    """Whether bulk inserts on this session can use PostgreSQL COPY."""
+    dialect = db.get_bind().dialect
+    return get_settings().DB_USE_COPY and dialect.name == "postgresql" and dialect.driver == "asyncpg"
+
+
+async def copy_rows(db: AsyncSession, table: str, columns: Sequence[str], records: List[tuple]):
+    """Stream rows into a table with COPY inside the session's transaction."""
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        table, records=records, columns=list(columns)
+    )
+
+
+async def store_batch(db: AsyncSession, batch: IngestBatch, names: ResolvedNames) -> int:
+    """Insert a batch without building ORM objects per point.
+
+    ``names`` is what ``resolve_names`` returned for the batch. PostgreSQL
+    (asyncpg) receives the rows through COPY; other databases get one
+    executemany INSERT per partition. Once committed, the batch's types and
+    sources are added to the hot store and stored points are passed to
+    record_written.
+    """
+    type_keys, source_keys = names.type_keys, names.source_keys
+    hot_store = get_hot_store()
+
+    utc = timezone.utc
+    records = [
+        (
+            type_keys[type_idx],
+            source_keys[source_idx],
+            value,
+            datetime.fromtimestamp(ts, utc).replace(tzinfo=None),
+        )
+        for type_idx, source_idx, ts, value in zip(
+            batch.type_index, batch.source_index, batch.recorded_at, batch.values
+        )
+    ]
+
+    if uses_copy(db):
+        # COPY into the partitioned parent; PostgreSQL routes the rows
+        await ensure_partitions(db, period_starts(record[3] for record in records))
+        await copy_rows(db, Metric.__tablename__, METRIC_COLUMNS, records)
+        rows = None
+    else:
+        rows = [dict(zip(METRIC_COLUMNS, record)) for record in records]
+        await insert_metrics(db, rows, returning=hot_store is not None)
+    await db.commit()
+
+    if hot_store is not None:
+        # Only now: a batch rejected or rolled back must not leave its new sources here
+        for key, metric_type_id in zip(type_keys, names.type_ids):
+            hot_store.add_metric_type(key, metric_type_id)
+        for key, source_id, name in zip(source_keys, names.source_ids, batch.source_names):
+            hot_store.add_source(key, source_id, name)
+
+    if rows is None:
+        # COPY returns no ids
+        rows = [dict(zip(METRIC_COLUMNS, record)) for record in records]
+    record_written(rows)
+    return len(records)
+
+
+ingest_points = registry.histogram("ingest_write_points", "Metric points stored per write.", SIZE_BUCKETS)
+
+
+# Channel committed metric rows are replicated to other workers on
+WRITTEN_CHANNEL = "metrics"
+
+
+def record_written(rows: List[dict]):
+    """Pass committed metric rows to the hot store, alert rules and source liveness,
+    and to the other workers' hot stores and alert rules."""
+    ingest_points.observe(len(rows))
+    hot_store = get_hot_store()
+    if hot_store is not None:
+        hot_store.extend(rows)
+    get_alert_engine().observe(rows)
+    get_liveness().observe(rows)
+    publish(WRITTEN_CHANNEL, written_message(rows))
+
+
+def written_message(rows: List[dict]) -> dict:
+    """Rows as compact [id, type key, source key, value, microseconds] lists, with the ids and
+    names the hot store serves their type and source keys with."""
+    message = {"rows": [
+        [row.get("id"), row["metric_type_key"], row["source_key"], row["value"], to_micros(row["recorded_at"])]
+        for row in rows
+    ]}
+    hot_store = get_hot_store()
+    if hot_store is not None:
+        type_keys = {row["metric_type_key"] for row in rows}
+        source_keys = {row["source_key"] for row in rows}
+        message["types"] = [[key, str(hot_store.metric_type_ids[key])] for key in type_keys if key in hot_store.metric_type_ids]
+        message["sources"] = [
+            [key, str(hot_store.sources[key][0]), hot_store.sources[key][1]] for key in source_keys if key in hot_store.sources
+        ]
+    return message
+
+
+def apply_written(message: dict):
+    """Pass rows another worker wrote to this worker's hot store and alert rules.
+
+    Source liveness is left out: the worker that wrote the rows records it.
+    """
+    rows = [
+        {"id": metric_id, "metric_type_key": type_key, "source_key": source_key, "value": value, "recorded_at": from_micros(micros)}
+        for metric_id, type_key, source_key, value, micros in message["rows"]
+    ]
+    hot_store = get_hot_store()
+    if hot_store is not None:
+        for key, metric_type_id in message.get("types", ()):
+            hot_store.add_metric_type(key, UUID(metric_type_id))
+        for key, source_id, name in message.get("sources", ()):
+            hot_store.add_source(key, UUID(source_id), name)
+        hot_store.extend(rows)
+    get_alert_engine().observe(rows)
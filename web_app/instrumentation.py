@@ -0,0 +1,292 @@
+"""Counters and histograms of the app's own hot paths, served at /metrics.
+
+Instruments are plain objects updated in place: a counter increments a dict
+entry and a histogram bisects into fixed buckets, with no locks since they
+are only updated from the event loop. Modules register their own
+instruments and gauges on the shared ``registry``; this module adds
+request metrics (``InstrumentationMiddleware``) and database query metrics
+(SQLAlchemy cursor events), counted both overall and per request. The
+registry is rendered in the OpenMetrics text format.
+"""
+import math
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from fastapi import APIRouter
+from fastapi.responses import Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Bucket upper bounds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+Sample = Tuple[str, Tuple[Tuple[str, str], ...], float]
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_sample(name: str, labels: Tuple[Tuple[str, str], ...], value: float) -> str:
+    if labels:
+        rendered = ",".join(f'{key}="{escape_label(str(label))}"' for key, label in labels)
+        return f"{name}{{{rendered}}} {format_value(value)}"
+    return f"{name} {format_value(value)}"
+
+
+class Counter:
+    """Monotonic count, one per combination of label values."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self) -> Iterator[Sample]:
+        for label_values, value in self.values.items():
+            yield f"{self.name}_total", tuple(zip(self.labels, label_values)), value
+
+
+class Histogram:
+    """Distribution of observed values over fixed buckets, per combination of label values."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # Per label values: a count per bucket plus one for +Inf, the sum and the count
+        self.series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, *label_values: str):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self) -> Iterator[Sample]:
+        for label_values, (counts, total, count) in self.series.items():
+            labels = tuple(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", labels + (("le", format_value(bound)),), cumulative
+            yield f"{self.name}_count", labels, count
+            yield f"{self.name}_sum", labels, total
+
+
+class Gauge:
+    """Current value read from a callback when the registry is rendered.
+
+    The callback returns a number, or a mapping of label values (a tuple,
+    or a string for a single label) to numbers.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        read: Callable[[], Union[float, Dict]],
+        labels: Sequence[str] = ()
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.read = read
+
+    def samples(self) -> Iterator[Sample]:
+        value = self.read()
+        if not isinstance(value, dict):
+            yield self.name, (), value
+            return
+        for label_values, label_value in value.items():
+            if not isinstance(label_values, tuple):
+                label_values = (label_values,)
+            yield self.name, tuple(zip(self.labels, label_values)), label_value
+
+
+class Registry:
+    """The instruments rendered at /metrics."""
+
+    def __init__(self):
+        self.instruments: Dict[str, Union[Counter, Histogram, Gauge]] = {}
+
+    def register(self, instrument):
+        if instrument.name in self.instruments:
+            raise ValueError(f"Instrument '{instrument.name}' is already registered")
+        self.instruments[instrument.name] = instrument
+        return instrument
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float], labels: Sequence[str] = ()) -> Histogram:
+        return self.register(Histogram(name, documentation, buckets, labels))
+
+    def gauge(self, name: str, documentation: str, read: Callable, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, read, labels))
+
+    def render(self) -> str:
+        lines = []
+        for instrument in self.instruments.values():
+            lines.append(f"# TYPE {instrument.name} {instrument.kind}")
+            lines.append(f"# HELP {instrument.name} {escape_label(instrument.documentation)}")
+            lines.extend(format_sample(*sample) for sample in instrument.samples())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Requests
+http_requests = registry.counter(
+    "http_requests", "HTTP requests handled.", ("method", "route", "status")
+)
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "Time to handle an HTTP request.", LATENCY_BUCKETS, ("method", "route")
+)
+http_request_queries = registry.histogram(
+    "http_request_db_queries", "Database queries run by an HTTP request.", COUNT_BUCKETS, ("method", "route")
+)
+http_request_query_duration = registry.histogram(
+    "http_request_db_duration_seconds", "Time an HTTP request spent in database queries.", LATENCY_BUCKETS, ("method", "route")
+)
+in_progress = 0
+registry.gauge("http_requests_in_progress", "HTTP requests being handled.", lambda: in_progress)
+
+# Database
+db_queries = registry.counter("db_queries", "Database statements executed.", ("statement",))
+db_query_duration = registry.histogram(
+    "db_query_duration_seconds", "Time to execute a database statement.", LATENCY_BUCKETS, ("statement",)
+)
+
+
+class RequestStats:
+    """Database work done while handling one request."""
+
+    __slots__ = ("queries", "query_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+
+
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def statement_kind(statement: str) -> str:
+    """First keyword of a SQL statement, e.g. 'select'."""
+    keyword = statement.lstrip()[:8].split(None, 1)
+    return keyword[0].lower() if keyword else "other"
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    kind = statement_kind(statement)
+    db_queries.inc(kind)
+    db_query_duration.observe(elapsed, kind)
+    stats = request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_seconds += elapsed
+
+
+def handle_error(exception_context):
+    # after_cursor_execute does not run for a failed statement
+    starts = exception_context.connection.info.get("query_start") if exception_context.connection else None
+    if starts:
+        starts.pop()
+
+
+def instrument_engines():
+    """Time every statement of every engine."""
+    if not event.contains(Engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+        event.listen(Engine, "handle_error", handle_error)
+
+
+def route_label(scope: Scope) -> str:
+    """Route template of a request, so paths with ids share one series."""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # Unmatched paths share one series, or they would grow without bound
+    return "other"
+
+
+class InstrumentationMiddleware:
+    """Count requests and record their latency and database work per route."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        global in_progress
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        start = time.perf_counter()
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_progress += 1
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_progress -= 1
+            request_stats.reset(token)
+            method = scope["method"]
+            route = route_label(scope)
+            http_requests.inc(method, route, str(status))
+            http_request_duration.observe(time.perf_counter() - start, method, route)
+            http_request_queries.observe(stats.queries, method, route)
+            http_request_query_duration.observe(stats.query_seconds, method, route)
+
+
+router = APIRouter(tags=["instrumentation"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_instrumentation():
+    """The app's own metrics in the OpenMetrics text format."""
+    return Response(registry.render(), media_type=OPENMETRICS_CONTENT_TYPE)
@@ -0,0 +1,110 @@
+"""Source liveness derived from metric ingestion.
+
+Every write records, in memory, when each of its sources was last heard
+from. The times are written to ``sources.last_seen_at`` in one batched
+UPDATE every ``SOURCE_LIVENESS_FLUSH_INTERVAL`` seconds however many
+writes arrived, marking those sources active again. The same task marks
+sources not heard from for ``SOURCE_STALE_AFTER`` seconds inactive, so
+finding stale sources reads the sources table instead of aggregating
+metrics.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Set
+
+from sqlalchemy import bindparam, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from .config import get_settings
+from .instrumentation import registry
+from .models import Source
+from .partitions import utc_now
+from .shared_state import is_leader
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+
+class SourceLiveness:
+    """When each source was last heard from, written back in batches."""
+
+    def __init__(self):
+        self.seen: Dict[int, datetime] = {}
+        # Sources heard from since the last flush
+        self.dirty: Set[int] = set()
+
+    def observe(self, rows: Iterable[dict]):
+        now = utc_now()
+        for source_key in {row["source_key"] for row in rows}:
+            self.seen[source_key] = now
+            self.dirty.add(source_key)
+
+    def last_seen(self, source_key: int, stored: Optional[datetime]) -> Optional[datetime]:
+        """The newer of the stored and the not yet written last-seen time."""
+        seen = self.seen.get(source_key)
+        if stored is None or (seen is not None and seen > stored):
+            return seen
+        return stored
+
+    async def flush(self, session_factory: async_sessionmaker) -> int:
+        """Write the sources heard from since the last flush, marking them active."""
+        if not self.dirty:
+            return 0
+        keys, self.dirty = self.dirty, set()
+        try:
+            async with session_factory() as db:
+                await db.execute(
+                    update(Source.__table__)
+                    .where(Source.key == bindparam("source_key"))
+                    .values(last_seen_at=bindparam("seen"), is_active=True),
+                    [{"source_key": key, "seen": self.seen[key]} for key in keys]
+                )
+                await db.commit()
+        except Exception:
+            # Retried on the next flush
+            self.dirty |= keys
+            raise
+        return len(keys)
+
+    async def deactivate_stale(self, session_factory: async_sessionmaker, stale_after: float) -> int:
+        """Mark sources not heard from for ``stale_after`` seconds inactive."""
+        cutoff = utc_now() - timedelta(seconds=stale_after)
+        async with session_factory() as db:
+            result = await db.execute(
+                update(Source.__table__)
+                .where(Source.is_active == True, Source.last_seen_at < cutoff)  # noqa: E712
+                .values(is_active=False)
+            )
+            await db.commit()
+        return result.rowcount
+
+
+@lru_cache()
+def get_liveness() -> SourceLiveness:
+    return SourceLiveness()
+
+
+registry.gauge("source_liveness_pending", "Sources with last-seen times waiting to be written.", lambda: len(get_liveness().dirty))
+
+
+def start_liveness_task(session_factory: async_sessionmaker, interval: Optional[float] = None) -> asyncio.Task:
+    """Flush last-seen times and deactivate stale sources every ``interval`` seconds."""
+    liveness = get_liveness()
+    interval = interval or settings.SOURCE_LIVENESS_FLUSH_INTERVAL
+
+    async def liveness_task():
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await liveness.flush(session_factory)
+                # Every worker flushes the sources it heard from; one marks stale sources
+                stale = await liveness.deactivate_stale(session_factory, settings.SOURCE_STALE_AFTER) if is_leader() else 0
+                if stale:
+                    logger.info(f"Marked {stale} stale sources inactive")
+            except Exception:
+                logger.exception("Source liveness update failed")
+
+    return asyncio.create_task(liveness_task())
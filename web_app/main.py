@@ -1,39 +1,158 @@
-from fastapi import FastAPI, Depends, HTTPException, Request, Security
-from fastapi.security.api_key import APIKeyHeader
-from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, or_
 from sqlalchemy.orm import selectinload
-from typing import List
+from typing import Dict, List, Optional, Union
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+import asyncio
+import logging
+import time
 import uvicorn
 
-from .database import get_db, init_db
+from .database import (
+    get_read_db, get_session_factory, get_write_db, get_write_session_factory, init_db, is_sqlite_memory
+)
 from .models import Metric, MetricType, Unit, Source
 from .schemas import (
     MetricCreate, MetricBulkCreate, Metric as MetricSchema,
     MetricType as MetricTypeSchema, MetricTypeCreate,
     Unit as UnitSchema, UnitCreate,
-    Source as SourceSchema, SourceCreate
+    Source as SourceSchema, SourceCreate, SourceLiveness,
+    MetricIngestResult, MetricStats as MetricStatsSchema, NormalizedMetrics, RecentMetric
 )
 from .config import get_settings
-from .command_relay import router as command_relay_router
+from .auth import KEYS_CHANNEL, Principal, load_api_keys, router as auth_router
+from .rate_limit import admit_write, check_source_rate
+from .compression import (
+    PrecompressedStaticFiles, RequestDecompressionMiddleware, ResponseCompressionMiddleware
+)
+from .ingest import (
+    COLUMNAR_CONTENT_TYPE, LINE_PROTOCOL_CONTENT_TYPE, IngestError,
+    WRITTEN_CHANNEL, apply_written, decode_columnar, decode_line_protocol, record_written,
+    resolve_names, store_batch
+)
+from .partitions import (
+    insert_metrics, maintain_partitions, metric_entity, metrics_in_range, recent_metrics, recent_metrics_by_type,
+    start_partition_maintenance, utc_now, with_relationships
+)
+from .archive import archived_metrics, get_archive
+from .hot_store import get_hot_store
+from .stats import series_stats
+from .alerts import ALERTS_CHANNEL, get_alert_engine, router as alerts_router, start_alert_sweeps
+from .liveness import get_liveness, start_liveness_task
+from .command_relay import (
+    RELAY_CHANNEL, apply_relay_message, router as command_relay_router, start_relay, stop_relay
+)
+from .shared_state import get_state_backend
+from .instrumentation import InstrumentationMiddleware, instrument_engines, registry, router as instrumentation_router
+from .profiler import ProfilerMiddleware, router as profiler_router
+from .serialization import DashboardData, MetricShape, metrics_response
+
+logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
+# Seconds each phase of the last startup took
+startup_phases: Dict[str, float] = {}
+registry.gauge("app_startup_seconds", "Seconds each phase of startup took.", lambda: startup_phases, ("phase",))
+
+async def warm_up(*loads):
+    """Run startup loads side by side.
+
+    An in-memory SQLite database is a single shared connection, so there
+    they run one after another.
+    """
+    if is_sqlite_memory():
+        for load in loads:
+            await load
+    else:
+        await asyncio.gather(*loads)
+
+def compile_templates():
+    """Compile every template once so the first page views do not pay for it."""
+    for name in templates.env.list_templates():
+        templates.env.get_template(name)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize the database and metric partitions, then load the hot store, alert rules,
+    API keys and relay clients, compile templates and precompress static files side by side.
+    With a shared state backend the worker then starts exchanging changes with the others.
+
+    Each phase is timed, logged and served as app_startup_seconds, with a warning
+    when startup takes longer than STARTUP_TARGET_SECONDS.
+    """
+    started = phase_started = time.perf_counter()
+
+    def phase_done(phase: str):
+        nonlocal phase_started
+        now = time.perf_counter()
+        startup_phases[phase] = now - phase_started
+        phase_started = now
+
+    # web_app.server prepares the database once before starting the workers
+    if settings.PREPARE_DATABASE:
+        await init_db()
+        phase_done("schema")
+        await maintain_partitions(get_write_session_factory(), get_archive())
+        phase_done("partitions")
+
+    state = get_state_backend()
+    if state is not None:
+        state.subscribe(RELAY_CHANNEL, apply_relay_message)
+        state.subscribe(WRITTEN_CHANNEL, apply_written)
+        state.subscribe(ALERTS_CHANNEL, get_alert_engine().apply_message)
+        state.subscribe(KEYS_CHANNEL, lambda message: load_api_keys())
+
+    # Everything below only reads, so on SQLite it runs on the read pool beside the writer
+    hot_store = get_hot_store()
+    loads = [
+        get_alert_engine().load(get_write_session_factory()),
+        load_api_keys(),
+        start_relay(get_session_factory()),
+        asyncio.to_thread(compile_templates),
+    ]
+    if hot_store is not None:
+        loads.append(hot_store.rehydrate(get_session_factory()))
+    if settings.COMPRESSION_ENABLED:
+        loads.append(asyncio.to_thread(static_files.precompress))
+    await warm_up(*loads)
+    phase_done("caches")
+    if state is not None:
+        await state.start()
+        phase_done("shared_state")
+
+    start_partition_maintenance(get_write_session_factory(), archive=get_archive())
+    start_alert_sweeps(get_alert_engine())
+    start_liveness_task(get_write_session_factory())
+    startup_phases["total"] = time.perf_counter() - started
+
+    phases = ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in startup_phases.items() if phase != "total")
+    message = f"Started in {startup_phases['total']:.3f}s ({phases})"
+    if startup_phases["total"] > settings.STARTUP_TARGET_SECONDS:
+        logger.warning(f"{message}, over the {settings.STARTUP_TARGET_SECONDS:g}s target")
+    else:
+        logger.info(message)
+
+    yield
+
+    await stop_relay()
+    if state is not None:
+        await state.stop()
+
 app = FastAPI(
     title="Metrics Dashboard",
     description="A modern FastAPI dashboard for tracking various metrics",
     version="1.0.0",
-    debug=settings.DEBUG
+    debug=settings.DEBUG,
+    lifespan=lifespan
 )
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize database on startup"""
-    await init_db()
-
 # Setup CORS
 app.add_middleware(
     CORSMiddleware,
@@ -43,25 +162,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# API Key security
-api_key_header = APIKeyHeader(name="X-API-Key")
+# Setup request decompression and response compression
+app.add_middleware(
+    RequestDecompressionMiddleware,
+    max_body_size=settings.MAX_REQUEST_BODY_BYTES,
+    max_decompressed_size=settings.MAX_DECOMPRESSED_BODY_BYTES,
+)
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        ResponseCompressionMiddleware,
+        min_size=settings.COMPRESSION_MIN_SIZE,
+        gzip_level=settings.COMPRESSION_LEVEL,
+    )
+
+# Setup the SQL profiler in staging
+if settings.PROFILER_ENABLED:
+    app.add_middleware(
+        ProfilerMiddleware,
+        repeat_threshold=settings.PROFILER_REPEAT_THRESHOLD,
+        keep=settings.PROFILER_KEEP,
+    )
 
-async def get_api_key(api_key: str = Security(api_key_header)):
-    if api_key != settings.API_KEY:
-        raise HTTPException(
-            status_code=403,
-            detail="Could not validate API key"
-        )
-    return api_key
+# Setup request and query instrumentation. The last middleware added runs
+# first, so this one stays outermost and times the whole request, including
+# the profiler, compression and CORS; add any new middleware above it
+if settings.INSTRUMENTATION_ENABLED:
+    instrument_engines()
+    app.add_middleware(InstrumentationMiddleware)
 
 # Mount static files directory
-app.mount("/static", StaticFiles(directory="web_app/static"), name="static")
+static_files = PrecompressedStaticFiles(directory="web_app/static", min_size=settings.COMPRESSION_MIN_SIZE)
+app.mount("/static", static_files, name="static")
 
-# Include command relay router
+# Include command relay, key management and alert routers
 app.include_router(command_relay_router)
-
-# Setup Jinja2 templates with datetime filter
+app.include_router(auth_router)
+app.include_router(alerts_router)
+if settings.INSTRUMENTATION_ENABLED:
+    app.include_router(instrumentation_router)
+if settings.PROFILER_ENABLED:
+    app.include_router(profiler_router)
+
+# Setup Jinja2 templates with datetime filter; they are compiled at startup
+# and only checked for changes on disk in debug mode
 templates = Jinja2Templates(directory="web_app/templates")
+templates.env.auto_reload = settings.DEBUG
 
 # Add custom filters to Jinja2 environment
 def format_datetime(value, format='%Y-%m-%d %H:%M:%S'):
@@ -69,21 +214,68 @@ def format_datetime(value, format='%Y-%m-%d %H:%M:%S'):
         return ''
     return value.strftime(format)
 
+def from_epoch_ms(value):
+    """Unix milliseconds, as dashboard series hold them, to a UTC datetime."""
+    return datetime.fromtimestamp(value / 1000, timezone.utc)
+
 templates.env.filters['strftime'] = format_datetime
+templates.env.filters['epoch_ms'] = from_epoch_ms
+
+def to_naive_utc(value: datetime) -> datetime:
+    """Convert a timestamp to the naive UTC form metrics are stored in."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def metric_row(metric: MetricCreate, metric_type_key: int, source_key: int) -> dict:
+    """Build the row for a new metric, defaulting recorded_at to now."""
+    return {
+        "metric_type_key": metric_type_key,
+        "source_key": source_key,
+        "value": metric.value,
+        "recorded_at": to_naive_utc(metric.recorded_at) if metric.recorded_at else utc_now(),
+    }
 
 @app.get("/api/sources", response_model=List[SourceSchema])
 @app.get("/api/sources/", response_model=List[SourceSchema])
-async def list_sources(db: AsyncSession = Depends(get_db)):
+async def list_sources(db: AsyncSession = Depends(get_read_db)):
     """List all available sources."""
     result = await db.execute(select(Source))
     return result.scalars().all()
 
+@app.get("/api/sources/liveness", response_model=List[SourceLiveness])
+async def get_source_liveness(
+    stale_after: Optional[float] = Query(None, gt=0, description="Seconds without metrics before a source is stale"),
+    status: Optional[str] = Query(None, pattern="^(live|stale|never)$"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    List sources with when they last sent metrics and whether they are live or stale.
+    stale_after defaults to SOURCE_STALE_AFTER. Reads only the sources table.
+    """
+    liveness = get_liveness()
+    cutoff = utc_now() - timedelta(seconds=stale_after or settings.SOURCE_STALE_AFTER)
+    result = await db.execute(select(Source).order_by(Source.name))
+    sources = []
+    for source in result.scalars().all():
+        last_seen_at = liveness.last_seen(source.key, source.last_seen_at)
+        source_status = "never" if last_seen_at is None else "live" if last_seen_at >= cutoff else "stale"
+        if status is None or status == source_status:
+            sources.append(SourceLiveness(
+                id=source.id,
+                name=source.name,
+                is_active=source.is_active if source.is_active is not None else True,
+                last_seen_at=last_seen_at,
+                status=source_status
+            ))
+    return sources
+
 @app.post("/api/sources", response_model=SourceSchema)
 @app.post("/api/sources/", response_model=SourceSchema)
 async def create_source(
     source: SourceCreate,
-    db: AsyncSession = Depends(get_db),
-    api_key: str = Security(get_api_key)
+    db: AsyncSession = Depends(get_write_db),
+    principal: Principal = Depends(admit_write)
 ):
     """Create a new source."""
     # Check if source with same name exists
@@ -105,8 +297,8 @@ async def create_source(
 @app.post("/api/units", response_model=UnitSchema)
 async def create_unit(
     unit: UnitCreate,
-    db: AsyncSession = Depends(get_db),
-    api_key: str = Security(get_api_key)
+    db: AsyncSession = Depends(get_write_db),
+    principal: Principal = Depends(admit_write)
 ):
     """Create a new unit definition."""
     # Check if unit with same name or symbol already exists
@@ -133,37 +325,17 @@ async def create_unit(
     return db_unit
 
 @app.get("/api/units", response_model=List[UnitSchema])
-async def list_units(db: AsyncSession = Depends(get_db)):
+async def list_units(db: AsyncSession = Depends(get_read_db)):
     """List all available units."""
     result = await db.execute(select(Unit))
     return result.scalars().all()
 
-# Helper function to serialize metric types
-def serialize_metric_types(metric_types):
-    """Convert metric types to JSON-serializable dictionaries"""
-    return [
-        {
-            'id': str(mt.id),
-            'name': mt.name,
-            'description': mt.description,
-            'unit': {
-                'id': str(mt.unit.id),
-                'name': mt.unit.name,
-                'symbol': mt.unit.symbol,
-                'description': mt.unit.description
-            } if mt.unit else None,
-            'created_at': mt.created_at.isoformat() if mt.created_at else None,
-            'is_active': mt.is_active
-        }
-        for mt in metric_types
-    ]
-
 @app.post("/api/metric-types", response_model=MetricTypeSchema)
 @app.post("/api/metric-types/", response_model=MetricTypeSchema)
 async def create_metric_type(
     metric_type: MetricTypeCreate,
-    db: AsyncSession = Depends(get_db),
-    api_key: str = Security(get_api_key)
+    db: AsyncSession = Depends(get_write_db),
+    principal: Principal = Depends(admit_write)
 ):
     """Create a new metric type definition."""
     # Verify unit exists
@@ -182,7 +354,7 @@ async def create_metric_type(
 
 @app.get("/api/metric-types", response_model=List[MetricTypeSchema])
 @app.get("/api/metric-types/", response_model=List[MetricTypeSchema])
-async def list_metric_types(db: AsyncSession = Depends(get_db)):
+async def list_metric_types(db: AsyncSession = Depends(get_read_db)):
     """List all available metric types."""
     result = await db.execute(
         select(MetricType).options(selectinload(MetricType.unit))
@@ -192,8 +364,8 @@ async def list_metric_types(db: AsyncSession = Depends(get_db)):
 @app.post("/api/metrics", response_model=MetricSchema)
 async def create_metric(
     metric: MetricCreate,
-    db: AsyncSession = Depends(get_db),
-    api_key: str = Security(get_api_key)
+    db: AsyncSession = Depends(get_write_db),
+    principal: Principal = Depends(admit_write)
 ):
     """Create a new metric measurement."""
     # If metric_type_name is provided, look up the metric type by name
@@ -225,11 +397,10 @@ async def create_metric(
         )
         source = result.scalar_one_or_none()
         if not source:
-            # Create new source
+            # Create new source, committed with the metric once it is admitted
             source = Source(name=metric.source_name)
             db.add(source)
-            await db.commit()
-            await db.refresh(source)
+            await db.flush()
         metric.source_id = source.id
     else:
         # Verify source exists by ID
@@ -240,29 +411,30 @@ async def create_metric(
         if not source:
             raise HTTPException(status_code=404, detail="Source not found")
 
-    # Create the metric
-    metric_data = metric.model_dump(exclude={'metric_type_name', 'source_name'})
-    db_metric = Metric(**metric_data)
-    db.add(db_metric)
+    await check_source_rate({source.key: 1})
+
+    # Create the metric in its time partition
+    row = metric_row(metric, metric_type.key, source.key)
+    await insert_metrics(db, [row], returning=True)
     await db.commit()
+
+    hot_store = get_hot_store()
+    if hot_store is not None:
+        hot_store.add_metric_type(metric_type.key, metric_type.id)
+        hot_store.add_source(source.key, source.id, source.name)
+    record_written([row])
     
-    # Refresh with all relationships loaded
-    result = await db.execute(
-        select(Metric)
-        .options(
-            selectinload(Metric.metric_type),
-            selectinload(Metric.source),
-            selectinload(Metric.metric_metadata_items)
-        )
-        .where(Metric.id == db_metric.id)
+    # Load it back with all relationships
+    result = await metrics_in_range(
+        db, row["recorded_at"], row["recorded_at"] + timedelta(microseconds=1), metric_ids=[row["id"]]
     )
-    return result.scalar_one()
+    return result[0]
 
 @app.post("/api/metrics/bulk", response_model=List[MetricSchema])
 async def create_metrics_bulk(
     metrics: MetricBulkCreate,
-    db: AsyncSession = Depends(get_db),
-    api_key: str = Security(get_api_key)
+    db: AsyncSession = Depends(get_write_db),
+    principal: Principal = Depends(admit_write)
 ):
     """Bulk create multiple metric measurements."""
     # Verify all metric types exist
@@ -270,8 +442,9 @@ async def create_metrics_bulk(
     result = await db.execute(
         select(MetricType).where(MetricType.id.in_(metric_type_ids))
     )
-    found_types = {mt.id for mt in result.scalars().all()}
-    missing_types = metric_type_ids - found_types
+    metric_types = result.scalars().all()
+    type_keys = {mt.id: mt.key for mt in metric_types}
+    missing_types = metric_type_ids - set(type_keys)
     if missing_types:
         raise HTTPException(
             status_code=404,
@@ -283,43 +456,221 @@ async def create_metrics_bulk(
     result = await db.execute(
         select(Source).where(Source.id.in_(source_ids))
     )
-    found_sources = {s.id for s in result.scalars().all()}
-    missing_sources = source_ids - found_sources
+    sources = result.scalars().all()
+    source_keys = {s.id: s.key for s in sources}
+    missing_sources = source_ids - set(source_keys)
     if missing_sources:
         raise HTTPException(
             status_code=404,
             detail=f"Sources not found: {missing_sources}"
         )
 
-    db_metrics = [Metric(**m.model_dump()) for m in metrics.metrics]
-    db.add_all(db_metrics)
+    await check_source_rate(Counter(source_keys[m.source_id] for m in metrics.metrics))
+
+    rows = [metric_row(m, type_keys[m.metric_type_id], source_keys[m.source_id]) for m in metrics.metrics]
+    await insert_metrics(db, rows, returning=True)
     await db.commit()
+
+    hot_store = get_hot_store()
+    if hot_store is not None:
+        for mt in metric_types:
+            hot_store.add_metric_type(mt.key, mt.id)
+        for source in sources:
+            hot_store.add_source(source.key, source.id, source.name)
+    record_written(rows)
     
     # Get all metrics with relationships loaded
-    metric_ids = [m.id for m in db_metrics]
-    result = await db.execute(
-        select(Metric)
-        .options(
-            selectinload(Metric.metric_type),
-            selectinload(Metric.source),
-            selectinload(Metric.metric_metadata_items)
-        )
-        .where(Metric.id.in_(metric_ids))
+    timestamps = [row["recorded_at"] for row in rows]
+    return await metrics_in_range(
+        db, min(timestamps), max(timestamps) + timedelta(microseconds=1),
+        metric_ids=[row["id"] for row in rows]
     )
-    return result.scalars().all()
 
-@app.get("/api/metrics", response_model=List[MetricSchema])
-async def get_metrics(db: AsyncSession = Depends(get_db)):
+@app.post("/api/metrics/ingest", response_model=MetricIngestResult)
+async def ingest_metrics(
+    request: Request,
+    precision: str = "ns",
+    db: AsyncSession = Depends(get_write_db),
+    principal: Principal = Depends(admit_write)
+):
+    """
+    Bulk ingest metrics in a compact format.
+    Accepts the columnar binary format (application/x-metrics-columnar) or
+    Influx-style line protocol (text/plain). See web_app.ingest for both formats.
+    Metric types and sources are referenced by name; unknown sources are created.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    body = await request.body()
+
+    try:
+        if content_type == COLUMNAR_CONTENT_TYPE:
+            batch = decode_columnar(body)
+        elif content_type == LINE_PROTOCOL_CONTENT_TYPE:
+            batch = decode_line_protocol(body.decode("utf-8"), precision)
+        else:
+            raise HTTPException(
+                status_code=415,
+                detail=f"Unsupported content type, use {COLUMNAR_CONTENT_TYPE} or {LINE_PROTOCOL_CONTENT_TYPE}"
+            )
+    except (IngestError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    names = await resolve_names(db, batch)
+    await check_source_rate(batch.points_per_source(names.source_keys))
+    inserted = await store_batch(db, batch, names)
+
+    return MetricIngestResult(
+        inserted=inserted,
+        metric_types=len(batch.type_names),
+        sources=len(batch.source_names)
+    )
+
+# The metric lists are serialized by web_app.serialization; the models only document them
+METRICS_SHAPE_QUERY = Query(
+    "normalized",
+    description="normalized: units, metric types and sources once, referenced by id; full: nested in every metric"
+)
+
+@app.get("/api/metrics", response_model=Union[NormalizedMetrics, List[MetricSchema]])
+async def get_metrics(shape: MetricShape = METRICS_SHAPE_QUERY, db: AsyncSession = Depends(get_read_db)):
     """
     Retrieve all metrics.
     Returns a list of all metrics in the database.
     """
-    result = await db.execute(select(Metric))
+    entity = await metric_entity(db)
+    result = await db.execute(with_relationships(select(entity), entity))
     metrics = result.scalars().all()
-    return metrics
+    return metrics_response(metrics, shape)
+
+def time_range(start: Optional[datetime], end: Optional[datetime]):
+    """Resolve an optional [start, end) query range, defaulting to the last 24 hours."""
+    end = to_naive_utc(end) if end else utc_now()
+    start = to_naive_utc(start) if start else end - timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return start, end
+
+async def series_keys(db: AsyncSession, metric_type_id: Optional[UUID], source_id: Optional[UUID]):
+    """The integer keys metrics reference a type and source by, or None if either does not exist."""
+    metric_type_key = source_key = None
+    if metric_type_id is not None:
+        metric_type_key = await db.scalar(select(MetricType.key).where(MetricType.id == metric_type_id))
+        if metric_type_key is None:
+            return None
+    if source_id is not None:
+        source_key = await db.scalar(select(Source.key).where(Source.id == source_id))
+        if source_key is None:
+            return None
+    return metric_type_key, source_key
+
+@app.get("/api/metrics/history", response_model=Union[NormalizedMetrics, List[MetricSchema]])
+async def get_metric_history(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    metric_type_id: Optional[UUID] = None,
+    source_id: Optional[UUID] = None,
+    limit: int = Query(1000, ge=1, le=100000),
+    shape: MetricShape = METRICS_SHAPE_QUERY,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Retrieve metrics recorded in [start, end), oldest first.
+    Defaults to the last 24 hours; only partitions overlapping the range are read,
+    merged with archived metrics when an archive is configured.
+    """
+    start, end = time_range(start, end)
+    keys = await series_keys(db, metric_type_id, source_id)
+    if keys is None:
+        return metrics_response([], shape)
+    metric_type_key, source_key = keys
+    metrics = await metrics_in_range(db, start, end, metric_type_key, source_key, limit)
+
+    archive = get_archive()
+    if archive is not None:
+        archived = await archived_metrics(db, archive, start, end, metric_type_key, source_key, limit)
+        if archived:
+            metrics = sorted(archived + list(metrics), key=lambda metric: metric.recorded_at)[:limit]
+    return metrics_response(metrics, shape)
+
+@app.get("/api/metrics/stats", response_model=List[MetricStatsSchema])
+async def get_metric_stats(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    metric_type_id: Optional[UUID] = None,
+    source_id: Optional[UUID] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Summary statistics of each metric type and source over [start, end).
+    Returns count, min, max, mean, standard deviation, p50/p90/p99 and rate of
+    change per series, including archived metrics. Defaults to the last 24 hours.
+    """
+    start, end = time_range(start, end)
+    keys = await series_keys(db, metric_type_id, source_id)
+    if keys is None:
+        return []
+    stats = await series_stats(db, start, end, *keys, archive=get_archive())
+    if not stats:
+        return []
+
+    result = await db.execute(
+        select(MetricType.key, MetricType.id).where(MetricType.key.in_({s.metric_type_key for s in stats}))
+    )
+    metric_type_ids = dict(result.all())
+    result = await db.execute(select(Source.key, Source.id).where(Source.key.in_({s.source_key for s in stats})))
+    source_ids = dict(result.all())
+    return [
+        MetricStatsSchema(
+            metric_type_id=metric_type_ids[s.metric_type_key],
+            source_id=source_ids[s.source_key],
+            **{name: value for name, value in vars(s).items() if not name.endswith("_key")}
+        )
+        for s in stats
+        # Archived rows of deleted metric types or sources
+        if s.metric_type_key in metric_type_ids and s.source_key in source_ids
+    ]
+
+@app.get("/api/metrics/recent", response_model=List[RecentMetric])
+async def get_recent_metrics(
+    metric_type_id: UUID,
+    source_id: Optional[UUID] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Retrieve the newest metrics of a type, optionally from one source, newest first.
+    Served from the hot store when it holds them, otherwise from the database.
+    """
+    hot_store = get_hot_store()
+    if hot_store is not None:
+        metric_type_key = hot_store.metric_type_keys.get(metric_type_id)
+        source_key = hot_store.source_keys.get(source_id) if source_id is not None else None
+        if metric_type_key is not None and (source_id is None or source_key is not None):
+            points = hot_store.recent(metric_type_key, limit, source_key)
+            if points is not None:
+                return [
+                    RecentMetric(
+                        id=point.id,
+                        metric_type_id=metric_type_id,
+                        source_id=hot_store.sources[point.source_key][0],
+                        value=point.value,
+                        recorded_at=point.recorded_at
+                    )
+                    for point in points
+                ]
+
+    metric_type_key = await db.scalar(select(MetricType.key).where(MetricType.id == metric_type_id))
+    if metric_type_key is None:
+        raise HTTPException(status_code=404, detail="Metric type not found")
+    source_key = None
+    if source_id is not None:
+        source_key = await db.scalar(select(Source.key).where(Source.id == source_id))
+        if source_key is None:
+            raise HTTPException(status_code=404, detail="Source not found")
+    return await recent_metrics(db, limit, metric_type_key, source_key)
 
 @app.get("/api/metrics/{metric_name}")
-async def get_metric_by_name(metric_name: str, db: AsyncSession = Depends(get_db)):
+async def get_metric_by_name(metric_name: str, db: AsyncSession = Depends(get_read_db)):
     """
     Retrieve metrics by name.
     Returns the latest value for a specific metric.
@@ -335,13 +686,11 @@ async def get_metric_by_name(metric_name: str, db: AsyncSession = Depends(get_db
         raise HTTPException(status_code=404, detail="Metric not found")
     return metric
 
-@app.get("/")
-async def dashboard(request: Request, db: AsyncSession = Depends(get_db)):
+async def dashboard_data(db: AsyncSession, limit: int) -> dict:
     """
-    Main dashboard view.
-    Renders the dashboard template with metric types and their history.
+    Every metric type with its newest ``limit`` points, serialized for the dashboards.
+    Served from the hot store where it holds them, otherwise from the database.
     """
-    # Get all metric types with their units
     result = await db.execute(
         select(MetricType)
         .options(selectinload(MetricType.unit))
@@ -349,185 +698,64 @@ async def dashboard(request: Request, db: AsyncSession = Depends(get_db)):
     )
     metric_types = result.scalars().all()
 
-    # Get historical data for each metric type
-    metric_history = {}
+    data = DashboardData(metric_types)
+    hot_store = get_hot_store()
+    # Types the hot store cannot serve are read together in one query per window of partitions
+    cold = []
     for metric_type in metric_types:
-        result = await db.execute(
-            select(Metric)
-            .options(
-                selectinload(Metric.metric_type),
-                selectinload(Metric.source),
-                selectinload(Metric.metric_metadata_items)
-            )
-            .filter(Metric.metric_type_id == metric_type.id)
-            .order_by(Metric.recorded_at.desc())
-            .limit(50)  # Limit to last 50 measurements for performance
-        )
-        metrics = result.scalars().all()
-        if metrics:
-            # Convert SQLAlchemy models to dictionaries for JSON serialization
-            # Convert metrics to a serializable format
-            serialized_metrics = []
-            for metric in metrics:
-                # Safely handle source and metadata
-                source_data = {
-                    'id': str(metric.source.id) if metric.source else None,
-                    'name': metric.source.name if metric.source else None
-                } if metric.source else None
-                
-                metadata_items = [{
-                    'key': item.key,
-                    'value': item.value
-                } for item in metric.metric_metadata_items] if metric.metric_metadata_items else []
-                
-                metric_dict = {
-                    'id': str(metric.id),  # Convert UUID to string
-                    'value': metric.value,
-                    'recorded_at': metric.recorded_at.isoformat() if metric.recorded_at else None,
-                    'source': source_data,
-                    'metric_metadata': metadata_items,
-                    'metric_type_id': str(metric.metric_type_id)  # Convert UUID to string
-                }
-                serialized_metrics.append(metric_dict)
-            metric_history[str(metric_type.id)] = serialized_metrics
+        points = hot_store.newest_points(metric_type.key, limit) if hot_store is not None else None
+        if points is not None:
+            data.add_hot_points(metric_type.id, points, hot_store)
+        else:
+            cold.append(metric_type)
+    if cold:
+        found = await recent_metrics_by_type(db, limit, [metric_type.key for metric_type in cold])
+        for metric_type in cold:
+            data.add_metrics(metric_type.id, found[metric_type.key])
+    return data.as_dict()
 
+@app.get("/")
+async def dashboard(request: Request, db: AsyncSession = Depends(get_read_db)):
+    """
+    Main dashboard view.
+    Renders the dashboard template with metric types and their history.
+    """
     return templates.TemplateResponse(
         "dashboard.html",
         {
             "request": request,
-            "metric_types": serialize_metric_types(metric_types),
-            "metric_history": metric_history,
+            "dashboard": await dashboard_data(db, 50),  # Limit to last 50 measurements for performance
             "settings": settings
         }
     )
 
 @app.get("/advanced")
-async def advanced_dashboard(request: Request, db: AsyncSession = Depends(get_db)):
+async def advanced_dashboard(request: Request, db: AsyncSession = Depends(get_read_db)):
     """
     Advanced dashboard view with speedometer gauge and filterable table.
     Renders the advanced_dashboard template with metric types and their history.
     """
-    # Get all metric types with their units
-    result = await db.execute(
-        select(MetricType)
-        .options(selectinload(MetricType.unit))
-        .order_by(MetricType.name)
-    )
-    metric_types = result.scalars().all()
-
-    # Get historical data for each metric type
-    metric_history = {}
-    for metric_type in metric_types:
-        result = await db.execute(
-            select(Metric)
-            .options(
-                selectinload(Metric.metric_type),
-                selectinload(Metric.source),
-                selectinload(Metric.metric_metadata_items)
-            )
-            .filter(Metric.metric_type_id == metric_type.id)
-            .order_by(Metric.recorded_at.desc())
-            .limit(100)  # Increased limit for the advanced dashboard
-        )
-        metrics = result.scalars().all()
-        if metrics:
-            # Convert metrics to a serializable format
-            serialized_metrics = []
-            for metric in metrics:
-                # Safely handle source and metadata
-                source_data = {
-                    'id': str(metric.source.id) if metric.source else None,
-                    'name': metric.source.name if metric.source else None
-                } if metric.source else None
-                
-                metadata_items = [{
-                    'key': item.key,
-                    'value': item.value
-                } for item in metric.metric_metadata_items] if metric.metric_metadata_items else []
-                
-                metric_dict = {
-                    'id': str(metric.id),  # Convert UUID to string
-                    'value': metric.value,
-                    'recorded_at': metric.recorded_at.isoformat() if metric.recorded_at else None,
-                    'source': source_data,
-                    'metric_metadata': metadata_items,
-                    'metric_type_id': str(metric.metric_type_id)  # Convert UUID to string
-                }
-                serialized_metrics.append(metric_dict)
-            metric_history[str(metric_type.id)] = serialized_metrics
-
     return templates.TemplateResponse(
         "advanced_dashboard.html",
         {
             "request": request,
-            "metric_types": serialize_metric_types(metric_types),
-            "metric_history": metric_history,
+            "dashboard": await dashboard_data(db, 100),  # Increased limit for the advanced dashboard
             "settings": settings
         }
     )
 
 # Current dashboard route
 @app.get("/current")
-async def current_dashboard(request: Request, db: AsyncSession = Depends(get_db)):
+async def current_dashboard(request: Request, db: AsyncSession = Depends(get_read_db)):
     """
     Current dashboard view with time-relative line graphs and command controls.
     Renders the current_dashboard template with metric types and their history.
     """
-    # Get all metric types with their units
-    result = await db.execute(
-        select(MetricType)
-        .options(selectinload(MetricType.unit))
-        .order_by(MetricType.name)
-    )
-    metric_types = result.scalars().all()
-
-    # Get historical data for each metric type
-    metric_history = {}
-    for metric_type in metric_types:
-        result = await db.execute(
-            select(Metric)
-            .options(
-                selectinload(Metric.metric_type),
-                selectinload(Metric.source),
-                selectinload(Metric.metric_metadata_items)
-            )
-            .filter(Metric.metric_type_id == metric_type.id)
-            .order_by(Metric.recorded_at.desc())
-            .limit(100)  # Only get the last 100 metrics for performance
-        )
-        metrics = result.scalars().all()
-        if metrics:
-            # Convert metrics to a serializable format
-            serialized_metrics = []
-            for metric in metrics:
-                # Safely handle source and metadata
-                source_data = {
-                    'id': str(metric.source.id) if metric.source else None,
-                    'name': metric.source.name if metric.source else None
-                } if metric.source else None
-                
-                metadata_items = [{
-                    'key': item.key,
-                    'value': item.value
-                } for item in metric.metric_metadata_items] if metric.metric_metadata_items else []
-                
-                metric_dict = {
-                    'id': str(metric.id),
-                    'value': metric.value,
-                    'recorded_at': metric.recorded_at.isoformat() if metric.recorded_at else None,
-                    'source': source_data,
-                    'metric_metadata': metadata_items,
-                    'metric_type_id': str(metric.metric_type_id)
-                }
-                serialized_metrics.append(metric_dict)
-            metric_history[str(metric_type.id)] = serialized_metrics
-
     return templates.TemplateResponse(
         "current_dashboard.html",
         {
             "request": request,
-            "metric_types": serialize_metric_types(metric_types),
-            "metric_history": metric_history,
+            "dashboard": await dashboard_data(db, 100),  # Only get the last 100 metrics for performance
             "settings": settings
         }
     )
@@ -1,6 +1,6 @@
 from datetime import datetime
 import uuid
-from sqlalchemy import Column, String, Float, DateTime, ForeignKey, Text, JSON, func, Boolean, UniqueConstraint
+from sqlalchemy import BigInteger, Column, DDL, FetchedValue, Integer, Sequence, String, Float, DateTime, ForeignKey, Index, Text, JSON, event, func, Boolean, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship, validates
 from sqlalchemy.ext.declarative import declarative_base
@@ -41,7 +41,8 @@ class MetricType(Base):
     """Model for storing metric type definitions.
     
     This model defines the types of metrics that can be stored:
-    - id: UUID primary key for security
+    - key: Integer surrogate key referenced by metrics
+    - id: UUID public identifier for security
     - name: Unique identifier for the metric type (e.g., 'cpu_usage', 'memory_usage')
     - description: Detailed description of what this metric represents
     - unit_id: Foreign key reference to the unit of measurement
@@ -50,7 +51,8 @@ class MetricType(Base):
     """
     __tablename__ = "metric_types"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
+    key = Column(Integer, primary_key=True)
+    id = Column(UUID(as_uuid=True), unique=True, nullable=False, default=uuid.uuid4)
     name = Column(String(255), unique=True, nullable=False)
     description = Column(Text)
     unit_id = Column(UUID(as_uuid=True), ForeignKey("units.id"), nullable=False)
@@ -71,24 +73,30 @@ class Source(Base):
     """Model for storing metric sources.
     
     This model defines the sources from which metrics are collected:
-    - id: UUID primary key for security
+    - key: Integer surrogate key referenced by metrics
+    - id: UUID public identifier for security
     - name: Name of the source (e.g., 'server1', 'process2')
     - description: Detailed description of the source
     - ip_address: IP address of the source (optional)
     - created_at: When this source was defined
-    - is_active: Whether this source is currently active
+    - last_seen_at: When metrics from this source were last received
+    - is_active: Whether this source is currently active; maintained from
+      last_seen_at (see liveness.py)
     """
     __tablename__ = "sources"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
+    key = Column(Integer, primary_key=True)
+    id = Column(UUID(as_uuid=True), unique=True, nullable=False, default=uuid.uuid4)
     name = Column(String(255), unique=True, nullable=False)
     description = Column(Text)
     ip_address = Column(String(45))  # IPv6 compatible
     created_at = Column(DateTime, default=func.now())
+    last_seen_at = Column(DateTime)
     is_active = Column(Boolean, default=True)
     
-    # Relationship
+    # Relationships
     metrics = relationship("Metric", back_populates="source")
+    relay_clients = relationship("RelayClient", back_populates="source")
     
     @validates('name')
     def validate_name(self, key, name):
@@ -115,24 +123,53 @@ class Metric(Base):
     """Model for storing metric values.
     
     This model stores the actual metric measurements:
-    - id: UUID primary key for security
-    - metric_type_id: Reference to the metric type definition
-    - source_id: Reference to the source definition
+    - id: Integer primary key; the API shows it as a UUID (see metric_uuid)
+    - metric_type_key: Reference to the metric type definition
+    - source_key: Reference to the source definition
     - value: The numerical value of the metric
     - recorded_at: When the metric was recorded
+
+    This is the high-volume table, so rows reference types and sources by
+    their integer keys rather than UUIDs; metric_type_id and source_id give
+    the public UUIDs once the relationships are loaded.
+
+    Rows are stored in time partitions (see partitions.py), so recorded_at is
+    part of the table's primary key; the ORM still identifies a metric by id.
+    On SQLite this table is only the template the partitions are built from;
+    write and query metrics through the partitions module.
     """
     __tablename__ = "metrics"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
-    metric_type_id = Column(UUID(as_uuid=True), ForeignKey("metric_types.id", ondelete="CASCADE"), nullable=False)
-    source_id = Column(UUID(as_uuid=True), ForeignKey("sources.id"), nullable=False)
+    # Generated by the database: INTEGER on SQLite so each partition's id is its rowid
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, server_default=FetchedValue())
+    metric_type_key = Column(Integer, ForeignKey("metric_types.key", ondelete="CASCADE"), nullable=False)
+    source_key = Column(Integer, ForeignKey("sources.key"), nullable=False)
     value = Column(Float, nullable=False)
-    recorded_at = Column(DateTime, default=func.now(), index=True)
+    recorded_at = Column(DateTime, primary_key=True, default=func.now(), index=True)
 
     # Relationships
     metric_type = relationship("MetricType", back_populates="metrics")
     source = relationship("Source", back_populates="metrics")
-    metric_metadata_items = relationship("MetricMetadata", back_populates="metric", cascade="all, delete")
+    metric_metadata_items = relationship(
+        "MetricMetadata",
+        back_populates="metric",
+        cascade="all, delete",
+        primaryjoin="Metric.id == foreign(MetricMetadata.metric_id)"
+    )
+
+    __table_args__ = (
+        Index("ix_metrics_type_recorded_at", "metric_type_key", "recorded_at"),
+        {"postgresql_partition_by": "RANGE (recorded_at)"},
+    )
+    __mapper_args__ = {"primary_key": [id]}
+
+    @property
+    def metric_type_id(self):
+        return self.metric_type.id
+
+    @property
+    def source_id(self):
+        return self.source.id
     
     @validates('value')
     def validate_value(self, key, value):
@@ -140,6 +177,26 @@ class Metric(Base):
             raise ValueError("Metric value cannot be None")
         return float(value)
 
+# Metrics are identified by UUID in the API: a version 8 (custom) UUID that
+# holds the integer id in its low 62 bits, so it costs no storage. It is not
+# opaque: the id, and with it the partition's day on SQLite, can be read off
+# it. Metrics stored before migration e4a7c2d91f08 were renumbered and had
+# random UUIDs, which are no longer shown; see MetricLegacyId
+METRIC_UUID_BITS = (0x8 << 76) | (0b10 << 62)
+
+def metric_uuid(metric_id: int) -> uuid.UUID:
+    """The public UUID of the metric with the given integer id."""
+    return uuid.UUID(int=METRIC_UUID_BITS | metric_id)
+
+# On PostgreSQL every partition numbers its rows from one shared sequence;
+# SQLite partitions number their own (see partitions.py)
+metrics_id_seq = Sequence("metrics_id_seq", metadata=Base.metadata)
+event.listen(
+    Metric.__table__,
+    "after_create",
+    DDL("ALTER TABLE metrics ALTER COLUMN id SET DEFAULT nextval('metrics_id_seq')").execute_if(dialect="postgresql")
+)
+
 class MetricMetadata(Base):
     """Model for storing metric metadata.
     
@@ -153,13 +210,18 @@ class MetricMetadata(Base):
     __tablename__ = "metric_metadata"
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
-    metric_id = Column(UUID(as_uuid=True), ForeignKey("metrics.id", ondelete="CASCADE"), nullable=False)
+    # No foreign key: a partitioned table's primary key includes recorded_at
+    metric_id = Column(BigInteger, nullable=False, index=True)
     key = Column(String(255), nullable=False)
     value = Column(Text)
     created_at = Column(DateTime, default=func.now())
     
     # Relationship
-    metric = relationship("Metric", back_populates="metric_metadata_items")
+    metric = relationship(
+        "Metric",
+        back_populates="metric_metadata_items",
+        primaryjoin="foreign(MetricMetadata.metric_id) == Metric.id"
+    )
     
     __table_args__ = (
         UniqueConstraint('metric_id', 'key', name='unique_metadata_key_per_metric'),
@@ -170,3 +232,162 @@ class MetricMetadata(Base):
         if not value or len(value.strip()) == 0:
             raise ValueError("Metadata key cannot be empty")
         return value.strip()
+
+class MetricLegacyId(Base):
+    """Model mapping the UUIDs metrics had before they got integer ids.
+
+    Filled once by migration e4a7c2d91f08, so that clients holding an old
+    UUID can find the metric, and used by its downgrade to restore them:
+    - legacy_id: The metric's UUID before the migration
+    - metric_id: The metric's integer id
+    """
+    __tablename__ = "metric_legacy_ids"
+
+    legacy_id = Column(UUID(as_uuid=True), primary_key=True)
+    metric_id = Column(BigInteger, nullable=False, index=True)
+
+class ReplicationHeartbeat(Base):
+    """Model for the heartbeat the primary writes to measure replica lag.
+
+    A single row, stamped with the primary database's clock on every lag
+    check (see database.ReplicaRouter):
+    - id: Always 1
+    - beat_at: When the primary last wrote the row
+    """
+    __tablename__ = "replication_heartbeat"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    beat_at = Column(DateTime, nullable=False)
+
+class ApiKey(Base):
+    """Model for storing API keys issued to collectors, agents and dashboards.
+    
+    Only a SHA-256 hash of each key is stored:
+    - id: UUID primary key for security
+    - name: Unique label for the key holder (e.g., 'agent-web01')
+    - key_hash: Hex SHA-256 digest of the key
+    - scopes: Space-separated scopes granted to the key
+    - created_at: When this key was issued
+    - is_active: Whether this key is currently accepted
+    """
+    __tablename__ = "api_keys"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    name = Column(String(255), unique=True, nullable=False)
+    key_hash = Column(String(64), unique=True, nullable=False)
+    scopes = Column(String(255), nullable=False)
+    created_at = Column(DateTime, default=func.now())
+    is_active = Column(Boolean, default=True)
+    
+    @validates('name')
+    def validate_name(self, key, name):
+        if not name or len(name.strip()) == 0:
+            raise ValueError("API key name cannot be empty")
+        return name.strip()
+
+class AlertRule(Base):
+    """Model for storing alert rules evaluated as metrics are written.
+    
+    - id: UUID primary key for security
+    - name: Unique name of the rule
+    - metric_type_key: The metric type the rule watches
+    - source_key: The source it watches, or every source of the type when null
+    - kind: 'threshold' (value compared to threshold), 'rate' (change per
+      second over window_seconds compared to threshold) or 'absence' (no
+      points for window_seconds)
+    - operator: Comparison for threshold and rate rules ('>', '>=', '<', '<=')
+    - threshold: Value or rate the operator compares against
+    - window_seconds: Window of rate and absence rules
+    - created_at: When this rule was defined
+    - is_active: Whether this rule is currently evaluated
+    """
+    __tablename__ = "alert_rules"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    name = Column(String(255), unique=True, nullable=False)
+    metric_type_key = Column(Integer, ForeignKey("metric_types.key", ondelete="CASCADE"), nullable=False, index=True)
+    source_key = Column(Integer, ForeignKey("sources.key", ondelete="CASCADE"))
+    kind = Column(String(20), nullable=False)
+    operator = Column(String(2))
+    threshold = Column(Float)
+    window_seconds = Column(Float)
+    created_at = Column(DateTime, default=func.now())
+    is_active = Column(Boolean, default=True)
+
+    # Relationships
+    metric_type = relationship("MetricType")
+    source = relationship("Source")
+    alerts = relationship("Alert", back_populates="rule", cascade="all, delete")
+
+    @property
+    def metric_type_id(self):
+        return self.metric_type.id
+
+    @property
+    def source_id(self):
+        return self.source.id if self.source else None
+
+    @validates('name')
+    def validate_name(self, key, name):
+        if not name or len(name.strip()) == 0:
+            raise ValueError("Alert rule name cannot be empty")
+        return name.strip()
+
+class Alert(Base):
+    """Model for storing alerts raised by alert rules.
+    
+    One row per time a rule fires for a source:
+    - id: UUID primary key for security
+    - rule_id: The rule that fired
+    - source_key: The source it fired for
+    - value: The value or rate that fired it (null for absence rules)
+    - fired_at: When it fired
+    - resolved_at: When it resolved, or null while it is firing
+    """
+    __tablename__ = "alerts"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    rule_id = Column(UUID(as_uuid=True), ForeignKey("alert_rules.id", ondelete="CASCADE"), nullable=False, index=True)
+    source_key = Column(Integer, ForeignKey("sources.key", ondelete="CASCADE"), nullable=False)
+    value = Column(Float)
+    fired_at = Column(DateTime, nullable=False, index=True)
+    resolved_at = Column(DateTime)
+
+    # Relationships
+    rule = relationship("AlertRule", back_populates="alerts")
+    source = relationship("Source")
+
+    @property
+    def source_id(self):
+        return self.source.id
+
+class RelayClient(Base):
+    """Model for storing the command relay's registered agents.
+    
+    The relay serves clients from memory (see command_relay.py); this table
+    keeps them across restarts:
+    - client_id: Identifier the agent registered with
+    - source_key: The source with the agent's hostname, whose metrics come
+      from the same machine
+    - client_type: Kind of agent
+    - hostname: Hostname the agent reported
+    - ip_address: Address the agent registered from
+    - status: Last reported status
+    - last_command_id: Last command the agent reported on
+    - registered_at: When the agent last registered
+    - last_seen_at: When the agent last made contact, written in batches
+    """
+    __tablename__ = "relay_clients"
+
+    client_id = Column(String(255), primary_key=True)
+    source_key = Column(Integer, ForeignKey("sources.key", ondelete="SET NULL"), index=True)
+    client_type = Column(String(255), nullable=False)
+    hostname = Column(String(255), nullable=False)
+    ip_address = Column(String(45))
+    status = Column(String(50), nullable=False)
+    last_command_id = Column(String(255))
+    registered_at = Column(DateTime, nullable=False)
+    last_seen_at = Column(DateTime, nullable=False, index=True)
+
+    # Relationship
+    source = relationship("Source", back_populates="relay_clients")
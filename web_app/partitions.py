@@ -0,0 +1,488 @@
+"""Time-partitioned metric storage.
+
+Metrics live in one table per period (a day or a week, see
+``PARTITION_INTERVAL``), named after the period's first day, e.g.
+``metrics_p20261019``:
+
+- PostgreSQL: ``metrics`` is declaratively partitioned by range of
+  ``recorded_at`` and each period is a partition of it. Writes and queries
+  go through ``metrics`` and the planner prunes partitions itself.
+- SQLite: each period is a standalone table with the same columns and
+  ``metrics`` stays empty as their template. Writes are routed to the
+  period's table and queries select from a UNION ALL of only the tables
+  overlapping the requested range. Each table's id is its rowid, numbered
+  from a range reserved for the period so ids stay unique across tables.
+
+Partitions are created ahead of time by the maintenance task (and by the
+migration for existing data), and on demand when older data is backfilled.
+Retention drops whole partitions instead of deleting rows, and with an
+archive configured old partitions are moved out to it (see archive.py).
+"""
+import asyncio
+import logging
+import re
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Collection, Dict, Iterable, List, Optional, Set
+from sqlalchemy import Column, Index, MetaData, Table, delete, func, inspect, insert, select, text, union_all, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import aliased, selectinload
+
+from .config import get_settings
+from .models import Metric, MetricType
+from .shared_state import is_leader
+
+if TYPE_CHECKING:
+    from .archive import MetricArchive
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+PARTITION_PREFIX = f"{Metric.__tablename__}_p"
+PARTITION_NAME = re.compile(rf"^{PARTITION_PREFIX}(\d{{8}})$")
+
+# Seconds a reader trusts its list of partitions before reloading it
+CATALOG_TTL = 5.0
+
+# SQLite allows at most 500 terms in one compound SELECT
+SQLITE_UNION_LIMIT = 400
+
+# Bits of a SQLite metric id numbering rows within a partition; the bits
+# above hold the partition's day number
+SQLITE_ID_BITS = 32
+
+
+def period_start(day: date) -> date:
+    """First day of the partition period containing ``day``."""
+    if settings.PARTITION_INTERVAL == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def period_end(start: date) -> date:
+    return start + timedelta(days=7 if settings.PARTITION_INTERVAL == "week" else 1)
+
+
+def period_starts(timestamps: Iterable[datetime]) -> Set[date]:
+    """The periods a set of timestamps fall in."""
+    return {period_start(day) for day in {timestamp.date() for timestamp in timestamps}}
+
+
+def midnight(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day)
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def partition_name(start: date) -> str:
+    return f"{PARTITION_PREFIX}{start:%Y%m%d}"
+
+
+def retention_cutoff() -> Optional[datetime]:
+    """Metrics recorded before this are expired, or None to keep everything."""
+    if settings.METRIC_RETENTION_DAYS <= 0:
+        return None
+    return midnight(utc_now().date() - timedelta(days=settings.METRIC_RETENTION_DAYS))
+
+
+partition_metadata = MetaData()
+
+
+def partition_table(name: str) -> Table:
+    """The SQLite table for one partition, with the same columns as ``metrics``.
+
+    Only id is the primary key, making it the table's rowid.
+    """
+    table = partition_metadata.tables.get(name)
+    if table is None:
+        table = Table(
+            name,
+            partition_metadata,
+            *(
+                Column(column.name, column.type, primary_key=column is Metric.__table__.c.id, nullable=column.nullable)
+                for column in Metric.__table__.columns
+            ),
+            Index(f"ix_{name}_recorded_at", "recorded_at"),
+            Index(f"ix_{name}_type_recorded_at", "metric_type_key", "recorded_at"),
+            sqlite_autoincrement=True,
+        )
+    return table
+
+
+def first_sqlite_id(start: date) -> int:
+    """The id after which the SQLite partition starting on ``start`` numbers its rows."""
+    return (start - date(1970, 1, 1)).days << SQLITE_ID_BITS
+
+
+def create_partition(connection: Connection, start: date):
+    """Create the partition for the period beginning on ``start`` if it doesn't exist."""
+    name = partition_name(start)
+    if connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {Metric.__tablename__} "
+            f"FOR VALUES FROM ('{midnight(start)}') TO ('{midnight(period_end(start))}')"
+        )
+    elif not inspect(connection).has_table(name):
+        partition_table(name).create(connection)
+        # An archived partition's sequence is kept, so recreating it never reuses ids
+        connection.execute(
+            text(
+                "INSERT INTO sqlite_sequence (name, seq) SELECT :name, :seq "
+                "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)"
+            ),
+            {"name": name, "seq": first_sqlite_id(start)}
+        )
+
+
+def list_partitions(connection: Connection) -> Set[date]:
+    starts = set()
+    for name in inspect(connection).get_table_names():
+        match = PARTITION_NAME.match(name)
+        if match:
+            starts.add(datetime.strptime(match.group(1), "%Y%m%d").date())
+    return starts
+
+
+class PartitionCatalog:
+    """The partitions known to exist in one database."""
+
+    def __init__(self):
+        self.starts: Set[date] = set()
+        self.loaded_at = float("-inf")
+
+    def overlapping(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[date]:
+        """Partitions holding rows in [start, end), oldest first, excluding expired ones."""
+        cutoff = retention_cutoff()
+        if cutoff is not None and (start is None or start < cutoff):
+            start = cutoff
+        return sorted(
+            partition for partition in self.starts
+            if (start is None or midnight(period_end(partition)) > start)
+            and (end is None or midnight(partition) < end)
+        )
+
+
+# One catalog per engine: replicas and the primary can hold different partitions
+catalogs: Dict[Engine, PartitionCatalog] = {}
+
+
+async def get_catalog(db: AsyncSession, max_age: Optional[float] = None) -> PartitionCatalog:
+    catalog = catalogs.setdefault(db.get_bind(), PartitionCatalog())
+    if time.monotonic() - catalog.loaded_at > (CATALOG_TTL if max_age is None else max_age):
+        connection = await db.connection()
+        catalog.starts = await connection.run_sync(list_partitions)
+        catalog.loaded_at = time.monotonic()
+    return catalog
+
+
+def is_sqlite_session(db: AsyncSession) -> bool:
+    return db.get_bind().dialect.name == "sqlite"
+
+
+async def ensure_partitions(db: AsyncSession, starts: Iterable[date]):
+    """Create any missing partitions in the session's transaction."""
+    catalog = await get_catalog(db)
+    missing = set(starts) - catalog.starts
+    if missing:
+        # Another worker may have created them since the catalog was loaded
+        catalog = await get_catalog(db, max_age=0)
+        missing -= catalog.starts
+    if not missing:
+        return
+
+    connection = await db.connection()
+    for start in sorted(missing):
+        await connection.run_sync(create_partition, start)
+        logger.info(f"Created metrics partition {partition_name(start)}")
+    # Reload on next use rather than trusting tables that may yet be rolled back
+    catalog.loaded_at = float("-inf")
+
+
+async def metric_entity(db: AsyncSession, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """The entity to select metrics recorded in [start, end) from.
+
+    On PostgreSQL this is ``Metric`` itself; filter on recorded_at and the
+    planner prunes partitions. On SQLite it is ``Metric`` mapped onto the
+    partition tables overlapping the range, so only those are read.
+    """
+    if not is_sqlite_session(db):
+        return Metric
+
+    catalog = await get_catalog(db)
+    tables = [partition_table(partition_name(start)) for start in catalog.overlapping(start, end)]
+    if not tables:
+        # The empty template table
+        return Metric
+    if len(tables) == 1:
+        return aliased(Metric, tables[0], name=Metric.__tablename__, adapt_on_names=True)
+
+    selects = [select(table) for table in tables]
+    while len(selects) > SQLITE_UNION_LIMIT:
+        selects = [
+            select(union_all(*selects[i:i + SQLITE_UNION_LIMIT]).subquery())
+            for i in range(0, len(selects), SQLITE_UNION_LIMIT)
+        ]
+    return aliased(
+        Metric, union_all(*selects).subquery(Metric.__tablename__), name=Metric.__tablename__, adapt_on_names=True
+    )
+
+
+def with_relationships(query, entity):
+    return query.options(
+        selectinload(entity.metric_type).selectinload(MetricType.unit),
+        selectinload(entity.source),
+        selectinload(entity.metric_metadata_items)
+    )
+
+
+async def newest_first(db: AsyncSession):
+    """Yield (entity, start, end) windows over past partitions, newest first.
+
+    Each window covers twice as many partitions as the one before, so finding
+    the last few points of a rarely written metric takes a handful of queries
+    however many partitions there are.
+    """
+    catalog = await get_catalog(db)
+    current = period_start(utc_now().date())
+    starts = [start for start in reversed(catalog.overlapping()) if start <= current]
+    size = 1
+    while starts:
+        window, starts = starts[:size], starts[size:]
+        start, end = midnight(window[-1]), midnight(period_end(window[0]))
+        yield await metric_entity(db, start, end), start, end
+        size *= 2
+
+
+async def recent_metrics(
+    db: AsyncSession, limit: int, metric_type_key: Optional[int] = None, source_key: Optional[int] = None
+) -> List[Metric]:
+    """The newest metrics, optionally of one type and source, with relationships loaded."""
+    found: List[Metric] = []
+    async for entity, start, end in newest_first(db):
+        query = select(entity).where(entity.recorded_at >= start, entity.recorded_at < end)
+        if metric_type_key is not None:
+            query = query.where(entity.metric_type_key == metric_type_key)
+        if source_key is not None:
+            query = query.where(entity.source_key == source_key)
+        query = with_relationships(query, entity).order_by(entity.recorded_at.desc()).limit(limit - len(found))
+        found.extend((await db.execute(query)).scalars().all())
+        if len(found) >= limit:
+            break
+    return found
+
+
+async def recent_metrics_by_type(db: AsyncSession, limit: int, metric_type_keys: Collection[int]) -> Dict[int, List[Metric]]:
+    """The newest ``limit`` metrics of each of the given types, newest first, with relationships loaded.
+
+    Each window of partitions takes one query ranking the points of every
+    type still short of ``limit``, instead of one query per type.
+    """
+    found: Dict[int, List[Metric]] = {key: [] for key in metric_type_keys}
+    async for entity, start, end in newest_first(db):
+        short = [key for key, metrics in found.items() if len(metrics) < limit]
+        if not short:
+            break
+        numbered = select(
+            entity,
+            func.row_number().over(
+                partition_by=entity.metric_type_key,
+                order_by=entity.recorded_at.desc()
+            ).label("rank")
+        ).where(
+            entity.recorded_at >= start, entity.recorded_at < end, entity.metric_type_key.in_(short)
+        ).subquery()
+        ranked = aliased(Metric, numbered, adapt_on_names=True)
+        query = with_relationships(select(ranked), ranked).where(numbered.c.rank <= limit).order_by(
+            ranked.metric_type_key, ranked.recorded_at.desc()
+        )
+        for metric in (await db.execute(query)).scalars():
+            metrics = found[metric.metric_type_key]
+            if len(metrics) < limit:
+                metrics.append(metric)
+    return found
+
+
+async def metrics_in_range(
+    db: AsyncSession,
+    start: datetime,
+    end: datetime,
+    metric_type_key: Optional[int] = None,
+    source_key: Optional[int] = None,
+    limit: Optional[int] = None,
+    metric_ids: Optional[Collection[int]] = None
+) -> List[Metric]:
+    """Metrics recorded in [start, end), oldest first, read only from overlapping partitions."""
+    entity = await metric_entity(db, start, end)
+    query = select(entity).where(entity.recorded_at >= start, entity.recorded_at < end)
+    if metric_type_key is not None:
+        query = query.where(entity.metric_type_key == metric_type_key)
+    if source_key is not None:
+        query = query.where(entity.source_key == source_key)
+    if metric_ids is not None:
+        query = query.where(entity.id.in_(metric_ids))
+    query = with_relationships(query, entity).order_by(entity.recorded_at)
+    if limit is not None:
+        query = query.limit(limit)
+    return (await db.execute(query)).scalars().all()
+
+
+# Columns that identify an inserted row when its generated id comes back
+RETURNED_COLUMNS = ("metric_type_key", "source_key", "recorded_at", "value")
+
+
+async def insert_metrics(db: AsyncSession, rows: List[dict], returning: bool = False):
+    """Insert metric rows, creating the partitions they fall in if needed.
+
+    Rows need a naive UTC recorded_at. PostgreSQL routes them through the
+    partitioned ``metrics`` table; on SQLite each period's rows are inserted
+    into its own table. With ``returning`` each row's generated id is stored
+    back in it.
+    """
+    by_day = defaultdict(list)
+    for row in rows:
+        by_day[row["recorded_at"].date()].append(row)
+    by_period = defaultdict(list)
+    for day, day_rows in by_day.items():
+        by_period[period_start(day)].extend(day_rows)
+
+    await ensure_partitions(db, by_period)
+    if is_sqlite_session(db):
+        tables = [(partition_table(partition_name(start)), period_rows) for start, period_rows in by_period.items()]
+    else:
+        tables = [(Metric.__table__, rows)]
+    for table, table_rows in tables:
+        if not returning:
+            await db.execute(insert(table), table_rows)
+            continue
+        # Asking for the ids in parameter order makes SQLAlchemy insert one row
+        # at a time, so every column is returned and matched to its row instead
+        result = await db.execute(
+            insert(table).returning(table.c.id, *(table.c[column] for column in RETURNED_COLUMNS)),
+            table_rows
+        )
+        unmatched = defaultdict(list)
+        for row in table_rows:
+            unmatched[tuple(row[column] for column in RETURNED_COLUMNS)].append(row)
+        for metric_id, *values in result.all():
+            unmatched[tuple(values)].pop()["id"] = metric_id
+
+
+async def move_legacy_rows(db: AsyncSession):
+    """Move rows written to the SQLite template table before partitioning into partitions."""
+    if await db.scalar(select(Metric.id).limit(1)) is None:
+        return
+
+    await db.execute(update(Metric).where(Metric.recorded_at.is_(None)).values(recorded_at=func.now()))
+    days = (await db.execute(select(func.distinct(func.date(Metric.recorded_at))))).scalars().all()
+    starts = {period_start(date.fromisoformat(day)) for day in days if day}
+    await ensure_partitions(db, starts)
+    columns = [column.name for column in Metric.__table__.columns]
+    for start in starts:
+        await db.execute(
+            insert(partition_table(partition_name(start))).from_select(
+                columns,
+                select(*Metric.__table__.columns).where(
+                    Metric.recorded_at >= midnight(start),
+                    Metric.recorded_at < midnight(period_end(start))
+                )
+            )
+        )
+    await db.execute(delete(Metric))
+    logger.info(f"Moved existing metrics into {len(starts)} partitions")
+
+
+async def drop_expired_partitions(db: AsyncSession) -> List[str]:
+    """Drop partitions entirely older than the retention period."""
+    cutoff = retention_cutoff()
+    if cutoff is None:
+        return []
+
+    catalog = await get_catalog(db, max_age=0)
+    expired = [start for start in sorted(catalog.starts) if midnight(period_end(start)) <= cutoff]
+    connection = await db.connection()
+    for start in expired:
+        await connection.exec_driver_sql(f"DROP TABLE IF EXISTS {partition_name(start)}")
+    catalog.starts -= set(expired)
+    return [partition_name(start) for start in expired]
+
+
+def archive_cutoff() -> datetime:
+    """Partitions ending before this are moved to the archive."""
+    return midnight(utc_now().date() - timedelta(days=settings.ARCHIVE_AFTER_DAYS))
+
+
+async def archive_old_partitions(db: AsyncSession, archive: "MetricArchive") -> List[str]:
+    """Move partitions entirely older than ARCHIVE_AFTER_DAYS into the archive.
+
+    Each partition is written out before it is dropped, so a failure part
+    way leaves its rows in the database to be archived again next time.
+    """
+    cutoff = archive_cutoff()
+    catalog = await get_catalog(db, max_age=0)
+    old = [start for start in sorted(catalog.starts) if midnight(period_end(start)) <= cutoff]
+    connection = await db.connection()
+    for start in old:
+        name = partition_name(start)
+        table = partition_table(name) if is_sqlite_session(db) else Metric.__table__
+        result = await db.execute(
+            select(table.c.id, table.c.metric_type_key, table.c.source_key, table.c.value, table.c.recorded_at)
+            .where(table.c.recorded_at >= midnight(start), table.c.recorded_at < midnight(period_end(start)))
+        )
+        rows = result.all()
+        if rows:
+            columns = {name: list(values) for name, values in zip(result.keys(), zip(*rows))}
+            await asyncio.to_thread(archive.write, start, period_end(start), columns)
+        if is_sqlite_session(db):
+            # DROP TABLE deletes the sequence; keep it so a recreated partition never reuses ids
+            seq = await db.scalar(text("SELECT seq FROM sqlite_sequence WHERE name = :name"), {"name": name})
+        await connection.exec_driver_sql(f"DROP TABLE IF EXISTS {name}")
+        if is_sqlite_session(db):
+            await db.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"), {"name": name, "seq": seq})
+        catalog.starts.discard(start)
+    return [partition_name(start) for start in old]
+
+
+async def maintain_partitions(session_factory: async_sessionmaker, archive: Optional["MetricArchive"] = None):
+    """Create upcoming partitions, move legacy SQLite rows, archive old partitions and apply retention."""
+    async with session_factory() as db:
+        current = period_start(utc_now().date())
+        upcoming = [current]
+        for _ in range(settings.PARTITION_PRECREATE):
+            upcoming.append(period_end(upcoming[-1]))
+        await ensure_partitions(db, upcoming)
+        if is_sqlite_session(db):
+            await move_legacy_rows(db)
+        archived = await archive_old_partitions(db, archive) if archive is not None else []
+        dropped = await drop_expired_partitions(db)
+        await db.commit()
+    if archived:
+        logger.info(f"Archived metrics partitions: {', '.join(archived)}")
+    if dropped:
+        logger.info(f"Dropped expired metrics partitions: {', '.join(dropped)}")
+    cutoff = retention_cutoff()
+    if archive is not None and cutoff is not None:
+        expired = await asyncio.to_thread(archive.expire, cutoff)
+        if expired:
+            logger.info(f"Deleted expired metrics archives: {', '.join(expired)}")
+
+
+def start_partition_maintenance(
+    session_factory: async_sessionmaker, interval: float = 3600, archive: Optional["MetricArchive"] = None
+):
+    """Run partition maintenance in the background every ``interval`` seconds."""
+    async def maintenance_task():
+        while True:
+            await asyncio.sleep(interval)
+            if not is_leader():
+                continue
+            try:
+                await maintain_partitions(session_factory, archive)
+            except Exception:
+                logger.exception("Metrics partition maintenance failed")
+
+    asyncio.create_task(maintenance_task())
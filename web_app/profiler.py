@@ -0,0 +1,196 @@
+"""Per-request SQL profiler for staging and debugging.
+
+With ``PROFILER_ENABLED`` every SQL statement a request issues is recorded
+from SQLAlchemy's cursor events. Statements are grouped by shape (the SQL
+with expanded IN lists and literals collapsed), and a shape run
+``PROFILER_REPEAT_THRESHOLD`` times or more in one request is flagged as a
+likely N+1 and logged. Every response carries a ``Server-Timing`` header
+with the time spent in the database and in total, and an ``X-Profile-Id``
+under which the full profile is served as JSON at
+``/api/debug/profiles/{id}`` while it is among the last ``PROFILER_KEEP``.
+"""
+import itertools
+import logging
+import re
+import time
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .auth import SCOPE_ADMIN, Principal, require_scope
+from .config import get_settings
+from .instrumentation import route_label
+
+logger = logging.getLogger(__name__)
+
+# Expanded IN lists, e.g. "(?, ?, ?)" or "($1, $2)", and inline literals
+PARAMETER_LIST = re.compile(r"\(\s*(?:\?|\$\d+|%s)(?:\s*,\s*(?:\?|\$\d+|%s))*\s*\)")
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """The statement with whitespace normalized and parameter lists and literals collapsed."""
+    shape = WHITESPACE.sub(" ", statement).strip()
+    shape = LITERAL.sub("?", shape)
+    return PARAMETER_LIST.sub("(?)", shape)
+
+
+class RequestProfile:
+    """Every statement one request issued."""
+
+    def __init__(self, profile_id: int, method: str, path: str):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.route: Optional[str] = None
+        self.status: Optional[int] = None
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.statements: List[Dict[str, Any]] = []
+
+    @property
+    def query_seconds(self) -> float:
+        return sum(statement["duration_ms"] for statement in self.statements) / 1000
+
+    def repeated(self, threshold: int) -> Dict[str, int]:
+        """Statement shapes run at least ``threshold`` times."""
+        counts = Counter(statement["shape"] for statement in self.statements)
+        return {shape: count for shape, count in counts.items() if count >= threshold}
+
+    def server_timing(self) -> str:
+        elapsed = (time.perf_counter() - self.started) * 1000
+        return (
+            f'db;dur={self.query_seconds * 1000:.1f};desc="{len(self.statements)} queries", '
+            f"total;dur={elapsed:.1f}"
+        )
+
+    def to_dict(self, threshold: int) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "duration_ms": round(self.duration * 1000, 3),
+            "query_count": len(self.statements),
+            "query_ms": round(self.query_seconds * 1000, 3),
+            "repeated": self.repeated(threshold),
+            "statements": self.statements,
+        }
+
+
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_profile.get() is not None:
+        conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile.get()
+    if profile is None or not conn.info.get("profile_start"):
+        return
+    elapsed = time.perf_counter() - conn.info["profile_start"].pop()
+    profile.statements.append({
+        "statement": statement,
+        "shape": statement_shape(statement),
+        "executemany": executemany,
+        "duration_ms": round(elapsed * 1000, 3),
+    })
+
+
+def handle_error(exception_context):
+    starts = exception_context.connection.info.get("profile_start") if exception_context.connection else None
+    if starts:
+        starts.pop()
+
+
+def install_profiler_hooks():
+    """Record the statements of profiled requests on every engine."""
+    if not event.contains(Engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+        event.listen(Engine, "handle_error", handle_error)
+
+
+# Recent profiles by id, oldest first
+profiles: "OrderedDict[int, RequestProfile]" = OrderedDict()
+profile_ids = itertools.count(1)
+
+
+class ProfilerMiddleware:
+    """Profile the SQL of every request, flag repeated statements and add Server-Timing."""
+
+    def __init__(self, app: ASGIApp, repeat_threshold: int = 5, keep: int = 100):
+        self.app = app
+        self.repeat_threshold = repeat_threshold
+        self.keep = keep
+        install_profiler_hooks()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(next(profile_ids), scope["method"], scope["path"])
+        token = current_profile.set(profile)
+
+        async def send_with_timing(message: Message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", profile.server_timing())
+                if self.keep:
+                    headers["X-Profile-Id"] = str(profile.id)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_profile.reset(token)
+            self.finish(profile, scope)
+
+    def finish(self, profile: RequestProfile, scope: Scope):
+        profile.duration = time.perf_counter() - profile.started
+        profile.route = route_label(scope)
+        for shape, count in profile.repeated(self.repeat_threshold).items():
+            logger.warning(f"Possible N+1: {profile.method} {profile.route} ran {count}x: {shape[:200]}")
+        if self.keep:
+            profiles[profile.id] = profile
+            while len(profiles) > self.keep:
+                profiles.popitem(last=False)
+
+
+router = APIRouter(prefix="/api/debug", tags=["debug"])
+
+
+@router.get("/profiles")
+async def list_profiles(
+    principal: Principal = Depends(require_scope(SCOPE_ADMIN))
+):
+    """Summaries of the recent request profiles, newest first."""
+    threshold = get_settings().PROFILER_REPEAT_THRESHOLD
+    return [
+        {key: value for key, value in profile.to_dict(threshold).items() if key != "statements"}
+        for profile in reversed(profiles.values())
+    ]
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(
+    profile_id: int,
+    principal: Principal = Depends(require_scope(SCOPE_ADMIN))
+):
+    """Every statement one profiled request issued."""
+    profile = profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile.to_dict(get_settings().PROFILER_REPEAT_THRESHOLD)
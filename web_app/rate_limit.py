@@ -0,0 +1,290 @@
+import asyncio
+import math
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Security
+
+from .auth import SCOPE_INGEST, Principal, require_scope
+from .config import get_settings
+from .instrumentation import registry
+
+
+class RateLimitBackend:
+    """Storage for token buckets.
+
+    ``take`` removes ``cost`` tokens from the bucket named ``key`` and returns
+    0 when the request is admitted, or the number of seconds to wait before
+    retrying. A request costing more than the whole burst is admitted when the
+    bucket is full and leaves it in debt, so large batches are slowed down
+    rather than rejected forever.
+    """
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1) -> float:
+        raise NotImplementedError
+
+    async def take_all(self, costs: Dict[str, float], rate: float, burst: float) -> Tuple[Optional[str], float]:
+        """Take ``costs[key]`` from every bucket, or from none of them.
+
+        Returns (None, 0) when every bucket admitted its cost, otherwise the
+        key of a bucket that did not and the seconds to wait.
+        """
+        raise NotImplementedError
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Per-process token buckets kept in a dict of [tokens, last refill] pairs."""
+
+    def __init__(self, max_buckets: int = 100_000):
+        self.buckets: Dict[str, List[float]] = {}
+        self.max_buckets = max_buckets
+
+    def refill(self, key: str, rate: float, burst: float, now: float) -> List[float]:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_buckets:
+                self.prune(now)
+            bucket = self.buckets[key] = [burst, now]
+        else:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        return bucket
+
+    def take_now(self, key: str, rate: float, burst: float, cost: float = 1) -> float:
+        bucket = self.refill(key, rate, burst, time.monotonic())
+        if bucket[0] >= min(cost, burst):
+            bucket[0] -= cost
+            return 0.0
+        return (min(cost, burst) - bucket[0]) / rate
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1) -> float:
+        return self.take_now(key, rate, burst, cost)
+
+    async def take_all(self, costs: Dict[str, float], rate: float, burst: float) -> Tuple[Optional[str], float]:
+        now = time.monotonic()
+        buckets = {key: self.refill(key, rate, burst, now) for key in costs}
+        for key, cost in costs.items():
+            if buckets[key][0] < min(cost, burst):
+                return key, (min(cost, burst) - buckets[key][0]) / rate
+        for key, cost in costs.items():
+            buckets[key][0] -= cost
+        return None, 0.0
+
+    def prune(self, now: float):
+        """Forget buckets idle long enough to have refilled completely."""
+        idle_after = 3600
+        self.buckets = {
+            key: bucket for key, bucket in self.buckets.items()
+            if now - bucket[1] < idle_after
+        }
+
+
+# Token bucket update run atomically inside Redis, using the server clock
+REDIS_TOKEN_BUCKET = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local needed = math.min(cost, burst)
+local retry = 0
+if tokens >= needed then
+    tokens = tokens - cost
+else
+    retry = (needed - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil((burst + math.max(0, -tokens)) / rate) + 1)
+return tostring(retry)
+"""
+
+# Several buckets checked first and charged only if all of them admit their cost
+REDIS_TOKEN_BUCKETS = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local current = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens[i] = math.min(burst, current + math.max(0, now - ts) * rate)
+    local needed = math.min(tonumber(ARGV[i + 2]), burst)
+    if tokens[i] < needed then
+        return {i, tostring((needed - tokens[i]) / rate)}
+    end
+end
+for i, key in ipairs(KEYS) do
+    local left = tokens[i] - tonumber(ARGV[i + 2])
+    redis.call('HSET', key, 'tokens', left, 'ts', now)
+    redis.call('EXPIRE', key, math.ceil((burst + math.max(0, -left)) / rate) + 1)
+end
+return {0, '0'}
+"""
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """Token buckets shared by every worker through a Redis-compatible server."""
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_BACKEND_URL requires the 'redis' package")
+        self.client = redis.from_url(url)
+        self.script = self.client.register_script(REDIS_TOKEN_BUCKET)
+        self.multi_script = self.client.register_script(REDIS_TOKEN_BUCKETS)
+        self.prefix = prefix
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1) -> float:
+        retry_after = await self.script(keys=[self.prefix + key], args=[rate, burst, cost])
+        return float(retry_after)
+
+    async def take_all(self, costs: Dict[str, float], rate: float, burst: float) -> Tuple[Optional[str], float]:
+        keys = list(costs)
+        index, retry_after = await self.multi_script(
+            keys=[self.prefix + key for key in keys], args=[rate, burst, *costs.values()]
+        )
+        if not index:
+            return None, 0.0
+        return keys[int(index) - 1], float(retry_after)
+
+
+class RateLimiter:
+    """Admission control for write endpoints.
+
+    Limits requests per API key and metric points per source with token
+    buckets, and caps the number of write requests in flight so a flood of
+    ingestion cannot monopolise the database writer.
+    """
+
+    def __init__(
+        self,
+        backend: RateLimitBackend,
+        key_rate: float,
+        key_burst: float,
+        source_rate: float,
+        source_burst: float,
+        write_concurrency: int,
+        write_queue_timeout: float,
+    ):
+        self.backend = backend
+        self.key_rate = key_rate
+        self.key_burst = key_burst
+        self.source_rate = source_rate
+        self.source_burst = source_burst
+        self.write_slots = asyncio.Semaphore(write_concurrency)
+        self.write_queue_timeout = write_queue_timeout
+        self.writes_in_flight = 0
+        self.writes_waiting = 0
+
+    @staticmethod
+    def reject(retry_after: float, detail: str):
+        raise HTTPException(
+            status_code=429,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    async def check_key(self, key_hash: str):
+        retry_after = await self.backend.take(f"key:{key_hash}", self.key_rate, self.key_burst)
+        if retry_after:
+            write_rejections.inc("key_rate")
+            self.reject(retry_after, "Rate limit exceeded for API key")
+
+    async def check_sources(self, source_points: Dict[int, int]):
+        """Charge each source for its points, or none of them if one is over its limit."""
+        rejected, retry_after = await self.backend.take_all(
+            {f"source:{source}": points for source, points in source_points.items()},
+            self.source_rate, self.source_burst
+        )
+        if rejected is not None:
+            write_rejections.inc("source_rate")
+            self.reject(retry_after, f"Rate limit exceeded for source {rejected[len('source:'):]}")
+
+    async def acquire_write_slot(self):
+        # Acquiring a free slot never blocks, so skip the cost of wait_for
+        if not self.write_slots.locked():
+            await self.write_slots.acquire()
+            self.writes_in_flight += 1
+            return
+        self.writes_waiting += 1
+        try:
+            await asyncio.wait_for(self.write_slots.acquire(), self.write_queue_timeout)
+        except asyncio.TimeoutError:
+            write_rejections.inc("queue_timeout")
+            self.reject(self.write_queue_timeout, "Too many concurrent write requests")
+        finally:
+            self.writes_waiting -= 1
+        self.writes_in_flight += 1
+
+    def release_write_slot(self):
+        self.writes_in_flight -= 1
+        self.write_slots.release()
+
+
+@lru_cache()
+def get_rate_limiter() -> Optional[RateLimiter]:
+    """Create the rate limiter from settings, or None when limiting is disabled."""
+    settings = get_settings()
+    if not settings.RATE_LIMIT_ENABLED:
+        return None
+
+    # Workers sharing state through Redis share their limits there too
+    url = settings.RATE_LIMIT_BACKEND_URL
+    if not url and settings.STATE_BACKEND_URL.startswith(("redis:", "rediss:", "unix:")):
+        url = settings.STATE_BACKEND_URL
+    if url:
+        backend = RedisRateLimitBackend(url)
+    else:
+        backend = InMemoryRateLimitBackend()
+
+    return RateLimiter(
+        backend,
+        key_rate=settings.RATE_LIMIT_KEY_PER_SECOND,
+        key_burst=settings.RATE_LIMIT_KEY_BURST,
+        source_rate=settings.RATE_LIMIT_SOURCE_POINTS_PER_SECOND,
+        source_burst=settings.RATE_LIMIT_SOURCE_BURST,
+        write_concurrency=settings.WRITE_CONCURRENCY_LIMIT,
+        write_queue_timeout=settings.WRITE_QUEUE_TIMEOUT,
+    )
+
+
+def write_queue() -> Dict[str, int]:
+    limiter = get_rate_limiter()
+    if limiter is None:
+        return {}
+    return {"in_flight": limiter.writes_in_flight, "waiting": limiter.writes_waiting}
+
+
+write_rejections = registry.counter("write_rejections", "Write requests rejected by admission control.", ("reason",))
+registry.gauge("write_requests", "Write requests holding or waiting for a write slot.", write_queue, ("state",))
+
+
+async def admit_write(principal: Principal = Security(require_scope(SCOPE_INGEST))):
+    """Dependency for write endpoints: authenticate, rate limit and take a write slot."""
+    limiter = get_rate_limiter()
+    if limiter is None:
+        yield principal
+        return
+
+    await limiter.check_key(principal.key_hash)
+    await limiter.acquire_write_slot()
+    try:
+        yield principal
+    finally:
+        limiter.release_write_slot()
+
+
+async def check_source_rate(source_points: Dict[int, int]):
+    """Charge each source, by its integer key, for the points it is writing, all or nothing."""
+    limiter = get_rate_limiter()
+    if limiter is None or not source_points:
+        return
+    await limiter.check_sources(source_points)
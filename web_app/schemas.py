@@ -1,8 +1,13 @@
-from pydantic import BaseModel, Field, field_validator, model_validator
+from pydantic import BaseModel, BeforeValidator, Field, field_validator, model_validator
 from datetime import datetime
-from typing import Optional, List
+from typing import Annotated, Literal, Optional, List
 from uuid import UUID
 
+from .models import metric_uuid
+
+# A metric's integer id, shown as its public UUID
+MetricId = Annotated[UUID, BeforeValidator(lambda v: metric_uuid(v) if isinstance(v, int) else v)]
+
 
 class UnitBase(BaseModel):
     """Base schema for units."""
@@ -96,10 +101,19 @@ class Source(SourceBase):
     """Schema for reading a source."""
     id: UUID
     created_at: datetime
+    last_seen_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
+class SourceLiveness(BaseModel):
+    """Schema for whether a source is still sending metrics."""
+    id: UUID
+    name: str
+    is_active: bool
+    last_seen_at: Optional[datetime] = Field(None, description="When metrics from the source were last received")
+    status: Literal["live", "stale", "never"] = Field(..., description="'never' for sources that have sent no metrics")
+
 class MetadataCreate(BaseModel):
     """Schema for creating metadata for a metric."""
     key: str = Field(..., description="Metadata key")
@@ -151,7 +165,7 @@ class MetricCreate(BaseModel):
 
 class Metric(BaseModel):
     """Schema for reading a metric."""
-    id: UUID
+    id: MetricId
     metric_type_id: UUID
     source_id: UUID
     value: float
@@ -163,6 +177,54 @@ class Metric(BaseModel):
     class Config:
         from_attributes = True
 
+class RecentMetric(BaseModel):
+    """Schema for reading a metric from the recent window, without its type and source."""
+    id: Optional[MetricId] = None
+    metric_type_id: UUID
+    source_id: UUID
+    value: float
+    recorded_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class NormalizedMetricType(MetricTypeBase):
+    """Schema for a metric type in a normalized response; its unit is listed separately."""
+    id: UUID
+    created_at: datetime
+
+class NormalizedMetric(BaseModel):
+    """Schema for a metric in a normalized response, referencing its type and source by id."""
+    id: MetricId
+    metric_type_id: UUID
+    source_id: UUID
+    value: float
+    recorded_at: datetime
+    metric_metadata_items: List[Metadata]
+
+class NormalizedMetrics(BaseModel):
+    """Schema for metrics with their units, metric types and sources listed once."""
+    units: List[Unit]
+    metric_types: List[NormalizedMetricType]
+    sources: List[Source]
+    metrics: List[NormalizedMetric]
+
+class MetricStats(BaseModel):
+    """Schema for the summary statistics of one metric type from one source over a time range."""
+    metric_type_id: UUID
+    source_id: UUID
+    count: int
+    min: float
+    max: float
+    mean: float
+    stddev: float = Field(..., description="Population standard deviation")
+    p50: float
+    p90: float
+    p99: float
+    rate: Optional[float] = Field(None, description="Change per second between the first and last points")
+    first_recorded_at: datetime
+    last_recorded_at: datetime
+
 class MetricBulkCreate(BaseModel):
     """Schema for bulk creating metrics."""
     metrics: List[MetricCreate] = Field(..., description="List of metrics to create")
@@ -172,3 +234,102 @@ class MetricBulkCreate(BaseModel):
         if not self.metrics or len(self.metrics) == 0:
             raise ValueError("At least one metric must be provided")
         return self
+
+class MetricIngestResult(BaseModel):
+    """Summary returned by the compact ingest endpoint."""
+    inserted: int = Field(..., description="Number of metric points stored")
+    metric_types: int = Field(..., description="Distinct metric types in the batch")
+    sources: int = Field(..., description="Distinct sources in the batch")
+
+class AlertRuleBase(BaseModel):
+    """Base schema for alert rules."""
+    name: str = Field(..., description="Unique name of the rule")
+    metric_type_id: UUID = Field(..., description="ID of the metric type the rule watches")
+    source_id: Optional[UUID] = Field(None, description="ID of the source it watches; every source when omitted")
+    kind: Literal["threshold", "rate", "absence"] = Field(..., description="What the rule checks")
+    operator: Optional[Literal[">", ">=", "<", "<="]] = Field(None, description="Comparison for threshold and rate rules")
+    threshold: Optional[float] = Field(None, description="Value, or change per second, the operator compares against")
+    window_seconds: Optional[float] = Field(None, gt=0, description="Window of rate and absence rules")
+
+    @field_validator('name')
+    @classmethod
+    def validate_name(cls, v: str) -> str:
+        if not v or len(v.strip()) == 0:
+            raise ValueError("Alert rule name cannot be empty")
+        return v.strip()
+
+    @model_validator(mode='after')
+    def validate_kind(self) -> 'AlertRuleBase':
+        if self.kind in ("threshold", "rate") and (self.operator is None or self.threshold is None):
+            raise ValueError(f"{self.kind} rules need an operator and a threshold")
+        if self.kind in ("rate", "absence") and self.window_seconds is None:
+            raise ValueError(f"{self.kind} rules need window_seconds")
+        return self
+
+class AlertRuleCreate(AlertRuleBase):
+    """Schema for creating a new alert rule."""
+    pass
+
+class AlertRule(AlertRuleBase):
+    """Schema for reading an alert rule."""
+    id: UUID
+    created_at: datetime
+    is_active: bool
+
+    class Config:
+        from_attributes = True
+
+class Alert(BaseModel):
+    """Schema for reading an alert raised by a rule."""
+    id: UUID
+    rule_id: UUID
+    source_id: UUID
+    value: Optional[float] = None
+    fired_at: datetime
+    resolved_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class ApiKeyCreate(BaseModel):
+    """Schema for issuing a new API key."""
+    name: str = Field(..., description="Unique label for the key holder")
+    scopes: List[str] = Field(..., description="Scopes granted to the key (ingest, read, relay-agent, admin)")
+    
+    @field_validator('name')
+    @classmethod
+    def validate_name(cls, v: str) -> str:
+        if not v or len(v.strip()) == 0:
+            raise ValueError("API key name cannot be empty")
+        return v.strip()
+    
+    @field_validator('scopes')
+    @classmethod
+    def validate_scopes(cls, v: List[str]) -> List[str]:
+        from .auth import ALL_SCOPES
+        unknown = set(v) - ALL_SCOPES
+        if unknown:
+            raise ValueError(f"Unknown scopes: {', '.join(sorted(unknown))}")
+        if not v:
+            raise ValueError("At least one scope must be provided")
+        return sorted(set(v))
+
+class ApiKey(BaseModel):
+    """Schema for reading an API key; the key itself is never returned."""
+    id: UUID
+    name: str
+    scopes: List[str]
+    created_at: datetime
+    is_active: bool
+
+    @field_validator('scopes', mode='before')
+    @classmethod
+    def split_scopes(cls, v):
+        return v.split() if isinstance(v, str) else v
+
+    class Config:
+        from_attributes = True
+
+class ApiKeyIssued(ApiKey):
+    """Schema returned once when a key is issued, including the plaintext key."""
+    key: str
@@ -0,0 +1,218 @@
+"""Compact serialization of metrics for the API and the dashboards.
+
+Validating every metric through the ``Metric`` schema with
+``from_attributes`` repeats the work for its metric type, unit and source
+on each row, although a response holds only a few of them. Here each of
+those is serialized once, and rows are plain dictionaries encoded with
+orjson (the optional ``orjson`` package; the standard json module
+otherwise). Two shapes are offered:
+
+- ``normalized``: ``units``, ``metric_types`` and ``sources`` once each, and
+  ``metrics`` rows that reference them by id
+- ``full``: the list of ``Metric`` objects with the type, unit and source
+  nested in every row, as the schema has it; the nested dictionaries are
+  shared between rows, so they are still only built once
+
+The dashboards get ``DashboardData``: metric types and sources listed once,
+and each type's newest points as parallel arrays that
+``static/js/dashboard_data.js`` reads.
+"""
+import json
+from datetime import date
+from typing import Any, Dict, Iterable, List, Literal, Optional, Tuple
+from uuid import UUID
+
+from fastapi.responses import JSONResponse
+
+from .hot_store import NO_ID, HotStore, to_micros
+from .models import metric_uuid
+from .schemas import MetricType as MetricTypeSchema, Source as SourceSchema
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+MetricShape = Literal["normalized", "full"]
+
+
+def encode_default(value: Any) -> Any:
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode content holding UUIDs and datetimes as JSON, formatted as the schemas would."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, default=encode_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """A JSON response rendered by ``dumps`` without validating against a response model."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def metadata_rows(items) -> List[Dict[str, Any]]:
+    return [
+        {"key": item.key, "value": item.value, "id": item.id, "created_at": item.created_at}
+        for item in items
+    ]
+
+
+class DimensionCache:
+    """Metric types, units and sources serialized once per response, by id."""
+
+    def __init__(self):
+        self.units: Dict[UUID, Dict[str, Any]] = {}
+        self.metric_types: Dict[UUID, Dict[str, Any]] = {}
+        self.sources: Dict[UUID, Dict[str, Any]] = {}
+
+    def metric_type(self, metric_type) -> Dict[str, Any]:
+        """The metric type with its unit nested, as in the Metric schema."""
+        row = self.metric_types.get(metric_type.id)
+        if row is None:
+            row = self.metric_types[metric_type.id] = MetricTypeSchema.model_validate(metric_type).model_dump()
+            self.units.setdefault(metric_type.unit.id, row["unit"])
+        return row
+
+    def source(self, source) -> Dict[str, Any]:
+        row = self.sources.get(source.id)
+        if row is None:
+            row = self.sources[source.id] = SourceSchema.model_validate(source).model_dump()
+        return row
+
+
+def normalized_metrics(metrics: Iterable) -> Dict[str, Any]:
+    """Metrics with their units, metric types and sources listed once and referenced by id."""
+    dimensions = DimensionCache()
+    rows = []
+    for metric in metrics:
+        dimensions.metric_type(metric.metric_type)
+        dimensions.source(metric.source)
+        rows.append({
+            "id": metric_uuid(metric.id),
+            "metric_type_id": metric.metric_type_id,
+            "source_id": metric.source_id,
+            "value": metric.value,
+            "recorded_at": metric.recorded_at,
+            "metric_metadata_items": metadata_rows(metric.metric_metadata_items),
+        })
+    return {
+        "units": list(dimensions.units.values()),
+        "metric_types": [
+            {key: value for key, value in metric_type.items() if key != "unit"}
+            for metric_type in dimensions.metric_types.values()
+        ],
+        "sources": list(dimensions.sources.values()),
+        "metrics": rows,
+    }
+
+
+def full_metrics(metrics: Iterable) -> List[Dict[str, Any]]:
+    """Metrics as the Metric schema serializes them, type, unit and source nested in each."""
+    dimensions = DimensionCache()
+    return [
+        {
+            "id": metric_uuid(metric.id),
+            "metric_type_id": metric.metric_type_id,
+            "source_id": metric.source_id,
+            "value": metric.value,
+            "recorded_at": metric.recorded_at,
+            "metric_metadata_items": metadata_rows(metric.metric_metadata_items),
+            "metric_type": dimensions.metric_type(metric.metric_type),
+            "source": dimensions.source(metric.source),
+        }
+        for metric in metrics
+    ]
+
+
+def metrics_response(metrics: Iterable, shape: MetricShape) -> FastJSONResponse:
+    if shape == "full":
+        return FastJSONResponse(full_metrics(metrics))
+    return FastJSONResponse(normalized_metrics(metrics))
+
+
+def metric_type_row(metric_type) -> Dict[str, Any]:
+    """A metric type with its unit, as the dashboards render it."""
+    unit = metric_type.unit
+    return {
+        "id": str(metric_type.id),
+        "name": metric_type.name,
+        "description": metric_type.description,
+        "unit": {
+            "id": str(unit.id),
+            "name": unit.name,
+            "symbol": unit.symbol,
+            "description": unit.description,
+        } if unit else None,
+        "created_at": metric_type.created_at.isoformat() if metric_type.created_at else None,
+        "is_active": metric_type.is_active,
+    }
+
+
+class DashboardData:
+    """The metric types and newest points the dashboards render, without repeating a type or source.
+
+    ``series`` maps a metric type id to parallel arrays of its points, newest
+    first: ``t`` recorded_at in Unix milliseconds, ``v`` values, ``s``
+    indexes into ``sources`` and ``id`` public metric UUIDs (null for points
+    the hot store holds without an id). ``meta`` has the metadata of the points with
+    any, as [key, value] pairs by array index. Types without points have no
+    series.
+    """
+
+    def __init__(self, metric_types: Iterable):
+        self.types = [metric_type_row(metric_type) for metric_type in metric_types]
+        self.sources: List[Dict[str, str]] = []
+        self.source_indexes: Dict[UUID, int] = {}
+        self.series: Dict[str, Dict[str, Any]] = {}
+
+    def source_index(self, source_id: UUID, name: str) -> int:
+        index = self.source_indexes.get(source_id)
+        if index is None:
+            index = self.source_indexes[source_id] = len(self.sources)
+            self.sources.append({"id": str(source_id), "name": name})
+        return index
+
+    def add_series(self, metric_type_id: UUID, ids: List[Optional[str]], times: List[int], values: List[float],
+                   sources: List[Optional[int]], metadata: Dict[int, List[Tuple[str, str]]]):
+        if times:
+            self.series[str(metric_type_id)] = {"t": times, "v": values, "s": sources, "id": ids, "meta": metadata}
+
+    def add_hot_points(self, metric_type_id: UUID, points: List[Tuple[int, float, int, int]], hot_store: HotStore):
+        """Add points as ``HotStore.newest_points`` returns them."""
+        sources: Dict[int, Optional[int]] = {}
+        for source_key in {point[3] for point in points}:
+            source = hot_store.sources.get(source_key)
+            sources[source_key] = self.source_index(*source) if source else None
+        self.add_series(
+            metric_type_id,
+            [None if metric_id == NO_ID else str(metric_uuid(metric_id)) for _, _, metric_id, _ in points],
+            [micros // 1000 for micros, _, _, _ in points],
+            [value for _, value, _, _ in points],
+            [sources[source_key] for _, _, _, source_key in points],
+            {},
+        )
+
+    def add_metrics(self, metric_type_id: UUID, metrics: List):
+        """Add metrics read from the database with their sources and metadata loaded."""
+        self.add_series(
+            metric_type_id,
+            [str(metric_uuid(metric.id)) for metric in metrics],
+            [to_micros(metric.recorded_at) // 1000 for metric in metrics],
+            [metric.value for metric in metrics],
+            [self.source_index(metric.source.id, metric.source.name) if metric.source else None for metric in metrics],
+            {
+                i: [(item.key, item.value) for item in metric.metric_metadata_items]
+                for i, metric in enumerate(metrics) if metric.metric_metadata_items
+            },
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"types": self.types, "sources": self.sources, "series": self.series}
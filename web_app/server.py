@@ -0,0 +1,85 @@
+"""Production launcher.
+
+Runs the app under uvicorn with ``WORKERS`` worker processes, one per CPU
+core by default. It uses uvloop and httptools when they are installed,
+which makes the event loop and HTTP parsing faster than the pure Python
+defaults. The database is prepared once, before any worker starts: tables
+when the schema is not at the migration head, and partitions. Workers then
+skip that step, instead of racing each other on the same DDL.
+
+More than one worker needs ``STATE_BACKEND_URL`` so the workers share the
+relay, hot store, alert and API key state (see ``shared_state``).
+
+Usage:
+    python -m web_app.server
+
+``python -m web_app.main`` still runs a single auto-reloading process for
+development.
+"""
+import asyncio
+import importlib.util
+import logging
+import os
+
+import uvicorn
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+def worker_count() -> int:
+    """WORKERS, or one per CPU core when the workers can share state."""
+    settings = get_settings()
+    if settings.WORKERS > 0:
+        return settings.WORKERS
+    if not settings.STATE_BACKEND_URL:
+        return 1
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+async def prepare_database():
+    """Create missing tables and upcoming partitions once for every worker."""
+    from .archive import get_archive
+    from .database import get_engine, get_write_engine, get_write_session_factory, init_db
+    from .partitions import maintain_partitions
+
+    await init_db()
+    await maintain_partitions(get_write_session_factory(), get_archive())
+    await get_write_engine().dispose()
+    await get_engine().dispose()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    settings = get_settings()
+    workers = worker_count()
+    if workers > 1 and not settings.STATE_BACKEND_URL:
+        raise SystemExit("Running more than one worker requires STATE_BACKEND_URL")
+
+    asyncio.run(prepare_database())
+    # Workers inherit the environment, and with it the prepared database
+    os.environ["PREPARE_DATABASE"] = "false"
+
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    logger.info(f"Starting {workers} workers on {settings.APP_HOST}:{settings.APP_PORT} ({loop}, {http})")
+    uvicorn.run(
+        "web_app.main:app",
+        host=settings.APP_HOST,
+        port=settings.APP_PORT,
+        workers=workers,
+        loop=loop,
+        http=http,
+        backlog=settings.BACKLOG,
+        timeout_keep_alive=settings.TIMEOUT_KEEP_ALIVE,
+        proxy_headers=True,
+        access_log=settings.DEBUG,
+    )
+
+
+if __name__ == "__main__":
+    main()
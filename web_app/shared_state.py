@@ -0,0 +1,363 @@
+"""State shared by the worker processes of one deployment.
+
+A single process keeps the relay, hot store, alert rules and API keys in
+memory. With several workers each keeps its own copy, and the copies are
+kept in step by messages on the backend named by ``STATE_BACKEND_URL``:
+
+- ``sqlite:///path/state.db``: a SQLite file the workers of one host
+  share; messages are read by polling it
+- ``redis://host:6379/0``: a Redis-compatible server, for workers on
+  several hosts; messages use pub/sub (needs the optional ``redis`` package)
+- ``memory://``: an in-process stand-in with the same behaviour, for tests
+
+Every backend offers the same three things:
+
+- ``publish``: an ordered, fire-and-forget broadcast to the other workers;
+  a worker never receives its own messages
+- ``claim``: an atomic first-wins claim, so that exactly one worker does
+  something, such as handing a command to its agent
+- leadership: one worker at a time holds a lease renewed every few seconds
+  and runs the periodic sweeps; ``is_leader()`` is always true without a
+  backend
+
+Without ``STATE_BACKEND_URL`` there is no backend and nothing is published.
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from .config import get_settings
+from .instrumentation import registry
+
+logger = logging.getLogger(__name__)
+
+# Seconds a leader's lease lasts; it is renewed three times as often
+LEADER_LEASE = 15.0
+LEADER_KEY = "leader"
+
+Handler = Callable[[Dict[str, Any]], Any]
+
+
+class StateBackend:
+    """Broadcast messages, claims and a leader lease shared between workers.
+
+    Subclasses move batches of encoded messages and implement the atomic
+    ``acquire`` behind ``claim`` and the leader lease.
+    """
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex[:12]
+        self.handlers: Dict[str, List[Handler]] = defaultdict(list)
+        self.outbox: List[Tuple[str, str]] = []
+        self.outbox_ready = asyncio.Event()
+        self.leader = False
+        self.tasks: List[asyncio.Task] = []
+
+    def subscribe(self, channel: str, handler: Handler):
+        """Call ``handler`` with every message other workers publish on ``channel``; it may be async."""
+        self.handlers[channel].append(handler)
+
+    def publish(self, channel: str, message: Dict[str, Any]):
+        """Queue a message for the other workers; messages are sent in order."""
+        self.outbox.append((channel, json.dumps({"origin": self.worker_id, "data": message}, separators=(",", ":"))))
+        self.outbox_ready.set()
+        state_messages.inc("sent")
+
+    async def claim(self, key: str, ttl: float) -> bool:
+        """Claim ``key`` for ``ttl`` seconds; only the first worker to ask gets True."""
+        return await self.acquire(key, ttl, renew=False)
+
+    async def start(self):
+        self.tasks = [asyncio.create_task(self.send_loop()), asyncio.create_task(self.lease_loop())]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        # Send what is left, such as the last relay changes
+        if self.outbox:
+            batch, self.outbox = self.outbox, []
+            await self.send(batch)
+
+    async def send_loop(self):
+        while True:
+            await self.outbox_ready.wait()
+            self.outbox_ready.clear()
+            batch, self.outbox = self.outbox, []
+            try:
+                await self.send(batch)
+            except Exception:
+                logger.exception("Failed to publish shared state messages")
+                self.outbox[:0] = batch
+                await asyncio.sleep(1)
+                self.outbox_ready.set()
+
+    async def lease_loop(self):
+        while True:
+            try:
+                leader = await self.acquire(LEADER_KEY, LEADER_LEASE, renew=True)
+            except Exception:
+                logger.exception("Failed to renew the leader lease")
+                leader = False
+            if leader != self.leader:
+                logger.info(f"Worker {self.worker_id} {'is now' if leader else 'is no longer'} the leader")
+                self.leader = leader
+            await asyncio.sleep(LEADER_LEASE / 3)
+
+    async def deliver(self, channel: str, payload: str):
+        """Pass a received message to the channel's handlers unless this worker sent it."""
+        envelope = json.loads(payload)
+        if envelope["origin"] == self.worker_id:
+            return
+        state_messages.inc("received")
+        for handler in self.handlers.get(channel, ()):
+            try:
+                result = handler(envelope["data"])
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception:
+                logger.exception(f"Failed to apply a shared state message on {channel}")
+
+    async def send(self, batch: List[Tuple[str, str]]):
+        raise NotImplementedError
+
+    async def acquire(self, key: str, ttl: float, renew: bool) -> bool:
+        """Take ``key`` if it is free or expired, or with ``renew`` also extend it when this worker holds it."""
+        raise NotImplementedError
+
+
+class MemoryHub:
+    """What the in-process backends attached to it share."""
+
+    def __init__(self):
+        self.backends: List["MemoryStateBackend"] = []
+        self.leases: Dict[str, Tuple[str, float]] = {}
+
+
+default_hub = MemoryHub()
+
+
+class MemoryStateBackend(StateBackend):
+    """In-process stand-in: backends attached to the same hub behave like workers."""
+
+    def __init__(self, hub: MemoryHub = default_hub):
+        super().__init__()
+        self.hub = hub
+        hub.backends.append(self)
+
+    async def send(self, batch: List[Tuple[str, str]]):
+        for backend in list(self.hub.backends):
+            for channel, payload in batch:
+                await backend.deliver(channel, payload)
+
+    async def acquire(self, key: str, ttl: float, renew: bool) -> bool:
+        now = time.monotonic()
+        owner, expires = self.hub.leases.get(key, (None, 0.0))
+        if expires > now and not (renew and owner == self.worker_id):
+            return False
+        self.hub.leases[key] = (self.worker_id, now + ttl)
+        return True
+
+    async def stop(self):
+        await super().stop()
+        if self in self.hub.backends:
+            self.hub.backends.remove(self)
+
+
+SQLITE_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS state_messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS state_leases (
+        key TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )""",
+)
+
+
+class SQLiteStateBackend(StateBackend):
+    """Workers on one host sharing a SQLite file.
+
+    Messages are rows of an append-only table that every worker polls for
+    ids past the last one it read; the leader deletes rows older than
+    ``retention`` seconds. Claims are upserts that only take a missing or
+    expired row.
+    """
+
+    def __init__(self, url: str, poll_interval: float = 0.05, retention: float = 60.0):
+        super().__init__()
+        url = make_url(url).set(drivername="sqlite+aiosqlite")
+        self.engine = create_async_engine(url)
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.last_id = 0
+
+        @event.listens_for(self.engine.sync_engine, "connect")
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA busy_timeout=5000")
+            cursor.close()
+
+    async def start(self):
+        async with self.engine.begin() as conn:
+            for statement in SQLITE_SCHEMA:
+                await conn.execute(text(statement))
+            self.last_id = (await conn.execute(text("SELECT coalesce(max(id), 0) FROM state_messages"))).scalar()
+        await super().start()
+        self.tasks.append(asyncio.create_task(self.poll_loop()))
+
+    async def stop(self):
+        await super().stop()
+        await self.engine.dispose()
+
+    async def send(self, batch: List[Tuple[str, str]]):
+        now = time.time()
+        async with self.engine.begin() as conn:
+            await conn.execute(
+                text("INSERT INTO state_messages (channel, payload, created_at) VALUES (:channel, :payload, :now)"),
+                [{"channel": channel, "payload": payload, "now": now} for channel, payload in batch]
+            )
+
+    async def poll_loop(self):
+        pruned_at = time.monotonic()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                async with self.engine.connect() as conn:
+                    rows = (await conn.execute(
+                        text("SELECT id, channel, payload FROM state_messages WHERE id > :last ORDER BY id LIMIT 1000"),
+                        {"last": self.last_id}
+                    )).all()
+                for message_id, channel, payload in rows:
+                    self.last_id = message_id
+                    await self.deliver(channel, payload)
+                if self.leader and time.monotonic() - pruned_at > self.retention:
+                    pruned_at = time.monotonic()
+                    async with self.engine.begin() as conn:
+                        await conn.execute(
+                            text("DELETE FROM state_messages WHERE created_at < :cutoff"),
+                            {"cutoff": time.time() - self.retention}
+                        )
+                        await conn.execute(text("DELETE FROM state_leases WHERE expires_at < :now"), {"now": time.time()})
+            except Exception:
+                logger.exception("Failed to read shared state messages")
+                await asyncio.sleep(1)
+
+    async def acquire(self, key: str, ttl: float, renew: bool) -> bool:
+        now = time.time()
+        condition = "state_leases.expires_at < :now"
+        if renew:
+            condition += " OR state_leases.owner = excluded.owner"
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                text(
+                    "INSERT INTO state_leases (key, owner, expires_at) VALUES (:key, :owner, :expires) "
+                    "ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                    f"WHERE {condition}"
+                ),
+                {"key": key, "owner": self.worker_id, "expires": now + ttl, "now": now}
+            )
+        return result.rowcount == 1
+
+
+# Take a missing or expired key, or with ARGV[3] == "1" extend it if this worker holds it
+REDIS_ACQUIRE = """
+if ARGV[3] == "1" and redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+
+class RedisStateBackend(StateBackend):
+    """Workers on any number of hosts sharing a Redis-compatible server."""
+
+    def __init__(self, url: str, prefix: str = "web_app:"):
+        super().__init__()
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("A redis:// STATE_BACKEND_URL requires the 'redis' package")
+        self.client = redis.from_url(url)
+        self.script = self.client.register_script(REDIS_ACQUIRE)
+        self.prefix = prefix
+
+    async def start(self):
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        await self.pubsub.subscribe(*(self.prefix + channel for channel in self.handlers))
+        await super().start()
+        self.tasks.append(asyncio.create_task(self.receive_loop()))
+
+    async def stop(self):
+        await super().stop()
+        await self.pubsub.close()
+        await self.client.close()
+
+    async def send(self, batch: List[Tuple[str, str]]):
+        async with self.client.pipeline(transaction=False) as pipe:
+            for channel, payload in batch:
+                pipe.publish(self.prefix + channel, payload)
+            await pipe.execute()
+
+    async def receive_loop(self):
+        async for message in self.pubsub.listen():
+            channel = message["channel"].decode()[len(self.prefix):]
+            await self.deliver(channel, message["data"])
+
+    async def acquire(self, key: str, ttl: float, renew: bool) -> bool:
+        acquired = await self.script(
+            keys=[self.prefix + key], args=[self.worker_id, int(ttl * 1000), "1" if renew else "0"]
+        )
+        return bool(acquired)
+
+
+@lru_cache()
+def get_state_backend() -> Optional[StateBackend]:
+    """Create the shared state backend from settings, or None when a single process holds all state."""
+    url = get_settings().STATE_BACKEND_URL
+    if not url:
+        return None
+    scheme = url.split(":", 1)[0].split("+", 1)[0]
+    if scheme == "memory":
+        return MemoryStateBackend()
+    if scheme == "sqlite":
+        return SQLiteStateBackend(url)
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisStateBackend(url)
+    raise RuntimeError(f"Unsupported STATE_BACKEND_URL scheme '{scheme}'")
+
+
+def is_leader() -> bool:
+    """Whether this worker runs the periodic sweeps; always true in a single process."""
+    state = get_state_backend()
+    return state is None or state.leader
+
+
+def publish(channel: str, message: Dict[str, Any]):
+    """Send a message to the other workers, if there are any."""
+    state = get_state_backend()
+    if state is not None:
+        state.publish(channel, message)
+
+
+state_messages = registry.counter("shared_state_messages", "Messages exchanged with other workers.", ("direction",))
+registry.gauge("shared_state_outbox", "Messages waiting to be sent to other workers.", lambda: len(get_state_backend().outbox) if get_state_backend() else 0)
@@ -11,6 +11,13 @@ let sendCommandForm;
 let refreshClientsBtn;
 let refreshCommandsBtn;
 let commandDetailsModal;
+let outputStreamController = null;
+
+// Relay state kept up to date by the event feed
+const clientState = new Map();
+const commandState = new Map();
+let lastEventSeq = null;
+const COMMAND_DISPLAY_LIMIT = 50;
 
 // Initialize when document is ready
 document.addEventListener('DOMContentLoaded', () => {
@@ -23,7 +30,11 @@ document.addEventListener('DOMContentLoaded', () => {
     refreshCommandsBtn = document.getElementById('refreshCommandsBtn');
     
     // Initialize Bootstrap modal
-    commandDetailsModal = new bootstrap.Modal(document.getElementById('commandDetailsModal'));
+    const commandDetailsElement = document.getElementById('commandDetailsModal');
+    commandDetailsModal = new bootstrap.Modal(commandDetailsElement);
+    
+    // Stop tailing command output when the modal is closed
+    commandDetailsElement.addEventListener('hidden.bs.modal', stopOutputStream);
     
     // Add event listeners
     if (sendCommandForm) {
@@ -38,10 +49,6 @@ document.addEventListener('DOMContentLoaded', () => {
         refreshCommandsBtn.addEventListener('click', loadCommands);
     }
     
-    // Initialize data
-    loadClients();
-    loadCommands();
-    
     // Check for API key
     if (!API_KEY) {
         const key = prompt('Please enter your API key:');
@@ -51,11 +58,62 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
     
-    // Set up auto-refresh
-    setInterval(loadClients, 30000); // Refresh clients every 30 seconds
-    setInterval(loadCommands, 60000); // Refresh commands every 60 seconds
+    // Keep clients and commands up to date from the server push feed
+    subscribeRelayEvents();
 });
 
+// Subscribe to the relay event feed, reconnecting with the last sequence number
+async function subscribeRelayEvents() {
+    let retryDelay = 1000;
+    
+    while (true) {
+        const url = lastEventSeq === null ? '/api/events' : `/api/events?since=${lastEventSeq}`;
+        
+        try {
+            await readEventStream(url, (eventName, data, eventId) => {
+                retryDelay = 1000;
+                if (eventId !== null) lastEventSeq = parseInt(eventId, 10);
+                applyRelayEvent(eventName, data);
+            });
+        } catch (error) {
+            console.error('Relay event feed disconnected:', error);
+        }
+        
+        await new Promise(resolve => setTimeout(resolve, retryDelay));
+        retryDelay = Math.min(retryDelay * 2, 30000);
+    }
+}
+
+// Apply a snapshot or delta from the event feed
+function applyRelayEvent(eventName, data) {
+    switch (eventName) {
+        case 'snapshot':
+            clientState.clear();
+            data.clients.forEach(client => clientState.set(client.client_id, client));
+            commandState.clear();
+            data.commands.forEach(command => commandState.set(command.command_id, command));
+            renderClients();
+            renderCommands();
+            break;
+        case 'client':
+            clientState.set(data.client_id, data);
+            renderClients();
+            break;
+        case 'client_removed':
+            clientState.delete(data.client_id);
+            renderClients();
+            break;
+        case 'command':
+            commandState.set(data.command_id, {...commandState.get(data.command_id), ...data});
+            renderCommands();
+            break;
+        case 'command_removed':
+            commandState.delete(data.command_id);
+            renderCommands();
+            break;
+    }
+}
+
 // Load clients
 async function loadClients() {
     if (!clientsContainer || !clientSelect) return;
@@ -82,60 +140,9 @@ async function loadClients() {
         
         const clients = await response.json();
         
-        // Update clients container
-        clientsContainer.innerHTML = '';
-        clientSelect.innerHTML = '<option value="" selected disabled>Choose a client...</option>';
-        
-        if (clients.length === 0) {
-            clientsContainer.innerHTML = '<div class="col-12 text-center py-5"><p>No clients connected</p></div>';
-            return;
-        }
-        
-        clients.forEach(client => {
-            // Create client card
-            const clientCard = document.createElement('div');
-            clientCard.className = 'col-md-4 mb-4';
-            clientCard.innerHTML = `
-                <div class="card client-card h-100">
-                    <div class="card-body">
-                        <div class="d-flex justify-content-between align-items-center mb-3">
-                            <h5 class="card-title mb-0">${client.hostname}</h5>
-                            <span class="badge ${client.status === 'active' ? 'bg-success' : 'bg-danger'}">${client.status}</span>
-                        </div>
-                        <h6 class="card-subtitle mb-2 text-muted">${client.client_type}</h6>
-                        <p class="card-text">
-                            <small>
-                                <strong>ID:</strong> ${client.client_id.substring(0, 8)}...<br>
-                                <strong>IP:</strong> ${client.ip_address || 'Unknown'}<br>
-                                <strong>Last seen:</strong> ${formatTimestamp(client.last_seen)}
-                            </small>
-                        </p>
-                    </div>
-                    <div class="card-footer">
-                        <button class="btn btn-sm btn-primary send-command-btn" data-client-id="${client.client_id}">
-                            Send Command
-                        </button>
-                    </div>
-                </div>
-            `;
-            
-            clientsContainer.appendChild(clientCard);
-            
-            // Add to select dropdown
-            const option = document.createElement('option');
-            option.value = client.client_id;
-            option.textContent = `${client.hostname} (${client.client_type})`;
-            clientSelect.appendChild(option);
-        });
-        
-        // Add event listeners to send command buttons
-        document.querySelectorAll('.send-command-btn').forEach(btn => {
-            btn.addEventListener('click', () => {
-                const clientId = btn.dataset.clientId;
-                clientSelect.value = clientId;
-                document.getElementById('commandInput').focus();
-            });
-        });
+        clientState.clear();
+        clients.forEach(client => clientState.set(client.client_id, client));
+        renderClients();
         
     } catch (error) {
         console.error('Error loading clients:', error);
@@ -150,6 +157,74 @@ async function loadClients() {
     }
 }
 
+// Render clients from the current client state
+function renderClients() {
+    if (!clientsContainer || !clientSelect) return;
+    
+    const clients = Array.from(clientState.values());
+    const selectedClientId = clientSelect.value;
+    
+    // Update clients container
+    clientsContainer.innerHTML = '';
+    clientSelect.innerHTML = '<option value="" selected disabled>Choose a client...</option>';
+    
+    if (clients.length === 0) {
+        clientsContainer.innerHTML = '<div class="col-12 text-center py-5"><p>No clients connected</p></div>';
+        return;
+    }
+    
+    clients.forEach(client => {
+        // Create client card
+        const clientCard = document.createElement('div');
+        clientCard.className = 'col-md-4 mb-4';
+        clientCard.innerHTML = `
+            <div class="card client-card h-100">
+                <div class="card-body">
+                    <div class="d-flex justify-content-between align-items-center mb-3">
+                        <h5 class="card-title mb-0">${client.hostname}</h5>
+                        <span class="badge ${client.status === 'active' ? 'bg-success' : 'bg-danger'}">${client.status}</span>
+                    </div>
+                    <h6 class="card-subtitle mb-2 text-muted">${client.client_type}</h6>
+                    <p class="card-text">
+                        <small>
+                            <strong>ID:</strong> ${client.client_id.substring(0, 8)}...<br>
+                            <strong>IP:</strong> ${client.ip_address || 'Unknown'}<br>
+                            <strong>Last seen:</strong> ${formatTimestamp(client.last_seen)}
+                        </small>
+                    </p>
+                </div>
+                <div class="card-footer">
+                    <button class="btn btn-sm btn-primary send-command-btn" data-client-id="${client.client_id}">
+                        Send Command
+                    </button>
+                </div>
+            </div>
+        `;
+        
+        clientsContainer.appendChild(clientCard);
+        
+        // Add to select dropdown
+        const option = document.createElement('option');
+        option.value = client.client_id;
+        option.textContent = `${client.hostname} (${client.client_type})`;
+        clientSelect.appendChild(option);
+    });
+    
+    // Add event listeners to send command buttons
+    document.querySelectorAll('.send-command-btn').forEach(btn => {
+        btn.addEventListener('click', () => {
+            const clientId = btn.dataset.clientId;
+            clientSelect.value = clientId;
+            document.getElementById('commandInput').focus();
+        });
+    });
+    
+    // Keep the selected client across re-renders
+    if (clientState.has(selectedClientId)) {
+        clientSelect.value = selectedClientId;
+    }
+}
+
 // Load commands
 async function loadCommands() {
     if (!commandsTableBody) return;
@@ -178,46 +253,9 @@ async function loadCommands() {
         
         const commands = await response.json();
         
-        // Update commands table
-        commandsTableBody.innerHTML = '';
-        
-        if (commands.length === 0) {
-            commandsTableBody.innerHTML = '<tr><td colspan="6" class="text-center py-4">No commands found</td></tr>';
-            return;
-        }
-        
-        commands.forEach(command => {
-            const row = document.createElement('tr');
-            row.className = 'command-row';
-            row.dataset.commandId = command.command_id;
-            
-            const statusClass = {
-                'pending': 'badge-pending',
-                'running': 'badge-running',
-                'completed': 'badge-completed',
-                'failed': 'badge-failed',
-                'timeout': 'badge-timeout'
-            }[command.status] || 'bg-secondary';
-            
-            row.innerHTML = `
-                <td>${command.command_id.substring(0, 8)}...</td>
-                <td>${command.client_id.substring(0, 8)}...</td>
-                <td>${command.command.length > 30 ? command.command.substring(0, 30) + '...' : command.command}</td>
-                <td><span class="badge ${statusClass}">${command.status}</span></td>
-                <td>${formatTimestamp(command.created_at)}</td>
-                <td>${formatTimestamp(command.updated_at)}</td>
-            `;
-            
-            commandsTableBody.appendChild(row);
-        });
-        
-        // Add event listeners to command rows
-        document.querySelectorAll('.command-row').forEach(row => {
-            row.addEventListener('click', () => {
-                const commandId = row.dataset.commandId;
-                showCommandDetails(commandId);
-            });
-        });
+        commandState.clear();
+        commands.forEach(command => commandState.set(command.command_id, command));
+        renderCommands();
         
     } catch (error) {
         console.error('Error loading commands:', error);
@@ -234,6 +272,56 @@ async function loadCommands() {
     }
 }
 
+// Render commands from the current command state, newest first
+function renderCommands() {
+    if (!commandsTableBody) return;
+    
+    const commands = Array.from(commandState.values())
+        .sort((a, b) => b.created_at - a.created_at)
+        .slice(0, COMMAND_DISPLAY_LIMIT);
+    
+    // Update commands table
+    commandsTableBody.innerHTML = '';
+    
+    if (commands.length === 0) {
+        commandsTableBody.innerHTML = '<tr><td colspan="6" class="text-center py-4">No commands found</td></tr>';
+        return;
+    }
+    
+    commands.forEach(command => {
+        const row = document.createElement('tr');
+        row.className = 'command-row';
+        row.dataset.commandId = command.command_id;
+        
+        const statusClass = {
+            'pending': 'badge-pending',
+            'running': 'badge-running',
+            'completed': 'badge-completed',
+            'failed': 'badge-failed',
+            'timeout': 'badge-timeout'
+        }[command.status] || 'bg-secondary';
+        
+        row.innerHTML = `
+            <td>${command.command_id.substring(0, 8)}...</td>
+            <td>${command.client_id.substring(0, 8)}...</td>
+            <td>${command.command.length > 30 ? command.command.substring(0, 30) + '...' : command.command}</td>
+            <td><span class="badge ${statusClass}">${command.status}</span></td>
+            <td>${formatTimestamp(command.created_at)}</td>
+            <td>${formatTimestamp(command.updated_at)}</td>
+        `;
+        
+        commandsTableBody.appendChild(row);
+    });
+    
+    // Add event listeners to command rows
+    document.querySelectorAll('.command-row').forEach(row => {
+        row.addEventListener('click', () => {
+            const commandId = row.dataset.commandId;
+            showCommandDetails(commandId);
+        });
+    });
+}
+
 // Show command details
 async function showCommandDetails(commandId) {
     try {
@@ -266,12 +354,101 @@ async function showCommandDetails(commandId) {
         // Show modal
         commandDetailsModal.show();
         
+        // Tail output of commands that have not finished yet
+        if (command.status === 'pending' || command.status === 'running') {
+            tailCommandOutput(command.command_id);
+        }
+        
     } catch (error) {
         console.error('Error loading command details:', error);
         alert(`Error loading command details: ${error.message}`);
     }
 }
 
+// Read a Server-Sent Events stream with fetch so the API key header can be sent
+async function readEventStream(url, onEvent, signal) {
+    const response = await fetch(url, {
+        headers: {
+            'X-API-Key': API_KEY,
+            'Accept': 'text/event-stream'
+        },
+        signal: signal
+    });
+    
+    if (!response.ok) {
+        throw new Error(`Error ${response.status}: ${response.statusText}`);
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        
+        // Events are separated by a blank line
+        let separator;
+        while ((separator = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.substring(0, separator);
+            buffer = buffer.substring(separator + 2);
+            
+            let eventName = 'message';
+            let eventId = null;
+            const dataLines = [];
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) eventName = line.substring(7);
+                else if (line.startsWith('id: ')) eventId = line.substring(4);
+                else if (line.startsWith('data: ')) dataLines.push(line.substring(6));
+            });
+            
+            if (dataLines.length > 0) {
+                onEvent(eventName, JSON.parse(dataLines.join('\n')), eventId);
+            }
+        }
+    }
+}
+
+// Stop tailing command output
+function stopOutputStream() {
+    if (outputStreamController) {
+        outputStreamController.abort();
+        outputStreamController = null;
+    }
+}
+
+// Tail the output of a running command into the details modal
+async function tailCommandOutput(commandId) {
+    stopOutputStream();
+    outputStreamController = new AbortController();
+    
+    const outputElements = {
+        stdout: document.getElementById('modalStdout'),
+        stderr: document.getElementById('modalStderr')
+    };
+    outputElements.stdout.textContent = '';
+    outputElements.stderr.textContent = '';
+    
+    try {
+        await readEventStream(`/api/commands/${commandId}/output/stream`, (eventName, data) => {
+            if (eventName === 'output') {
+                const element = outputElements[data.stream];
+                element.textContent += data.data;
+                element.parentElement.scrollTop = element.parentElement.scrollHeight;
+            } else if (eventName === 'status') {
+                document.getElementById('modalStatus').textContent = data.status;
+                document.getElementById('modalExitCode').textContent = data.exit_code !== null ? data.exit_code : 'N/A';
+            }
+        }, outputStreamController.signal);
+    } catch (error) {
+        if (error.name !== 'AbortError') {
+            console.error('Error tailing command output:', error);
+        }
+    }
+}
+
 // Handle send command form submission
 function handleSendCommand(event) {
     event.preventDefault();
@@ -321,9 +498,6 @@ async function sendCommand(clientId, command, params) {
         document.getElementById('commandInput').value = '';
         document.getElementById('paramsInput').value = '';
         
-        // Reload commands
-        loadCommands();
-        
     } catch (error) {
         console.error('Error sending command:', error);
         alert(`Error sending command: ${error.message}`);
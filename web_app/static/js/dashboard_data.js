@@ -0,0 +1,41 @@
+// Dashboard data helpers
+//
+// The dashboards receive metric types and sources once, and each type's
+// newest points as parallel arrays (see web_app/serialization.py):
+//   series.t     recorded_at in Unix milliseconds, newest first
+//   series.v     values
+//   series.s     indexes into dashboard.sources, or null
+//   series.id    metric UUIDs, or null
+//   series.meta  [key, value] pairs of the points with metadata, by index
+
+// The series of a metric type, or null when it has no points
+function dashboardSeries(dashboard, metricTypeId) {
+    return dashboard.series[metricTypeId] || null;
+}
+
+// The source ({id, name}) of the point at index i, or null
+function pointSource(dashboard, series, i) {
+    const index = series.s[i];
+    return index === null ? null : dashboard.sources[index];
+}
+
+// The metadata of the point at index i as an object
+function pointMetadata(series, i) {
+    const pairs = series.meta[i];
+    return pairs ? Object.fromEntries(pairs) : {};
+}
+
+// The points of a metric type as objects, newest first
+function dashboardPoints(dashboard, metricTypeId) {
+    const series = dashboardSeries(dashboard, metricTypeId);
+    if (!series) {
+        return [];
+    }
+    return series.t.map((time, i) => ({
+        id: series.id[i],
+        time: time,
+        value: series.v[i],
+        source: pointSource(dashboard, series, i),
+        metadata: pointMetadata(series, i)
+    }));
+}
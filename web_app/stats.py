@@ -0,0 +1,152 @@
+"""Summary statistics of metric series over a time range.
+
+Rows are fetched as bare columns (series keys, recorded_at as Unix
+microseconds and value) in batches straight into NumPy arrays, together
+with the archived rows of the range when an archive is configured, and
+every statistic is computed with vectorized NumPy over each series'
+slice. No ORM objects or datetimes are built per row.
+"""
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy import BigInteger, Integer, String, cast, extract, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .archive import MetricArchive
+from .partitions import is_sqlite_session, metric_entity
+
+# Rows converted to NumPy at a time while streaming from the database
+FETCH_BATCH_SIZE = 50_000
+
+PERCENTILES = (50, 90, 99)
+
+EPOCH = datetime(1970, 1, 1)
+
+
+@dataclass
+class SeriesStats:
+    metric_type_key: int
+    source_key: int
+    count: int
+    min: float
+    max: float
+    mean: float
+    stddev: float
+    p50: float
+    p90: float
+    p99: float
+    rate: Optional[float]
+    first_recorded_at: datetime
+    last_recorded_at: datetime
+
+
+def epoch_micros(db: AsyncSession, column):
+    """SQL expression for a naive UTC timestamp column as Unix microseconds."""
+    if is_sqlite_session(db):
+        # Stored as 'YYYY-MM-DD HH:MM:SS[.ffffff]'
+        return (
+            cast(func.strftime("%s", column), Integer) * 1_000_000
+            + cast(func.substr(cast(column, String) + ".000000", 21, 6), Integer)
+        )
+    return cast(extract("epoch", column) * 1_000_000, BigInteger)
+
+
+async def fetch_columns(
+    db: AsyncSession,
+    start: datetime,
+    end: datetime,
+    metric_type_key: Optional[int] = None,
+    source_key: Optional[int] = None
+) -> np.ndarray:
+    """Rows recorded in [start, end) as an (n, 4) array of type key, source key, Unix microseconds and value."""
+    entity = await metric_entity(db, start, end)
+    query = select(
+        entity.metric_type_key, entity.source_key, epoch_micros(db, entity.recorded_at), entity.value
+    ).where(entity.recorded_at >= start, entity.recorded_at < end)
+    if metric_type_key is not None:
+        query = query.where(entity.metric_type_key == metric_type_key)
+    if source_key is not None:
+        query = query.where(entity.source_key == source_key)
+
+    result = await db.stream(query.execution_options(yield_per=FETCH_BATCH_SIZE))
+    # NumPy reads plain tuples far faster than Row objects
+    batches = [np.array(list(map(tuple, rows)), dtype=np.float64) async for rows in result.partitions()]
+    return np.concatenate(batches) if batches else np.empty((0, 4))
+
+
+def archived_columns(
+    archive: MetricArchive,
+    start: datetime,
+    end: datetime,
+    metric_type_key: Optional[int] = None,
+    source_key: Optional[int] = None
+) -> np.ndarray:
+    """Archived rows recorded in [start, end), in the layout of fetch_columns."""
+    table = archive.scan(start, end, metric_type_key, source_key)
+    if table.num_rows == 0:
+        return np.empty((0, 4))
+    return np.column_stack([
+        table["metric_type_key"].to_numpy(),
+        table["source_key"].to_numpy(),
+        table["recorded_at"].to_numpy().astype("datetime64[us]").astype(np.int64),
+        table["value"].to_numpy(),
+    ]).astype(np.float64)
+
+
+def summarize(rows: np.ndarray) -> List[SeriesStats]:
+    """Statistics of each series in the rows, ordered by type and source key."""
+    if len(rows) == 0:
+        return []
+    types, sources, micros, values = rows.T
+    # Group the rows by series, keeping their order within each
+    keys = (types.astype(np.int64) << 32) | sources.astype(np.int64)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    bounds = np.append(starts, len(keys))
+    series = [(int(key) >> 32, int(key) & 0xFFFFFFFF) for key in keys[starts]]
+
+    stats = []
+    for i, (metric_type_key, source_key) in enumerate(series):
+        rows_of = order[bounds[i]:bounds[i + 1]]
+        series_values = values[rows_of]
+        series_micros = micros[rows_of]
+        first, last = series_micros.argmin(), series_micros.argmax()
+        elapsed = (series_micros[last] - series_micros[first]) / 1e6
+        p50, p90, p99 = np.percentile(series_values, PERCENTILES)
+        stats.append(SeriesStats(
+            metric_type_key=metric_type_key,
+            source_key=source_key,
+            count=len(series_values),
+            min=float(series_values.min()),
+            max=float(series_values.max()),
+            mean=float(series_values.mean()),
+            stddev=float(series_values.std()),
+            p50=float(p50),
+            p90=float(p90),
+            p99=float(p99),
+            # Change per second between the first and last points
+            rate=float((series_values[last] - series_values[first]) / elapsed) if elapsed > 0 else None,
+            first_recorded_at=EPOCH + timedelta(microseconds=int(series_micros[first])),
+            last_recorded_at=EPOCH + timedelta(microseconds=int(series_micros[last])),
+        ))
+    return stats
+
+
+async def series_stats(
+    db: AsyncSession,
+    start: datetime,
+    end: datetime,
+    metric_type_key: Optional[int] = None,
+    source_key: Optional[int] = None,
+    archive: Optional[MetricArchive] = None
+) -> List[SeriesStats]:
+    """Statistics of every series with points recorded in [start, end)."""
+    rows = await fetch_columns(db, start, end, metric_type_key, source_key)
+    if archive is not None:
+        archived = await asyncio.to_thread(archived_columns, archive, start, end, metric_type_key, source_key)
+        rows = np.concatenate([archived, rows])
+    return await asyncio.to_thread(summarize, rows)
@@ -0,0 +1,107 @@
+import asyncio
+import json
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, List, Optional, Set, Tuple
+
+from fastapi import Request
+
+# Headers that stop proxies from buffering an event stream
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+# Comment line sent periodically so idle connections are not dropped
+SSE_KEEPALIVE = ": keepalive\n\n"
+
+
+def format_sse(data: Any, event: Optional[str] = None, event_id: Optional[str] = None) -> str:
+    """Format a single Server-Sent Events message.
+
+    Non-string data is JSON encoded; the payload is always sent on one line.
+    """
+    payload = data if isinstance(data, str) else json.dumps(data, separators=(",", ":"))
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in payload.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+class EventFeed:
+    """Sequence-numbered event feed with a bounded replay history.
+
+    New subscribers receive a snapshot followed by deltas. A subscriber that
+    reconnects with a sequence number still covered by the history is sent
+    only the events it missed instead of a new snapshot.
+    """
+
+    def __init__(self, history_size: int = 1000, queue_size: int = 1000):
+        self.seq = 0
+        self.history: Deque[Tuple[int, str, Any]] = deque(maxlen=history_size)
+        self.queue_size = queue_size
+        self.subscribers: Set[asyncio.Queue] = set()
+
+    def publish(self, event: str, data: Any) -> int:
+        """Record an event and fan it out to every subscriber."""
+        self.seq += 1
+        item = (self.seq, event, data)
+        self.history.append(item)
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(item)
+            except asyncio.QueueFull:
+                # Slow consumer: drop its backlog and make it resync from a snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+        return self.seq
+
+    def events_since(self, seq: int) -> Optional[List[Tuple[int, str, Any]]]:
+        """Return the events after seq, or None if they are no longer in the history."""
+        if seq > self.seq:
+            return None
+        if seq == self.seq:
+            return []
+        if not self.history or self.history[0][0] > seq + 1:
+            return None
+        return [item for item in self.history if item[0] > seq]
+
+    async def stream(
+        self,
+        request: Request,
+        snapshot: Callable[[], Any],
+        since: Optional[int] = None,
+        keepalive: float = 15,
+    ) -> AsyncIterator[str]:
+        """Yield SSE messages for one subscriber until it disconnects."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        try:
+            # Nothing awaits between subscribing and reading the state, so no
+            # event can fall between the snapshot and the first delta
+            missed = self.events_since(since) if since is not None else None
+            if missed is None:
+                yield format_sse(snapshot(), event="snapshot", event_id=str(self.seq))
+            else:
+                for seq, event, data in missed:
+                    yield format_sse(data, event=event, event_id=str(seq))
+
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield SSE_KEEPALIVE
+                    continue
+
+                if item is None:
+                    yield format_sse(snapshot(), event="snapshot", event_id=str(self.seq))
+                else:
+                    seq, event, data = item
+                    yield format_sse(data, event=event, event_id=str(seq))
+        finally:
+            self.subscribers.discard(queue)